@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Check which chat questions are answered locally and which go to the model.
+
+Questions about the loaded receipt's own fields should be answered from
+the extracted data without a model request. Questions scoped to other
+receipts (another merchant, event, date range or amount, or "across all
+events") must reach retrieval and the model, or they get this receipt's
+answer back. A stand-in model records every question it receives. Prints
+where each question was answered and exits with status 1 if any went to
+the wrong place.
+
+    python benchmarks/bench_chat_scope.py
+"""
+
+import os
+import sys
+import tempfile
+import contextlib
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+LOCAL_QUESTIONS = [
+    "What was the most expensive item?",
+    "What's the cheapest item on this receipt?",
+    "What was the total?",
+    "How much tax was paid?",
+    "List all items",
+]
+MODEL_QUESTIONS = [
+    "What was the most expensive item across all events?",
+    "What was the most expensive item at Uber in 2024?",
+    "What was the most expensive item this quarter?",
+    "What was the most expensive item at Staples over $75?",
+    "Is the most expensive item a personal expense?",
+    "What was the most expensive item at Uber?",
+    "What was the most expensive item for the Sales Trip?",
+    "What was the cheapest item since 2025-01-01?",
+    "What was the total at Staples?",
+]
+
+
+class RecordingBackend:
+    """Stand-in model that answers every question with a fixed sentence and records the prompts."""
+
+    name = 'bench-recorder'
+
+    def __init__(self):
+        self.prompts = []
+
+    def generate_stream(self, contents, system_instruction: str = None):
+        from models.model_backend import ModelResponse
+        self.prompts.append(contents)
+        yield ModelResponse("Answered by the model.", len(contents) // 4, 5)
+
+
+def make_receipt(merchant: str, date: str, event_name: str, items: list[tuple[str, str]], path: str):
+    from models.receipt_types import Receipt
+    receipt = Receipt.from_dict({
+        'merchant': merchant, 'date': date, 'location': "Austin, TX",
+        'receipt_total': f"{sum(float(amount) for _, amount in items):.2f}",
+        'line_items': [{'item': item, 'amount': amount, 'category': "Office Supplies"} for item, amount in items],
+    })
+    receipt.event_name = event_name
+    receipt.file_path = receipt.file_name = path
+    receipt.content_hash = path
+    receipt.processed_date = f"{date} 12:00:00"
+    return receipt
+
+
+def main():
+    sys.path.insert(0, PROJECT_ROOT)
+    from models.rag_model import ReceiptRAG
+    from models.receipt_store import ReceiptStore
+    from models.receipt_retriever import ReceiptRetriever
+
+    current = make_receipt("Home Depot", "2025-04-12", "Offsite",
+                           [("Cordless drill", "129.00"), ("Drill bits", "23.40")], "home_depot.png")
+    history = [
+        current,
+        make_receipt("Uber", "2024-09-03", "Sales Trip", [("Airport ride", "64.20"), ("Tip", "12.00")], "uber.png"),
+        make_receipt("Staples", "2025-02-20", "Offsite", [("Printer", "189.99"), ("Paper", "42.50")], "staples.png"),
+    ]
+    with tempfile.TemporaryDirectory(prefix='receipt_chat_scope_') as base_dir:
+        store = ReceiptStore(os.path.join(base_dir, 'receipts.db'))
+        store.add_receipts(history)
+        backend = RecordingBackend()
+        rag = ReceiptRAG(retriever=ReceiptRetriever(store), backend=backend)
+
+        wrong = 0
+        print(f"{'expected':<9}{'answered':<10}question")
+        for expected, questions in (("local", LOCAL_QUESTIONS), ("model", MODEL_QUESTIONS)):
+            for question in questions:
+                requests = len(backend.prompts)
+                with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                    rag.ask_question(question, current)
+                answered = "model" if len(backend.prompts) > requests else "local"
+                wrong += answered != expected
+                print(f"{expected:<9}{answered:<10}{question}{'' if answered == expected else '  <- WRONG'}")
+        store.close()
+
+    print(f"\n{wrong} of {len(LOCAL_QUESTIONS) + len(MODEL_QUESTIONS)} questions answered in the wrong place")
+    sys.exit(1 if wrong else 0)
+
+
+if __name__ == '__main__':
+    main()
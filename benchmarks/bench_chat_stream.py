@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Benchmark time to first token and total latency of the chat endpoint,
+streamed over Server-Sent Events versus a single JSON response.
+
+Requests go through the Flask app to the simulated model backend, whose
+streamed answers start after a quarter of their latency. Every question
+is distinct so the answer cache never serves them.
+
+    python benchmarks/bench_chat_stream.py --questions 20 --latency-ms 1500
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import contextlib
+import statistics
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def timed_request(client, question: str, stream: bool) -> tuple[float, float]:
+    """Return seconds until the first answer bytes arrive and until the response is complete."""
+    start = time.perf_counter()
+    response = client.post('/ask_question', json={'question': question, 'stream': stream}, buffered=False)
+    first = None
+    for chunk in response.response:
+        if first is None and (b'"chunk"' in chunk or b'"answer"' in chunk):
+            first = time.perf_counter() - start
+    total = time.perf_counter() - start
+    response.close()
+    return first or total, total
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark streamed versus buffered chat answers.')
+    parser.add_argument('--questions', type=int, default=20, help='Questions per mode.')
+    parser.add_argument('--latency-ms', type=float, default=1500, help='Median simulated model latency.')
+    args = parser.parse_args()
+
+    base_dir = tempfile.mkdtemp(prefix='receipt_chat_bench_')
+    os.environ.update({
+        'RECEIPT_MODEL_BACKEND': 'simulated',
+        'RECEIPT_SIM_LATENCY_MS': str(args.latency_ms),
+        'RECEIPT_SIM_SEED': '1',
+        'RECEIPT_DB_PATH': os.path.join(base_dir, 'receipts.db'),
+        'RECEIPT_RATE_LIMIT_DB': os.path.join(base_dir, 'ratelimit.db'),
+        'RECEIPT_CONTEXT_DB': os.path.join(base_dir, 'sessions.db'),
+    })
+    sys.path.insert(0, PROJECT_ROOT)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        import web.app as app_module
+    from models.receipt_types import Receipt
+
+    receipt = Receipt.from_dict({
+        'merchant': "Home Depot", 'date': "2025-03-14", 'receipt_total': "152.40",
+        'line_items': [{'item': "Cordless drill", 'amount': "129.00", 'category': "Tools & Equipment"},
+                       {'item': "Drill bits", 'amount': "23.40", 'category': "Tools & Equipment"}],
+    })
+    receipt.file_path = receipt.file_name = "bench.png"
+    receipt.processed_date = "2025-03-14 10:00:00"
+
+    client = app_module.app.test_client()
+    with client.session_transaction() as session:
+        session['session_id'] = 'bench'
+        session['has_receipt'] = True
+    app_module.controller.load_receipt_for_questions('bench', receipt)
+
+    print(f"Simulated model: median {args.latency_ms:.0f} ms, {args.questions} questions per mode\n")
+    print(f"{'mode':<10}{'TTFT p50 ms':>14}{'TTFT p95 ms':>14}{'total p50 ms':>15}")
+    for label, stream in (("buffered", False), ("streamed", True)):
+        firsts, totals = [], []
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            for i in range(args.questions):
+                first, total = timed_request(client, f"Was this purchase justified for project {label} {i}?", stream)
+                firsts.append(first)
+                totals.append(total)
+        firsts.sort()
+        print(f"{label:<10}{statistics.median(firsts) * 1000:>14.0f}"
+              f"{firsts[int(0.95 * (len(firsts) - 1))] * 1000:>14.0f}{statistics.median(totals) * 1000:>15.0f}")
+
+
+if __name__ == '__main__':
+    main()
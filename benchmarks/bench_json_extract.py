@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Benchmark JSON extraction from model responses.
+
+Compares extract_json_object against the original regex extraction in
+parse_receipt_json on a large well-formed response and on pathological
+inputs that make the greedy pattern backtrack.
+
+    python benchmarks/bench_json_extract.py --line-items 2000
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from models.json_extractor import extract_json_object, JSONExtractionError
+
+
+def legacy_extract(text: str):
+    """The original regex extraction from parse_receipt_json, kept as a baseline."""
+    match = re.search(r"```json\s*(\{.*?\})\s*```", text, re.DOTALL)
+    if match:
+        json_str = match.group(1)
+    else:
+        match = re.search(r"(\{.*\})", text, re.DOTALL)
+        if not match:
+            return None
+        json_str = match.group(1)
+    try:
+        return json.loads(json_str)
+    except json.JSONDecodeError:
+        return None
+
+
+def current_extract(text: str):
+    try:
+        return extract_json_object(text)[0]
+    except JSONExtractionError:
+        return None
+
+
+def make_response(line_items: int) -> str:
+    """A fenced, well-formed response with ``line_items`` items."""
+    receipt = {
+        'merchant': 'Benchmark Hardware', 'date': '2024-05-01', 'location': 'Springfield',
+        'line_items': [
+            {'item': f"Item {i}", 'amount': f"{i % 500 + 0.99:.2f}", 'category': 'Tools & Equipment',
+             'justification': 'Synthetic benchmark item', 'needs_approval': False, 'approval_reason': ''}
+            for i in range(line_items)
+        ],
+        'subtotal': '0.00', 'tax': '0.00', 'receipt_total': '0.00', 'flags': [], 'completeness_score': 'A',
+    }
+    return "Here is the extracted receipt:\n```json\n" + json.dumps(receipt, indent=2) + "\n```\n"
+
+
+def make_cases(line_items: int, size: int) -> dict[str, str]:
+    large = make_response(line_items)
+    return {
+        'large': large,
+        'truncated': large[:len(large) * 2 // 3],
+        'unclosed braces': '{"a": ' * (size // 6),
+        'unclosed fences': '```json\n{' * (size // 9),
+    }
+
+
+def best_of(runs: int, func, *args):
+    """Return the fastest wall-clock time and the last result of ``func``."""
+    best = float('inf')
+    result = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark JSON extraction from model responses.')
+    parser.add_argument('--line-items', type=int, default=2000, help='Line items in the large response.')
+    parser.add_argument('--size', type=int, default=20_000, help='Approximate length of pathological inputs.')
+    parser.add_argument('--runs', type=int, default=3, help='Repetitions per implementation (best is reported).')
+    args = parser.parse_args()
+
+    print(f"{'case':<18}{'chars':>10}{'legacy s':>12}{'current s':>12}{'speedup':>10}  parsed (legacy/current)")
+    for name, text in make_cases(args.line_items, args.size).items():
+        legacy_time, legacy_result = best_of(args.runs, legacy_extract, text)
+        current_time, current_result = best_of(args.runs, current_extract, text)
+        print(f"{name:<18}{len(text):>10,}{legacy_time:>12.4f}{current_time:>12.4f}"
+              f"{legacy_time / current_time:>9.1f}x  {legacy_result is not None}/{current_result is not None}")
+
+
+if __name__ == '__main__':
+    main()
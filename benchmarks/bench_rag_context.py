@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Benchmark chat prompt size and build time for receipts of increasing length.
+
+Compares the compact, budgeted ReceiptContextEncoder against the original
+verbose per-item context and instruction preamble that ReceiptRAG sent with
+every question.
+
+    python benchmarks/bench_rag_context.py --items 5 50 200
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from models.receipt_types import Receipt
+from models.receipt_context import ReceiptContextEncoder, estimate_tokens
+
+CATEGORIES = ["Food & Beverage", "Tools & Equipment", "Office Supplies", "Travel & Lodging", "Raw Materials"]
+QUESTION = "Which of these purchases would you question for the offsite?"
+
+
+def make_receipt(items: int, seed: int = 3) -> Receipt:
+    """Build a synthetic receipt with ``items`` line items."""
+    rng = random.Random(seed)
+    line_items = []
+    for i in range(items):
+        needs_approval = rng.random() < 0.1
+        line_items.append({
+            'item': f"{rng.choice(['Large', 'Cordless', 'Premium', 'Bulk'])} item {i} "
+                    f"{rng.choice(['kit', 'pack of 12', 'subscription', 'set'])}",
+            'amount': f"{rng.randint(100, 30000) / 100:.2f}",
+            'category': rng.choice(CATEGORIES),
+            'justification': "Needed by the team for setting up and running the offsite workshop sessions",
+            'needs_approval': needs_approval,
+            'approval_reason': "Exceeds the single-item spending limit" if needs_approval else "",
+        })
+    receipt = Receipt.from_dict({
+        'merchant': "Home Depot", 'date': "2025-04-12", 'location': "Austin, TX",
+        'receipt_total': "1234.56", 'subtotal': "1140.00", 'tax': "94.56",
+        'line_items': line_items, 'flags': ["Tax does not match subtotal"], 'completeness_score': 'B',
+    })
+    receipt.file_path = f"/bench/receipt_{items}.png"
+    receipt.processed_date = "2025-04-13 09:00:00"
+    return receipt
+
+
+def legacy_prompt(receipt: Receipt, question: str) -> str:
+    """The original ReceiptRAG context and preamble, kept as a baseline."""
+    context = f"""
+RECEIPT INFORMATION:
+- Merchant: {receipt.merchant}
+- Date: {receipt.date}
+- Location: {receipt.location}
+- Total Amount: ${receipt.receipt_total}
+- Subtotal: ${receipt.subtotal}
+- Tax: ${receipt.tax}
+
+ITEMS PURCHASED:
+"""
+    for i, item in enumerate(receipt.line_items, 1):
+        context += f"""
+{i}. {item.item}
+   - Amount: ${item.amount}
+   - Category: {item.category}
+   - Justification: {item.justification or 'N/A'}
+   - Needs Approval: {item.needs_approval}
+"""
+    if receipt.flags:
+        context += "\nFLAGS/ISSUES:\n"
+        for flag in receipt.flags:
+            context += f"- {flag}\n"
+    context += f"\nQuality Score: {receipt.completeness_score}"
+    context += f"\nProcessed: {receipt.processed_date or 'N/A'}"
+
+    return f"""You are a helpful assistant that answers questions about business receipts.
+You have access to the following receipt data:
+
+{context}
+
+User Question: {question}
+
+Instructions:
+- Answer the question based ONLY on the provided receipt data
+- Be specific and reference actual values from the receipt
+- If the information is not available in the receipt, say so clearly
+- Keep responses concise but informative
+- For monetary amounts, always include the currency symbol
+
+Answer:"""
+
+
+def best_of(runs: int, func, *args):
+    best = float('inf')
+    for _ in range(runs):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark chat prompt size and build time.')
+    parser.add_argument('--items', type=int, nargs='+', default=[5, 50, 200], help='Line item counts to try.')
+    parser.add_argument('--budget', type=int, default=2000, help='Receipt token budget for the compact encoding.')
+    parser.add_argument('--runs', type=int, default=50, help='Repetitions per measurement.')
+    args = parser.parse_args()
+
+    print(f"{'items':>6}{'legacy tok':>12}{'compact tok':>13}{'saved':>8}{'legacy us':>11}{'cached us':>11}")
+    for count in args.items:
+        receipt = make_receipt(count)
+        encoder = ReceiptContextEncoder(token_budget=args.budget)
+        legacy_tokens = estimate_tokens(legacy_prompt(receipt, QUESTION))
+        context, _ = encoder.encode(receipt)
+        compact_tokens = estimate_tokens(f"{context}\n\nQUESTION: {QUESTION}")
+
+        def compact_prompt():
+            return f"{encoder.encode(receipt)[0]}\n\nQUESTION: {QUESTION}"
+
+        legacy_time = best_of(args.runs, legacy_prompt, receipt, QUESTION)
+        compact_time = best_of(args.runs, compact_prompt)
+        print(f"{count:>6}{legacy_tokens:>12,}{compact_tokens:>13,}{1 - compact_tokens / legacy_tokens:>8.0%}"
+              f"{legacy_time * 1e6:>11.1f}{compact_time * 1e6:>11.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Benchmark request scheduling against a simulated model with a request quota.
+
+Several "processes" (each with its own scheduler, bucket connection and
+thread pool) send requests to one simulated model that returns 429 once
+its per-minute quota is exceeded. The legacy row sends requests directly,
+as before the scheduler, so every 429 drops a receipt. The scheduled rows
+share one token bucket file, with and without the quota configured.
+
+    python benchmarks/bench_rate_limit.py --requests 400 --rpm 1200 --processes 2
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from models.model_backend import SimulatedBackend, ModelError
+from models.request_scheduler import RequestScheduler, SharedTokenBucket, AdaptiveConcurrency
+
+
+class CountingBackend:
+    """Counts the requests and 429s a backend sees."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.name = backend.name
+        self.sent = 0
+        self.throttled = 0
+
+    def generate(self, contents, system_instruction: str = None):
+        self.sent += 1
+        try:
+            return self.backend.generate(contents, system_instruction)
+        except ModelError as e:
+            if '429' in str(e):
+                self.throttled += 1
+            raise
+
+
+def run(label: str, args, make_client):
+    server = CountingBackend(SimulatedBackend(latency_ms=args.latency_ms, requests_per_minute=args.rpm, seed=3))
+    clients = [make_client(server, i) for i in range(args.processes)]
+    per_client = args.requests // args.processes
+
+    def send(client) -> bool:
+        try:
+            client.generate("QUESTION: total?")
+            return True
+        except ModelError:
+            return False
+
+    start = time.perf_counter()
+    pools = [ThreadPoolExecutor(max_workers=args.threads) for _ in clients]
+    futures = [pool.submit(send, client) for pool, client in zip(pools, clients) for _ in range(per_client)]
+    done = sum(future.result() for future in futures)
+    elapsed = time.perf_counter() - start
+    for pool in pools:
+        pool.shutdown()
+
+    total = per_client * len(clients)
+    ceiling = args.rpm / 60
+    print(f"{label:<28}{done:>7}{total - done:>9}{server.sent:>7}{server.throttled:>7}"
+          f"{elapsed:>9.2f}{done / elapsed:>10.1f}{done / elapsed / ceiling:>10.0%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark rate limiting and retries against a request quota.')
+    parser.add_argument('--requests', type=int, default=400, help='Requests across all processes.')
+    parser.add_argument('--rpm', type=float, default=1200, help='Simulated model quota in requests per minute.')
+    parser.add_argument('--processes', type=int, default=2, help='Schedulers sharing one bucket file.')
+    parser.add_argument('--threads', type=int, default=16, help='Worker threads per process.')
+    parser.add_argument('--latency-ms', type=float, default=100, help='Median simulated model latency.')
+    args = parser.parse_args()
+
+    db_dir = tempfile.mkdtemp(prefix='receipt_ratelimit_')
+
+    def scheduled(rpm):
+        def make_client(server, index):
+            # Each run gets its own bucket row; every "process" opens its own connection to it.
+            bucket = SharedTokenBucket(f"bench-{rpm}-{id(server)}", requests_per_minute=rpm,
+                                       db_path=os.path.join(db_dir, 'ratelimit.db'))
+            return RequestScheduler(server, bucket=bucket, concurrency=AdaptiveConcurrency(args.threads),
+                                    deadline=120, base_delay=0.25)
+        return make_client
+
+    print(f"Quota {args.rpm:.0f} requests/min ({args.rpm / 60:.1f}/s), {args.processes} processes x "
+          f"{args.threads} threads, median latency {args.latency_ms:.0f} ms\n")
+    print(f"{'client':<28}{'done':>7}{'dropped':>9}{'sent':>7}{'429s':>7}{'seconds':>9}{'per s':>10}{'of quota':>10}")
+    run("direct (legacy)", args, lambda server, index: server)
+    run("scheduler, AIMD only", args, scheduled(0))
+    run("scheduler, shared bucket", args, scheduled(args.rpm))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Measure the memory held by a batch of receipts as nested dicts versus typed Receipts.
+
+    python benchmarks/bench_receipt_memory.py --receipts 100000
+"""
+
+import os
+import sys
+import json
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from models.receipt_types import Receipt
+from bench_report import make_receipts
+
+
+def measure(build) -> tuple[int, object]:
+    """Return the bytes still allocated once ``build()`` returns, and its result."""
+    tracemalloc.start()
+    result = build()
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return retained, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare in-memory size of dict and typed receipts.')
+    parser.add_argument('--receipts', type=int, default=100_000, help='Number of synthetic receipts.')
+    parser.add_argument('--items-per-receipt', type=int, default=5, help='Line items per receipt.')
+    args = parser.parse_args()
+
+    # Serialized model output plus pipeline metadata; each receipt is parsed
+    # from its own JSON so it owns its strings, as in a real batch.
+    payloads = []
+    for i, receipt in enumerate(make_receipts(args.receipts * args.items_per_receipt, args.items_per_receipt)):
+        receipt.update({
+            'date': f"2025-{i % 12 + 1:02d}-{i % 28 + 1:02d}",
+            'location': 'Austin, TX',
+            'receipt_total': f"{i % 500 + 10}.45",
+            'subtotal': f"{i % 500}.30",
+            'tax': '9.15',
+            'file_path': f"receipts/receipt_{i}.png",
+            'event_name': 'Benchmark Event',
+            'processed_date': '2025-07-01 12:00:00',
+        })
+        payloads.append(json.dumps(receipt))
+
+    dict_bytes, dict_receipts = measure(lambda: [json.loads(p) for p in payloads])
+    del dict_receipts
+    typed_bytes, typed_receipts = measure(lambda: [Receipt.from_dict(json.loads(p)) for p in payloads])
+
+    print(f"{args.receipts:,} receipts x {args.items_per_receipt} line items")
+    print(f"{'representation':<16}{'MB':>10}{'bytes/receipt':>16}")
+    for name, size in (('nested dicts', dict_bytes), ('Receipt', typed_bytes)):
+        print(f"{name:<16}{size / 1e6:>10.1f}{size / args.receipts:>16,.0f}")
+    print(f"reduction: {1 - typed_bytes / dict_bytes:.0%}")
+
+
+if __name__ == '__main__':
+    main()
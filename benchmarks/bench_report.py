@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Benchmark the summary report on synthetic receipt sets.
+
+Compares ReportGenerator against the original two-pass, string-concatenating
+implementation over nested dicts and checks that both produce the same report text.
+
+    python benchmarks/bench_report.py --line-items 1000000
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+from datetime import datetime
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from models.receipt_model import ReportGenerator
+from models.receipt_types import Receipt
+
+CATEGORIES = [
+    "Food & Beverage", "Tools & Equipment", "Raw Materials", "Software & Subscriptions",
+    "Event Fees", "Travel & Lodging", "Office Supplies", "Miscellaneous",
+]
+
+
+def make_receipts(line_items: int, items_per_receipt: int = 10, vendors: int = 500, seed: int = 7) -> list[dict]:
+    """Build synthetic receipts shaped like parsed model output."""
+    rng = random.Random(seed)
+    vendor_names = [f"Vendor {i}" for i in range(vendors)]
+    receipts = []
+    for r in range(line_items // items_per_receipt):
+        items = []
+        for j in range(items_per_receipt):
+            needs_approval = rng.random() < 0.01
+            items.append({
+                'item': f"Item {j}",
+                'amount': f"{rng.randint(1, 20000) / 100:.2f}",
+                'category': rng.choice(CATEGORIES),
+                'justification': "Synthetic benchmark item",
+                'needs_approval': needs_approval,
+                'approval_reason': "High-value item" if needs_approval else "",
+            })
+        receipts.append({
+            'merchant': rng.choice(vendor_names),
+            'file_name': f"receipt_{r}.png",
+            'line_items': items,
+            'flags': ["Date is missing"] if rng.random() < 0.005 else [],
+            'completeness_score': 'B',
+        })
+    return receipts
+
+
+def legacy_summary_report(receipts_data: list[dict]) -> str:
+    """The original ReportGenerator.generate_summary_report, kept as a baseline."""
+    total_spent = 0
+    category_totals = {}
+    vendor_totals = {}
+    flagged_receipts = []
+    approval_items = []
+
+    for receipt in receipts_data:
+        if receipt.get('flags'):
+            flagged_receipts.append({
+                'file': receipt.get('file_name', ''),
+                'flags': receipt.get('flags', []),
+                'score': receipt.get('completeness_score', 'N/A')
+            })
+
+        for item in receipt.get('line_items', []):
+            try:
+                amount = float(item.get('amount', '0').replace('$', ''))
+                total_spent += amount
+
+                category = item.get('category', 'Miscellaneous')
+                category_totals[category] = category_totals.get(category, 0) + amount
+
+                vendor = receipt.get('merchant', 'Unknown Vendor')
+                vendor_totals[vendor] = vendor_totals.get(vendor, 0) + amount
+
+                if item.get('needs_approval'):
+                    approval_items.append({
+                        'item': item.get('item', ''),
+                        'amount': amount,
+                        'reason': item.get('approval_reason', ''),
+                        'file': receipt.get('file_name', '')
+                    })
+            except (ValueError, AttributeError):
+                continue
+
+    report = f"""=== BUSINESS EXPENSE SUMMARY REPORT ===
+Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+
+FINANCIAL OVERVIEW:
+Total Amount Submitted: ${total_spent:.2f}
+Number of Receipts Processed: {len(receipts_data)}
+Number of Line Items: {sum(len(r.get('line_items', [])) for r in receipts_data)}
+
+SPENDING BY CATEGORY:
+"""
+
+    for category, amount in sorted(category_totals.items(), key=lambda x: x[1], reverse=True):
+        percentage = (amount / total_spent * 100) if total_spent > 0 else 0
+        report += f"  - {category:<25} ${amount:>8.2f} ({percentage:.1f}%)\n"
+
+    report += "\nTOP VENDORS:\n"
+    for vendor, amount in sorted(vendor_totals.items(), key=lambda x: x[1], reverse=True)[:5]:
+        report += f"  - {vendor:<25} ${amount:>8.2f}\n"
+
+    if approval_items:
+        report += f"\nITEMS REQUIRING APPROVAL ({len(approval_items)}):\n"
+        for item in approval_items:
+            report += f"  - {item['item']} - ${item['amount']:.2f} ({item['reason']}) | File: {item['file']}\n"
+
+    if flagged_receipts:
+        report += f"\nFLAGGED RECEIPTS ({len(flagged_receipts)}):\n"
+        for receipt in flagged_receipts:
+            report += f"  - {receipt['file']} (Score: {receipt['score']})\n"
+            for flag in receipt['flags']:
+                report += f"    - {flag}\n"
+
+    report += "\nRECOMMENDATIONS:\n"
+    report += "  - Review the generated CSV file for accuracy before submitting.\n"
+    if approval_items:
+        report += f"  - Seek financial manager/supervisor sign-off for the {len(approval_items)} item(s) requiring approval.\n"
+    if flagged_receipts:
+        report += f"  - Check the original images for the {len(flagged_receipts)} flagged receipt(s) to clarify issues.\n"
+
+    return report
+
+
+def best_of(runs: int, func, *args):
+    """Return the fastest wall-clock time and the last result of ``func``."""
+    best = float('inf')
+    result = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def strip_timestamp(report: str) -> str:
+    return '\n'.join(line for line in report.splitlines() if not line.startswith('Generated:'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark summary report generation.')
+    parser.add_argument('--line-items', type=int, default=1_000_000, help='Number of synthetic line items.')
+    parser.add_argument('--runs', type=int, default=3, help='Repetitions per implementation (best is reported).')
+    args = parser.parse_args()
+
+    print(f"Building {args.line_items:,} synthetic line items...")
+    receipts = make_receipts(args.line_items)
+    typed_receipts = [Receipt.from_dict(receipt) for receipt in receipts]
+    generator = ReportGenerator()
+
+    legacy_time, legacy_report = best_of(args.runs, legacy_summary_report, receipts)
+    current_time, current_report = best_of(args.runs, generator.generate_summary_report, typed_receipts)
+
+    identical = strip_timestamp(legacy_report) == strip_timestamp(current_report)
+    print(f"{'implementation':<16}{'seconds':>10}{'items/s':>14}")
+    for name, seconds in (('legacy', legacy_time), ('current', current_time)):
+        print(f"{name:<16}{seconds:>10.3f}{args.line_items / seconds:>14,.0f}")
+    print(f"speedup: {legacy_time / current_time:.2f}x | identical report text: {identical}")
+    if not identical:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Benchmark BM25 retrieval over a receipt store of synthetic history.
+
+Builds a temporary store (or reuses --db), indexes it, then times
+retrieval for questions with and without event, date and amount filters.
+
+    python benchmarks/bench_retrieval.py --receipts 100000
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import statistics
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from models.receipt_store import ReceiptStore
+from models.receipt_types import Receipt
+from models.receipt_retriever import ReceiptRetriever
+
+MERCHANTS = [
+    "Uber", "Lyft", "Home Depot", "Staples", "Starbucks", "Delta Air Lines", "Marriott", "Office Depot",
+    "Amazon", "Costco", "Whole Foods", "Taco Bell", "Airbnb", "Best Buy", "FedEx", "Adobe",
+]
+ITEMS = {
+    "Travel & Lodging": ["Ride to airport", "Hotel night", "Flight upgrade", "Parking", "Airport shuttle"],
+    "Food & Beverage": ["Coffee", "Team lunch", "Catering tray", "Bottled water", "Burrito bowl"],
+    "Office Supplies": ["Printer paper", "Ink cartridge", "Sticky notes", "Stapler", "Whiteboard markers"],
+    "Tools & Equipment": ["Cordless drill", "Extension cord", "Monitor", "USB-C dock", "Label maker"],
+    "Software & Subscriptions": ["Creative Cloud license", "Cloud storage plan", "Design tool seat"],
+    "Raw Materials": ["Plywood sheet", "Lumber", "Acrylic panel", "Filament spool"],
+}
+CATEGORIES = list(ITEMS)
+EVENTS = ["Q1 Offsite", "Trade Show", "Team Meeting", "Client Visit", "Hackathon", "General"]
+QUERIES = [
+    "How much did we spend at Uber across all events?",
+    "What coffee did we buy?",
+    "Show hotel stays over $150",
+    "What office supplies were bought for the Hackathon?",
+    "Which software licenses did we pay for in 2025?",
+    "Any drill or tool purchases since 2025-06-01?",
+]
+
+
+def make_receipts(count: int, items_per_receipt: int = 5, seed: int = 11):
+    """Yield synthetic receipts with a realistic spread of merchants, items and events."""
+    rng = random.Random(seed)
+    for r in range(count):
+        category = rng.choice(CATEGORIES)
+        items = []
+        for _ in range(items_per_receipt):
+            item_category = category if rng.random() < 0.7 else rng.choice(CATEGORIES)
+            items.append({
+                'item': rng.choice(ITEMS[item_category]),
+                'amount': f"{rng.randint(100, 40000) / 100:.2f}",
+                'category': item_category,
+                'justification': f"{item_category} for {rng.choice(EVENTS).lower()} work",
+            })
+        receipt = Receipt.from_dict({
+            'merchant': rng.choice(MERCHANTS) if rng.random() < 0.8 else f"Vendor {rng.randint(1, 5000)}",
+            'date': f"{rng.choice((2024, 2025))}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            'line_items': items,
+        })
+        receipt.event_name = rng.choice(EVENTS)
+        receipt.file_name = f"receipt_{r}.png"
+        receipt.file_path = f"/bench/receipt_{r}.png"
+        receipt.processed_date = f"2025-01-01 00:00:{r:07d}"
+        yield receipt
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark BM25 retrieval over stored receipts.')
+    parser.add_argument('--receipts', type=int, default=100_000, help='Number of synthetic receipts to store.')
+    parser.add_argument('--db', help='Reuse (or create) this database instead of a temporary one.')
+    parser.add_argument('--runs', type=int, default=20, help='Repetitions per query.')
+    args = parser.parse_args()
+
+    db_path = args.db or os.path.join(tempfile.mkdtemp(), 'bench_receipts.db')
+    store = ReceiptStore(db_path)
+    if store.count_receipts() < args.receipts:
+        print(f"Storing {args.receipts:,} synthetic receipts...")
+        start = time.perf_counter()
+        batch = []
+        for receipt in make_receipts(args.receipts):
+            batch.append(receipt)
+            if len(batch) == 1000:
+                store.add_receipts(batch)
+                batch.clear()
+        store.add_receipts(batch)
+        print(f"Stored and indexed in {time.perf_counter() - start:.1f}s "
+              f"({args.receipts / (time.perf_counter() - start):,.0f} receipts/s)")
+
+    retriever = ReceiptRetriever(store)
+    start = time.perf_counter()
+    retriever.refresh()
+    print(f"Indexed {len(retriever):,} line items in {time.perf_counter() - start:.1f}s")
+    print(f"{'query':<56}{'cold ms':>9}{'p50 ms':>9}{'p95 ms':>9}{'matched':>10}{'hits':>6}")
+    for query in QUERIES:
+        # The first query on a term sorts its postings by impact; later ones reuse that order.
+        start = time.perf_counter()
+        retriever.retrieve(query)
+        cold = (time.perf_counter() - start) * 1000
+        timings = []
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            retrieval = retriever.retrieve(query)
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+        matched = f"{retrieval['matches']['line_items']:,}" if retrieval['matches'] else '-'
+        print(f"{query:<56}{cold:>9.2f}{statistics.median(timings):>9.2f}{p95:>9.2f}{matched:>10}{len(retrieval['hits']):>6}")
+    store.close()
+
+
+if __name__ == '__main__':
+    main()
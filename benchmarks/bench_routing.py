@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Benchmark tiered extraction: a fast tier alone, a strong tier alone, and
+the fast tier with escalation of receipts that fail the local checks.
+
+Two stand-in models read synthetic receipts. The fast one answers in
+``--fast-ms`` and misreads a share of receipts, most of them the "hard"
+ones. The strong one is slower and more accurate. Most misreadings drop
+or garble a line item, which the checks catch. A share (``--silent-share``)
+gets only the merchant wrong, which they cannot catch. Accuracy is the
+share of receipts extracted exactly right.
+
+    python benchmarks/bench_routing.py --receipts 200 --hard-share 0.2 --concurrency 8
+"""
+
+import io
+import os
+import sys
+import json
+import math
+import time
+import random
+import hashlib
+import argparse
+import threading
+import contextlib
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def make_receipt(index: int, hard: bool, rng: random.Random) -> dict:
+    items = [{'item': f"Item {index}-{n}", 'amount': f"{rng.randint(199, 9999) / 100:.2f}",
+              'category': "Office Supplies"} for n in range(rng.randint(3, 12))]
+    subtotal = sum(round(float(item['amount']) * 100) for item in items)
+    tax = subtotal * 8 // 100
+    return {'merchant': f"Vendor {index}", 'date': "2025-06-01", 'location': "Austin, TX",
+            'receipt_total': f"{(subtotal + tax) / 100:.2f}", 'subtotal': f"{subtotal / 100:.2f}",
+            'tax': f"{tax / 100:.2f}", 'line_items': items, 'flags': [], 'completeness_score': 'A', 'hard': hard}
+
+
+def make_image(index: int) -> bytes:
+    from PIL import Image
+    image = Image.frombytes('L', (8, 8), hashlib.sha256(str(index).encode()).digest() * 2)
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+class ReaderBackend:
+    """Stand-in model that returns the receipt shown, misread with the given probabilities."""
+
+    def __init__(self, name: str, latency_ms: float, easy_error: float, hard_error: float,
+                 silent_share: float, truths: dict, seed: int):
+        self.name = name
+        self.latency_ms = latency_ms
+        self.easy_error = easy_error
+        self.hard_error = hard_error
+        self.silent_share = silent_share
+        self.truths = truths
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def generate(self, contents, system_instruction: str = None):
+        from models.model_backend import ModelResponse
+        image = next(part['data'] for part in contents if isinstance(part, dict))
+        truth = self.truths[hashlib.sha256(image).hexdigest()]
+        with self._lock:
+            rng = random.Random(self._random.random())
+        data = {key: value for key, value in truth.items() if key != 'hard'}
+        data['line_items'] = [dict(item) for item in truth['line_items']]
+        if rng.random() < (self.hard_error if truth['hard'] else self.easy_error):
+            if rng.random() < self.silent_share:
+                data['merchant'] = "Unknown Vendor"
+            elif rng.random() < 0.5:
+                data['line_items'].pop(rng.randrange(len(data['line_items'])))
+                data['completeness_score'] = rng.choice('BCD')
+            else:
+                item = rng.choice(data['line_items'])
+                item['amount'] = f"{float(item['amount']) + rng.choice((-1, 1)) * rng.randint(1, 9):.2f}"
+        time.sleep(self.latency_ms * math.exp(0.3 * rng.gauss(0, 1)) / 1000)
+        text = json.dumps(data)
+        return ModelResponse(text, 258 + len(contents[0]) // 4, len(text) // 4)
+
+
+def exact(extracted, truth: dict) -> bool:
+    if extracted is None or extracted.merchant != truth['merchant']:
+        return False
+    expected = [round(float(item['amount']) * 100) for item in truth['line_items']]
+    return [item.amount_cents for item in extracted.line_items] == expected
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark fast, strong and escalating extraction tiers.')
+    parser.add_argument('--receipts', type=int, default=200, help='Receipts per mode.')
+    parser.add_argument('--hard-share', type=float, default=0.2, help='Share of receipts that are hard to read.')
+    parser.add_argument('--concurrency', type=int, default=8, help='Receipts in flight.')
+    parser.add_argument('--fast-ms', type=float, default=400, help='Median fast-tier latency.')
+    parser.add_argument('--strong-ms', type=float, default=1600, help='Median strong-tier latency.')
+    parser.add_argument('--silent-share', type=float, default=0.15,
+                        help='Share of misreadings the local checks cannot detect.')
+    args = parser.parse_args()
+
+    sys.path.insert(0, PROJECT_ROOT)
+    from models.image_preprocessor import ImagePreprocessor
+    from models.receipt_model import ReceiptProcessor
+    from models.extraction_router import ExtractionTier
+
+    rng = random.Random(7)
+    truths, by_name = {}, {}
+    for index in range(args.receipts):
+        truth = make_receipt(index, rng.random() < args.hard_share, rng)
+        image = make_image(index)
+        truths[hashlib.sha256(image).hexdigest()] = truth
+        by_name[f"receipt_{index:04d}.png"] = (image, truth)
+
+    def fast():
+        return ReaderBackend('fast', args.fast_ms, 0.03, 0.6, args.silent_share, truths, seed=1)
+
+    def strong():
+        return ReaderBackend('strong', args.strong_ms, 0.01, 0.08, args.silent_share, truths, seed=2)
+
+    raw = ImagePreprocessor(enabled=False)
+    modes = {
+        'fast only': ReceiptProcessor(preprocessor=raw, backend=fast()),
+        'strong only': ReceiptProcessor(preprocessor=raw, backend=strong()),
+        'escalating': ReceiptProcessor(preprocessor=raw, backend=fast(),
+                                       escalation=ExtractionTier('strong', strong(), raw, strict=True)),
+    }
+
+    print(f"{args.receipts} receipts, {args.hard_share:.0%} hard, concurrency {args.concurrency}\n")
+    print(f"{'mode':<13}{'accuracy':>9}{'receipts/s':>12}{'requests':>10}{'escalated':>11}"
+          "  checks passed per tier (first tier first)")
+    for label, processor in modes.items():
+        # Receipts are read from memory; the paths only name them.
+        original = processor.process_single_receipt
+        processor.process_single_receipt = lambda path, event_name=None, image_bytes=None: original(
+            path, event_name, by_name[os.path.basename(path)][0])
+        start = time.perf_counter()
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            receipts = processor.process_event_receipts(list(by_name), 'Bench', args.concurrency)
+        elapsed = time.perf_counter() - start
+        correct = sum(exact(receipt, by_name[receipt.file_name][1]) for receipt in receipts)
+        requests = processor.request_summary()
+        tiers = ', '.join(f"{name} {tier['hit_rate']:.0%} ({tier['mean_seconds']:.2f}s)"
+                          for name, tier in processor.tier_summary().items())
+        print(f"{label:<13}{correct / args.receipts:>9.1%}{args.receipts / elapsed:>12.1f}"
+              f"{requests['total']['requests']:>10}{requests['escalated']['receipts']:>11}  {tiers}")
+
+
+if __name__ == '__main__':
+    main()
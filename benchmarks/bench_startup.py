@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Benchmark CLI startup and module import times in fresh interpreters.
+
+Each measurement starts a new Python process, so nothing is cached in
+memory between runs. The bare interpreter is timed as well, because its
+startup (site packages, .pth hooks) varies a lot between environments;
+the "overhead" column is what this project adds on top of it.
+
+    python benchmarks/bench_startup.py --runs 10
+"""
+
+import os
+import sys
+import time
+import argparse
+import subprocess
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+COMMANDS = [
+    ("interpreter", ['-c', 'pass']),
+    ("main.py --help", ['main.py', '--help']),
+    ("import controller", ['-c', 'import controllers.receipt_controller']),
+    ("import web app", ['-c', 'import web.app']),
+    # What every start used to pay before the SDK and PIL were imported lazily.
+    ("import SDK + PIL (legacy)", ['-W', 'ignore', '-c', 'import google.generativeai, PIL.Image, PIL.ImageOps']),
+]
+
+
+def best_of(runs: int, args: list[str]) -> float | None:
+    best = float('inf')
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, *args], cwd=PROJECT_ROOT,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        elapsed = time.perf_counter() - start
+        if result.returncode != 0:
+            return None
+        best = min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark CLI startup and import times.')
+    parser.add_argument('--runs', type=int, default=10, help='Fresh processes per command (best is reported).')
+    args = parser.parse_args()
+
+    print(f"{'command':<28}{'best ms':>10}{'overhead ms':>13}")
+    baseline = None
+    for label, command in COMMANDS:
+        elapsed = best_of(args.runs, command)
+        if elapsed is None:
+            print(f"{label:<28}{'failed':>10}")
+            continue
+        if baseline is None:
+            baseline = elapsed
+        print(f"{label:<28}{elapsed * 1000:>10.1f}{(elapsed - baseline) * 1000:>13.1f}")
+
+
+if __name__ == '__main__':
+    main()
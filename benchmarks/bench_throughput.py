@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Benchmark end-to-end throughput, latency and memory of the processing paths
+against the simulated model backend.
+
+Every path runs the real pipeline (pre-processing, duplicate detection,
+parsing, the receipt store, CSV and report writing) on synthetic receipt
+images; only the model is simulated, with a log-normal latency. Each path
+and size gets a fresh temporary store and results folder.
+
+    single  sequential single-receipt runs, as `main.py a.png b.png ...`
+    event   one event of N receipts with --concurrency
+    batch   a batch folder of N receipts with --concurrency
+    web     multi-file uploads to the Flask app, polled until every job is done
+
+Latency is per receipt (pre-processing through parsing); memory is the
+peak of Python allocations traced during the run.
+
+    python benchmarks/bench_throughput.py --sizes 10 100 1000 --latency-ms 200
+"""
+
+import io
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import tracemalloc
+import contextlib
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+PATHS = ('single', 'event', 'batch', 'web')
+# Files per upload request in the web path; each upload is its own browser session.
+UPLOAD_FILES = 25
+
+
+def make_images(folder: str, count: int, seed: int = 5) -> list[str]:
+    """Write ``count`` distinct receipt-sized grayscale images and return their paths."""
+    from PIL import Image
+    rng = random.Random(seed)
+    os.makedirs(folder, exist_ok=True)
+    paths = []
+    for i in range(count):
+        # A random coarse grid gives every image a different perceptual hash.
+        grid = Image.frombytes('L', (9, 16), bytes(rng.randrange(256) for _ in range(9 * 16)))
+        image = grid.resize((900, 1600), Image.NEAREST)
+        path = os.path.join(folder, f"receipt_{i:05d}.png")
+        image.save(path)
+        paths.append(path)
+    return paths
+
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def run_web(app_module, image_paths: list[str], timeout: float = 600):
+    """Upload the images in groups and poll every job until it is done."""
+    uploads = []
+    for start in range(0, len(image_paths), UPLOAD_FILES):
+        client = app_module.app.test_client()
+        files = []
+        for path in image_paths[start:start + UPLOAD_FILES]:
+            with open(path, 'rb') as f:
+                files.append((io.BytesIO(f.read()), os.path.basename(path)))
+        data = {'file': files}
+        response = client.post('/', data=data, content_type='multipart/form-data',
+                               headers={'Accept': 'application/json'})
+        uploads.append((client, response.get_json()['status_url']))
+
+    deadline = time.monotonic() + timeout
+    while uploads and time.monotonic() < deadline:
+        uploads = [(client, url) for client, url in uploads if client.get(url).get_json()['status'] != 'done']
+        if uploads:
+            time.sleep(0.02)
+    if uploads:
+        raise TimeoutError(f"{len(uploads)} upload jobs did not finish")
+
+
+def run_path(path_name: str, size: int, images: list[str], work_dir: str, concurrency: int, app_module):
+    """Run one path over ``images`` and return (seconds, receipt latencies, peak bytes, receipts)."""
+    from controllers.receipt_controller import ReceiptController
+    from models.receipt_store import ReceiptStore
+    from models.duplicate_detector import DuplicateDetector
+    from models.metrics import metrics
+
+    if path_name == 'web':
+        controller = app_module.controller
+        app_module.job_queue.results_folder = work_dir
+    else:
+        controller = ReceiptController(concurrency=concurrency, use_cache=False)
+    controller.store = ReceiptStore(os.path.join(work_dir, 'receipts.db'))
+    controller.duplicate_detector = DuplicateDetector(index_path=os.path.join(work_dir, 'phash_index.jsonl'))
+    controller.ensure_results_folders()
+    metrics.reset()
+
+    latencies = []
+    process_single = controller.processor.process_single_receipt
+
+    def timed(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return process_single(*args, **kwargs)
+        finally:
+            latencies.append(time.perf_counter() - start)
+
+    controller.processor.process_single_receipt = timed
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            if path_name == 'single':
+                for image in images:
+                    controller.process_single_image_with_output(image)
+            elif path_name == 'event':
+                controller.process_event_images(images, f"Bench {size}")
+            elif path_name == 'batch':
+                controller.process_batch_folder(os.path.dirname(images[0]))
+            else:
+                run_web(app_module, images)
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+        controller.processor.process_single_receipt = process_single
+    return elapsed, latencies, peak, controller.store.count_receipts()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark processing paths against the simulated backend.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100], help='Receipts per run.')
+    parser.add_argument('--paths', nargs='+', choices=PATHS, default=list(PATHS), help='Paths to benchmark.')
+    parser.add_argument('--concurrency', type=int, default=8,
+                        help='In-flight requests for event and batch runs, and web workers.')
+    parser.add_argument('--latency-ms', type=float, default=200, help='Median simulated model latency.')
+    parser.add_argument('--latency-sigma', type=float, default=0.35, help='Log-normal spread of model latency.')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of model requests that fail.')
+    args = parser.parse_args()
+
+    base_dir = tempfile.mkdtemp(prefix='receipt_bench_')
+    # Module defaults read these at import time, so they are set before anything is imported.
+    os.environ.update({
+        'RECEIPT_MODEL_BACKEND': 'simulated',
+        'RECEIPT_SIM_LATENCY_MS': str(args.latency_ms),
+        'RECEIPT_SIM_LATENCY_SIGMA': str(args.latency_sigma),
+        'RECEIPT_SIM_ERROR_RATE': str(args.error_rate),
+        'RECEIPT_SIM_SEED': '1',
+        'RECEIPT_WEB_WORKERS': str(args.concurrency),
+        'RECEIPT_DB_PATH': os.path.join(base_dir, 'receipts.db'),
+        'RECEIPT_CACHE_DIR': os.path.join(base_dir, 'cache'),
+        'RECEIPT_DEDUP_INDEX': os.path.join(base_dir, 'phash_index.jsonl'),
+        'RECEIPT_CONTEXT_DB': os.path.join(base_dir, 'sessions.db'),
+        'RECEIPT_RATE_LIMIT_DB': os.path.join(base_dir, 'ratelimit.db'),
+    })
+    sys.path.insert(0, PROJECT_ROOT)
+    app_module = None
+    if 'web' in args.paths:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            import web.app as app_module
+
+    print(f"Simulated model: median {args.latency_ms:.0f} ms, sigma {args.latency_sigma}, "
+          f"error rate {args.error_rate:.0%}; concurrency {args.concurrency}\n")
+    print(f"{'path':<8}{'receipts':>10}{'stored':>8}{'seconds':>10}{'receipts/s':>12}"
+          f"{'p50 ms':>10}{'p99 ms':>10}{'peak MB':>10}")
+    for size in args.sizes:
+        images = make_images(os.path.join(base_dir, f"images_{size}", f"bench_{size}"), size)
+        for path_name in args.paths:
+            work_dir = tempfile.mkdtemp(prefix=f"{path_name}_{size}_", dir=base_dir)
+            os.chdir(work_dir)
+            elapsed, latencies, peak, stored = run_path(path_name, size, images, work_dir,
+                                                        args.concurrency, app_module)
+            print(f"{path_name:<8}{size:>10}{stored:>8}{elapsed:>10.2f}{size / elapsed:>12.1f}"
+                  f"{percentile(latencies, 0.5) * 1000:>10.0f}{percentile(latencies, 0.99) * 1000:>10.0f}"
+                  f"{peak / 1e6:>10.1f}")
+    os.chdir(PROJECT_ROOT)
+    print(f"\nTemporary files: {base_dir}")
+
+
+if __name__ == '__main__':
+    main()
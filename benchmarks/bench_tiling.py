@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Benchmark tiled extraction of long receipts against sending them as one image.
+
+Synthetic receipts of 600 px wide rows, 30 px per line item, are rendered
+and run through ``ReceiptProcessor`` with tiling on and off. A stand-in
+model "reads" the rows visible in each request: rows shrunk below about
+12 px by downscaling are increasingly dropped or misread, responses stop
+after ``--max-output-items`` items as if the output limit was hit, latency
+grows with the items returned, and rows in tile overlaps are read with
+slightly different names. Recall and precision of the line items against
+the rendered ones, header and total accuracy, and wall time per receipt
+are reported. Tile settings at their edges are checked first, and the
+script exits with status 1 if one of them fails.
+
+    python benchmarks/bench_tiling.py --items 20 60 120 200 --receipts 5
+"""
+
+import io
+import os
+import re
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import threading
+import contextlib
+import statistics
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+WIDTH = 600
+ROW_HEIGHT = 30
+HEADER_HEIGHT = 300
+FOOTER_HEIGHT = 300
+PRODUCTS = ["Org Bananas", "Greek Yogurt Plain", "Sourdough Loaf", "Cheddar Block", "Baby Spinach",
+            "Paper Towels 6pk", "Coffee Beans Dark", "Sparkling Water", "Chicken Thighs", "Olive Oil Extra Virgin",
+            "Printer Paper", "AA Batteries 8pk", "Dish Soap", "Trail Mix", "Granola Bars"]
+
+
+def make_receipt(items: int, rng: random.Random) -> dict:
+    rows = []
+    for _ in range(items):
+        if rows and rng.random() < 0.1:
+            rows.append(dict(rows[-1]))  # Same product bought twice, on consecutive lines.
+        else:
+            rows.append({'item': rng.choice(PRODUCTS), 'amount_cents': rng.randint(99, 2999)})
+    subtotal = sum(row['amount_cents'] for row in rows)
+    tax = subtotal * 8 // 100
+    return {'merchant': "Corner Market", 'date': "2025-05-02", 'rows': rows, 'subtotal': subtotal,
+            'tax': tax, 'total': subtotal + tax, 'height': HEADER_HEIGHT + ROW_HEIGHT * items + FOOTER_HEIGHT}
+
+
+def render(receipt: dict) -> bytes:
+    from PIL import Image, ImageDraw
+    image = Image.new('L', (WIDTH, receipt['height']), 255)
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((40, 40, WIDTH - 40, 120), fill=0)
+    for index, row in enumerate(receipt['rows']):
+        top = HEADER_HEIGHT + index * ROW_HEIGHT + 8
+        draw.text((40, top), row['item'], fill=0)
+        draw.text((WIDTH - 120, top), f"{row['amount_cents'] / 100:.2f}", fill=0)
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+class ReadingBackend:
+    """Stand-in model that returns the rows of the current receipt visible in each request."""
+
+    name = 'bench-reader'
+
+    def __init__(self, max_edge: int, max_output_items: int, base_ms: float, per_item_ms: float, seed: int):
+        self.max_edge = max_edge
+        self.max_output_items = max_output_items
+        self.base_ms = base_ms
+        self.per_item_ms = per_item_ms
+        self.receipt = None
+        self.row_pixels = []
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def generate(self, contents, system_instruction: str = None):
+        from models.model_backend import ModelResponse
+        from models.image_preprocessor import ImagePreprocessor
+        receipt = self.receipt
+        height = receipt['height']
+        prompt = contents[0]
+        tile = re.search(r'part (\d+) of (\d+)', prompt)
+        if tile:
+            part, _ = int(tile.group(1)), int(tile.group(2))
+            _, top, _, bottom = ImagePreprocessor._tile_boxes(WIDTH, height)[part - 1]
+        else:
+            top, bottom = 0, height
+        # Pixels per row once the model's image is scaled to fit max_edge.
+        row_pixels = ROW_HEIGHT * min(1.0, self.max_edge / (bottom - top))
+        readable = min(1.0, max(0.0, (row_pixels - 5) / 7))
+        with self._lock:
+            self.row_pixels.append(row_pixels)
+            rng = random.Random(self._random.random())
+
+        items = []
+        for index, row in enumerate(receipt['rows']):
+            row_top = HEADER_HEIGHT + index * ROW_HEIGHT
+            visible = min(bottom, row_top + ROW_HEIGHT) - max(top, row_top)
+            if visible < ROW_HEIGHT * 0.7:
+                continue
+            name, cents = row['item'], row['amount_cents']
+            roll = rng.random()
+            if roll > readable + (1 - readable) / 2:
+                continue
+            if roll > readable:
+                cents += rng.choice((-100, 100, 9))
+            if tile and rng.random() < 0.3:
+                name = rng.choice((name.upper(), name.rsplit(' ', 1)[0]))
+            items.append({'item': name, 'amount': f"{cents / 100:.2f}", 'category': "Food & Beverage"})
+        items = items[:self.max_output_items]
+
+        data = {'merchant': "Unknown Vendor", 'date': "Not Available", 'location': "Not Available",
+                'receipt_total': "0.00", 'subtotal': "0.00", 'tax': "0.00", 'line_items': items,
+                'flags': [], 'completeness_score': 'A' if readable == 1 else 'C'}
+        if top < HEADER_HEIGHT / 2:
+            data.update(merchant=receipt['merchant'], date=receipt['date'])
+        if bottom > height - FOOTER_HEIGHT / 2:
+            data.update(receipt_total=f"{receipt['total'] / 100:.2f}", subtotal=f"{receipt['subtotal'] / 100:.2f}",
+                        tax=f"{receipt['tax'] / 100:.2f}")
+        latency = (self.base_ms + self.per_item_ms * len(items)) * math.exp(0.2 * rng.gauss(0, 1))
+        time.sleep(latency / 1000)
+        text = json.dumps(data)
+        return ModelResponse(text, 258, len(text) // 4)
+
+
+# (max_edge, tile_aspect, width, height, parts expected)
+EDGE_CASES = [
+    (1200, 1.2, 1000, 1400, 1),   # Tall enough to tile, but only one tile fits.
+    (1600, 2.5, 600, 1600, 1),    # Tall, but not downscaled as one image.
+    (1600, 2.5, 600, 4000, 6),
+    (1600, 0, 600, 4000, 1),      # Tiling off.
+]
+
+
+def check_edge_cases() -> list[str]:
+    """Pre-process blank images with edge-case tile settings and return what went wrong."""
+    from PIL import Image
+    from models.image_preprocessor import ImagePreprocessor
+    problems = []
+    for max_edge, tile_aspect, width, height, expected in EDGE_CASES:
+        buffer = io.BytesIO()
+        Image.new('L', (width, height), 255).save(buffer, format='PNG')
+        preprocessor = ImagePreprocessor(max_edge=max_edge, tile_aspect=tile_aspect, autocrop=False)
+        label = f"max_edge={max_edge} tile_aspect={tile_aspect:g} on {width}x{height}"
+        try:
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                parts = preprocessor.process_tiles(buffer.getvalue())
+        except Exception as e:
+            problems.append(f"{label}: {type(e).__name__}: {e}")
+            continue
+        if len(parts) != expected:
+            problems.append(f"{label}: {len(parts)} part(s), expected {expected}")
+    return problems
+
+
+def score(receipt: dict, extracted) -> tuple[int, int, bool]:
+    """Return line items matched to rendered rows, items extracted and whether header and total are right."""
+    if extracted is None:
+        return 0, 0, False
+    normalize = lambda name: re.sub(r'[^a-z0-9]+', ' ', name.lower()).strip()
+    remaining = [(normalize(row['item']), row['amount_cents']) for row in receipt['rows']]
+    matched = 0
+    for item in extracted.line_items:
+        name = normalize(item.item)
+        for position, (truth, cents) in enumerate(remaining):
+            if cents == item.amount_cents and truth.startswith(name):
+                matched += 1
+                del remaining[position]
+                break
+    correct = (extracted.merchant == receipt['merchant'] and extracted.receipt_total_cents == receipt['total'])
+    return matched, len(extracted.line_items), correct
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark tiled versus single-image extraction of long receipts.')
+    parser.add_argument('--items', type=int, nargs='+', default=[20, 60, 120, 200], help='Line items per receipt.')
+    parser.add_argument('--receipts', type=int, default=5, help='Receipts per size and mode.')
+    parser.add_argument('--max-output-items', type=int, default=100, help='Items a response holds before it is cut off.')
+    parser.add_argument('--base-ms', type=float, default=600, help='Model latency before output.')
+    parser.add_argument('--per-item-ms', type=float, default=25, help='Model latency per line item returned.')
+    args = parser.parse_args()
+
+    sys.path.insert(0, PROJECT_ROOT)
+    from models.image_preprocessor import ImagePreprocessor, DEFAULT_MAX_EDGE, DEFAULT_TILE_ASPECT
+    from models.receipt_model import ReceiptProcessor
+
+    problems = check_edge_cases()
+    for problem in problems:
+        print(f"Tile settings check failed: {problem}")
+    if problems:
+        sys.exit(1)
+    print(f"Tile settings check: {len(EDGE_CASES)} edge cases passed")
+    print(f"{args.receipts} receipt(s) per size, {WIDTH} px wide, {ROW_HEIGHT} px per item; "
+          f"responses cut off after {args.max_output_items} items\n")
+    print(f"{'items':>6}  {'mode':<9}{'requests':>9}{'row px':>8}{'recall':>8}{'precision':>10}"
+          f"{'header+total':>13}{'p50 s':>7}")
+    for items in args.items:
+        rng = random.Random(items)
+        receipts = [make_receipt(items, rng) for _ in range(args.receipts)]
+        images = [render(receipt) for receipt in receipts]
+        for mode, tile_aspect in (("single", 0), ("tiled", DEFAULT_TILE_ASPECT or 2.5)):
+            backend = ReadingBackend(DEFAULT_MAX_EDGE, args.max_output_items, args.base_ms, args.per_item_ms, seed=items)
+            processor = ReceiptProcessor(preprocessor=ImagePreprocessor(autocrop=False, tile_aspect=tile_aspect),
+                                         backend=backend)
+            matched = extracted_items = correct = 0
+            seconds = []
+            for index, (receipt, image_bytes) in enumerate(zip(receipts, images)):
+                backend.receipt = receipt
+                start = time.perf_counter()
+                with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                    extracted = processor.process_single_receipt(f"long_{items}_{index}.png", image_bytes=image_bytes)
+                seconds.append(time.perf_counter() - start)
+                hits, count, right = score(receipt, extracted)
+                matched += hits
+                extracted_items += count
+                correct += right
+            requests = processor.request_summary()['total']['requests']
+            print(f"{items:>6}  {mode:<9}{requests:>9}{statistics.median(backend.row_pixels):>8.1f}"
+                  f"{matched / (items * args.receipts):>8.1%}{matched / extracted_items if extracted_items else 0:>10.1%}"
+                  f"{correct:>7}/{args.receipts:<5}{statistics.median(seconds):>7.2f}")
+
+
+if __name__ == '__main__':
+    main()
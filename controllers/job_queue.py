@@ -0,0 +1,144 @@
+"""
+Background job queue for web uploads.
+Runs receipt extraction on a local worker pool so request handlers return immediately.
+"""
+
+import os
+import uuid
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+DEFAULT_WORKERS = int(os.getenv('RECEIPT_WEB_WORKERS', '4'))
+# Finished jobs beyond this many are forgotten, oldest first.
+MAX_JOBS = 500
+
+
+class JobQueue:
+    """Processes uploaded receipt files in the background and tracks them by job ID.
+
+    Every file of a job is submitted to the pool separately, so the files of
+    one upload, and of concurrent uploads, are processed in parallel. A job
+    is ``queued`` until its first file starts, ``running`` until every file
+    has finished, and then ``done``.
+
+    When a job finishes, its first receipt is loaded for the uploading
+    session's questions and the job is written to the controller's context
+    store. With the SQLite store, any worker process can then report the job
+    and answer questions about it, not only the one that ran it.
+    """
+
+    def __init__(self, controller, results_folder: str, workers: int = DEFAULT_WORKERS):
+        self.controller = controller
+        self.store = controller.context_store
+        self.results_folder = results_folder
+        self.executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='receipt-job')
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, uploads: list[tuple[str, bytes]], session_id: str) -> str:
+        """Queue uploaded images, as ``(file name, image bytes)`` pairs, for a session and return the new job's ID."""
+        job_id = uuid.uuid4().hex
+        job = {
+            'job_id': job_id,
+            'session_id': session_id,
+            'status': 'queued',
+            'created': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'chat_file': None,
+            'files': [
+                {'file_name': os.path.basename(name), 'status': 'queued', 'summary': None,
+                 'result_filename': None, 'error': None, 'receipt': None}
+                for name, _ in uploads
+            ],
+        }
+        with self._lock:
+            self._jobs[job_id] = job
+            self._evict()
+        self.store.put_job(job_id, self._shared(job))
+        for position, (name, image_bytes) in enumerate(uploads):
+            self.executor.submit(self._run_file, job_id, position, name, image_bytes)
+        return job_id
+
+    def get(self, job_id: str) -> dict | None:
+        """Return a snapshot of a job's status and per-file results, or None if unknown.
+
+        Jobs run by this process are read from memory; others from the shared store.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                return self._shared(job)
+        return self.store.get_job(job_id)
+
+    def _run_file(self, job_id: str, position: int, name: str, image_bytes: bytes):
+        self._update(job_id, position, status='running')
+        try:
+            receipt_data = self.controller.process_single_receipt(name, image_bytes=image_bytes)
+            if not receipt_data:
+                self._update(job_id, position, status='failed', error='Could not process receipt - check API key')
+                return
+            summary = self.controller.format_single_receipt_summary(receipt_data)
+            base_name = os.path.splitext(os.path.basename(name))[0]
+            # The position keeps same-named files of one upload from overwriting each other's summary.
+            result_filename = f"{base_name}_{job_id[:8]}_{position + 1}_summary.txt"
+            self.controller.save_text_file(os.path.join(self.results_folder, result_filename), summary)
+            self._update(job_id, position, status='done', summary=summary,
+                         result_filename=result_filename, receipt=receipt_data)
+        except Exception as e:
+            print(f"Error processing receipt {name}: {e}")
+            self._update(job_id, position, status='failed', error=f'Error processing receipt: {e}')
+
+    def _update(self, job_id: str, position: int, **fields):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job['files'][position].update(fields)
+            statuses = {entry['status'] for entry in job['files']}
+            if not statuses <= {'done', 'failed'}:
+                if statuses != {'queued'}:
+                    job['status'] = 'running'
+                return
+            # Only the thread that finished the last file gets past here.
+            job['status'] = 'finishing'
+            receipts = [entry['receipt'] for entry in job['files'] if entry['receipt'] is not None]
+        self._finish(job, receipts)
+
+    def _finish(self, job: dict, receipts: list):
+        """Load the job's first receipt for questions, then publish the job as done."""
+        if receipts:
+            try:
+                self.controller.load_receipt_for_questions(job['session_id'], receipts[0])
+            except Exception as e:
+                print(f"Error loading receipt for questions from job {job['job_id']}: {e}")
+                receipts = []
+        with self._lock:
+            job['status'] = 'done'
+            job['chat_file'] = receipts[0].file_name if receipts else None
+            snapshot = self._shared(job)
+        try:
+            self.store.put_job(job['job_id'], snapshot)
+        except Exception as e:
+            print(f"Error saving job {job['job_id']}: {e}")
+
+    @staticmethod
+    def _shared(job: dict) -> dict:
+        """Copy a job without its receipt objects, in the form the shared store holds it."""
+        snapshot = dict(job)
+        if snapshot['status'] == 'finishing':
+            snapshot['status'] = 'running'
+        snapshot['files'] = [{key: value for key, value in entry.items() if key != 'receipt'}
+                             for entry in job['files']]
+        return snapshot
+
+    def _evict(self):
+        """Drop the oldest finished jobs once more than MAX_JOBS are tracked."""
+        excess = len(self._jobs) - MAX_JOBS
+        if excess <= 0:
+            return
+        for job_id in [job_id for job_id, job in self._jobs.items() if job['status'] == 'done'][:excess]:
+            del self._jobs[job_id]
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
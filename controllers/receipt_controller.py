@@ -4,31 +4,84 @@ Coordinates between model and view components.
 """
 
 import os
-import glob
 import re
+import threading
 from datetime import datetime
 
-from models.receipt_model import ReceiptProcessor, ReportGenerator
+from models.receipt_model import ReceiptProcessor, ReportGenerator, SummaryAggregator
+from models.extraction_cache import ExtractionCache
+from models.image_preprocessor import ImagePreprocessor, DEFAULT_MAX_EDGE
+from models.duplicate_detector import DuplicateDetector
+from models.batch_journal import BatchJournal, file_sha256
+from models.folder_scanner import FolderWatcher, scan_image_files
+from models.receipt_store import ReceiptStore
+from models.receipt_retriever import ReceiptRetriever
+from models.receipt_types import Receipt
 from models.rag_model import ReceiptRAG
+from models.context_store import create_context_store
+from models.metrics import metrics
+from models.model_backend import create_backend
+from models.request_scheduler import RequestScheduler
+from models.extraction_router import ExtractionTier, DEFAULT_ESCALATION_MODEL, DEFAULT_ESCALATION_MAX_EDGE
 from views.receipt_view import ReceiptFormatter, CSVExporter, FileHandler
 
+# Receipts are written to the store in bulk, this many at a time.
+STORE_BATCH_SIZE = 50
+
 
 class ReceiptController:
     """Main controller for receipt processing operations."""
     
-    def __init__(self):
-        self.processor = ReceiptProcessor()
+    def __init__(self, concurrency: int = 1, use_cache: bool = True, preprocess: bool = True,
+                 max_edge: int = DEFAULT_MAX_EDGE, dedup: bool = True, pack_size: int = 1, backend=None,
+                 escalate: bool = True, escalation_backend=None):
+        self.concurrency = concurrency
+        self.cache = ExtractionCache(enabled=use_cache)
+        self.preprocessor = ImagePreprocessor(max_edge=max_edge, enabled=preprocess)
+        # One paced, retrying backend serves extraction and chat.
+        self.backend = RequestScheduler(backend or create_backend())
+        escalation = None
+        if escalate:
+            # Receipts failing the local checks are re-read by a stronger model, at a higher resolution.
+            escalation = ExtractionTier(
+                'strong',
+                RequestScheduler(escalation_backend or create_backend(model_name=DEFAULT_ESCALATION_MODEL)),
+                ImagePreprocessor(max_edge=max(max_edge, DEFAULT_ESCALATION_MAX_EDGE), enabled=preprocess),
+                strict=True,
+            )
+        self.processor = ReceiptProcessor(cache=self.cache, preprocessor=self.preprocessor, pack_size=pack_size,
+                                          backend=self.backend, escalation=escalation)
+        self.duplicate_detector = DuplicateDetector(enabled=dedup)
+        self.store = ReceiptStore()
         self.report_generator = ReportGenerator()
         self.formatter = ReceiptFormatter()
         self.csv_exporter = CSVExporter()
         self.file_handler = FileHandler()
-        self.rag = ReceiptRAG()
+        self.context_store = create_context_store()
+        self._rag = None
+        self._rag_lock = threading.Lock()
+    
+    @property
+    def rag(self) -> ReceiptRAG:
+        """The receipt chat model, created on first use since batch runs never need it."""
+        if self._rag is None:
+            with self._rag_lock:
+                if self._rag is None:
+                    self._rag = ReceiptRAG(retriever=ReceiptRetriever(self.store), backend=self.backend)
+        return self._rag
     
-    def process_single_receipt(self, image_path: str, event_name: str = None) -> dict | None:
-        """Process a single receipt and return the data."""
-        return self.processor.process_single_receipt(image_path, event_name)
+    def process_single_receipt(self, image_path: str, event_name: str = None,
+                               image_bytes: bytes | None = None) -> Receipt | None:
+        """Process a single receipt, record it in the store and return the data.
+
+        With ``image_bytes`` the image is processed from memory and ``image_path`` only names it.
+        """
+        receipt_data = self.processor.process_single_receipt(image_path, event_name, image_bytes)
+        if receipt_data:
+            self.store.add_receipts([receipt_data])
+        return receipt_data
     
-    def format_single_receipt_summary(self, receipt_data: dict) -> str:
+    def format_single_receipt_summary(self, receipt_data: Receipt) -> str:
         """Format a single receipt summary."""
         return self.formatter.format_single_receipt_summary(receipt_data)
     
@@ -38,53 +91,239 @@ class ReceiptController:
     
     def ensure_results_folders(self):
         """Create results folders if they don't exist."""
-        for folder in ['results/single', 'results/events', 'results/batch']:
+        for folder in ['results/single', 'results/events', 'results/batch', 'results/history']:
             os.makedirs(folder, exist_ok=True)
     
-    def process_and_generate_reports(self, image_paths: list[str], event_name: str, output_folder: str):
-        """Process images and generate both CSV and summary reports."""
+    def process_and_generate_reports(self, image_paths: list[str], event_name: str, output_folder: str,
+                                     journal: BatchJournal | None = None, resume: bool = False):
+        """Process images and generate both CSV and summary reports.
+
+        With a ``journal``, every completed receipt is recorded as it finishes.
+        With ``resume`` as well, receipts already in the journal are not
+        processed again and their stored results are merged into the reports.
+        Returns the paths of images that could not be processed.
+        """
         if not image_paths:
             print(f"No images found for processing.")
-            return
+            return []
+        
+        # Images are hashed before extraction; extracted receipts then confirm or rule out duplicates
+        self.duplicate_detector.prepare(image_paths, event_name)
+        duplicates = []
+        
+        resumed_receipts = []
+        content_hashes = {}
+        if journal:
+            image_paths, resumed_receipts, content_hashes = self._apply_journal(image_paths, journal, resume)
             
-        receipts_data = self.processor.process_event_receipts(image_paths, event_name)
-        if not receipts_data:
-            print("\nProcessing complete. No receipts were successfully analyzed.")
-            return
-
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         event_safe = re.sub(r'[^a-zA-Z0-9_-]', '_', event_name)
         base_filename = f"{event_safe}_{timestamp}"
-        
-        # Export CSV
         csv_filename = os.path.join(output_folder, f"{base_filename}_expenses.csv")
-        self.csv_exporter.export_to_csv(receipts_data, csv_filename)
+        summary_filename = os.path.join(output_folder, f"{base_filename}_summary.txt")
+        
+        # Stream receipts into the CSV, the store and the running report totals as they finish
+        aggregator = SummaryAggregator()
+        store_buffer = []
+        unprocessed = set(image_paths)
+        receipts = self.processor.iter_event_receipts(image_paths, event_name, self.concurrency)
+        with self.csv_exporter.open_sink(csv_filename) as csv_sink:
+            
+            def add(receipt_data):
+                duplicate = self.duplicate_detector.check(receipt_data)
+                if duplicate:
+                    print(f"Skipping {duplicate['file_name']}: duplicate of {duplicate['duplicate_of']}")
+                    duplicates.append(duplicate)
+                    return
+                csv_sink.write_receipt(receipt_data)
+                aggregator.add(receipt_data)
+                store_buffer.append(receipt_data)
+                if len(store_buffer) >= STORE_BATCH_SIZE:
+                    self.store.add_receipts(store_buffer)
+                    store_buffer.clear()
+            
+            try:
+                for receipt_data in resumed_receipts:
+                    add(receipt_data)
+                for receipt_data in receipts:
+                    unprocessed.discard(receipt_data.file_path)
+                    if journal:
+                        path = receipt_data.file_path
+                        journal.record(path, content_hashes[path], receipt_data)
+                    add(receipt_data)
+            except BaseException:
+                self.store.add_receipts(store_buffer)
+                if aggregator.receipt_count:
+                    print(f"\nRun interrupted after {aggregator.receipt_count} receipt(s); saving partial results.")
+                    print(f"Partial CSV report: {csv_filename}")
+                    self._save_summary(aggregator, duplicates, summary_filename)
+                raise
+        
+        self.store.add_receipts(store_buffer)
+        self.print_cache_stats()
+        self.print_payload_stats()
+        self.print_request_stats()
+        failed = [path for path in image_paths if path in unprocessed]
+        if not aggregator.receipt_count:
+            print("\nProcessing complete. No receipts were successfully analyzed.")
+            return failed
+
         print(f"\nCSV report exported: {csv_filename}")
 
         # Generate and save summary report
-        summary_report = self.report_generator.generate_summary_report(receipts_data)
-        summary_filename = os.path.join(output_folder, f"{base_filename}_summary.txt")
-        self.file_handler.save_text_file(summary_filename, summary_report)
+        summary_report = self._save_summary(aggregator, duplicates, summary_filename)
         print(f"Summary report generated: {summary_filename}")
         
         # Print summary to console
         print("\n" + "="*50)
         print(summary_report)
         print("="*50 + "\n")
+        return failed
+    
+    def _apply_journal(self, image_paths: list[str], journal: BatchJournal, resume: bool):
+        """Split images into those still to process and receipts restored from the journal.
+
+        Returns the remaining paths, the restored receipts and each remaining
+        path's content hash for journaling.
+        """
+        completed = journal.load() if resume else {}
+        if not resume:
+            journal.reset()
+        
+        remaining = []
+        resumed_receipts = []
+        content_hashes = {}
+        for path in image_paths:
+            try:
+                content_hash = file_sha256(path)
+            except OSError:
+                remaining.append(path)
+                content_hashes[path] = ''
+                continue
+            stored = completed.get(journal.make_key(path, content_hash))
+            if stored is not None:
+                resumed_receipts.append(stored)
+            else:
+                remaining.append(path)
+                content_hashes[path] = content_hash
+        
+        if resume:
+            print(f"Resuming: {len(resumed_receipts)} receipt(s) already completed, {len(remaining)} remaining.")
+        return remaining, resumed_receipts, content_hashes
+    
+    def _save_summary(self, aggregator: SummaryAggregator, duplicates: list[dict], summary_filename: str) -> str:
+        """Render the summary report from running totals and save it."""
+        summary_report = self.report_generator.render_summary_report(aggregator, duplicates)
+        self.file_handler.save_text_file(summary_filename, summary_report)
+        return summary_report
+    
+    def print_cache_stats(self):
+        """Print extraction cache hit/miss counters, if the cache is in use."""
+        if not self.cache.enabled:
+            return
+        stats = self.cache.stats()
+        print(f"\nExtraction cache: {stats['hits']} hit(s), {stats['misses']} miss(es) "
+              f"({stats['hit_rate']:.0%} hit rate)")
+    
+    def print_payload_stats(self):
+        """Print how much pre-processing shrank the uploaded image payloads."""
+        totals = self.preprocessor.totals()
+        if not totals['images'] or not totals['original_bytes']:
+            return
+        saved = 1 - totals['processed_bytes'] / totals['original_bytes']
+        # Tiles of tall receipts are sent at a higher resolution, so they can outweigh the original.
+        change = f"{saved:.0%} smaller" if saved >= 0 else f"{-saved:.0%} larger"
+        print(f"Image payloads: {totals['original_bytes'] / 1024:.1f} KB -> "
+              f"{totals['processed_bytes'] / 1024:.1f} KB ({change}) "
+              f"across {totals['images']} upload(s)")
+    
+    def print_request_stats(self):
+        """Print model requests and tokens per receipt, comparing packed and one-per-call requests."""
+        stats = self.processor.request_summary()
+        total = stats['total']
+        if not total['requests']:
+            return
+        print(f"Model requests: {total['requests']} for {total['receipts']} receipt(s) "
+              f"({total['requests_per_receipt']:.2f} per receipt, {total['tokens_per_receipt']:.0f} tokens per receipt)")
+        packed, single = stats['packed'], stats['single']
+        if packed['requests']:
+            print(f"  packed:   {packed['requests']} request(s), {packed['requests_per_receipt']:.2f} per receipt, "
+                  f"{packed['tokens_per_receipt']:.0f} tokens per receipt, {packed['retried']} re-sent individually")
+            if single['requests']:
+                print(f"  baseline: {single['requests']} one-per-call request(s), "
+                      f"{single['tokens_per_receipt']:.0f} tokens per receipt")
+        tiled = stats['tiled']
+        if tiled['requests']:
+            print(f"  tiled:    {tiled['receipts']} tall receipt(s) split into {tiled['requests']} tile request(s)")
+        escalated = stats['escalated']
+        if escalated['requests']:
+            print(f"  escalated: {escalated['receipts']} receipt(s) re-sent to the stronger tier, "
+                  f"{escalated['tokens_per_receipt']:.0f} tokens per receipt")
+        for name, tier in self.processor.tier_summary().items():
+            if tier['receipts']:
+                print(f"  tier {name}: {tier['accepted']}/{tier['receipts']} passed checks ({tier['hit_rate']:.0%}), "
+                      f"{tier['mean_seconds']:.2f}s mean extraction")
+
+    def print_profile(self):
+        """Print per-stage latencies, byte and token counts and error counters for this run."""
+        print("\n" + "="*50)
+        print("PROFILE")
+        print(metrics.format_table())
+        print("="*50)
     
-    def process_batch_folder(self, folder_path: str):
-        """Process all images in a folder as a batch."""
+    def process_batch_folder(self, folder_path: str, resume: bool = False):
+        """Process all images in a folder as a batch.
+
+        Completed receipts are journaled under ``results/batch`` so an
+        interrupted run can continue with ``resume=True``.
+        """
         if not os.path.isdir(folder_path):
             print(f"Error: Batch folder '{folder_path}' not found.")
             return
         
-        image_extensions = ['*.png', '*.jpg', '*.jpeg', '*.tiff', '*.bmp']
-        image_files = []
-        for ext in image_extensions:
-            image_files.extend(glob.glob(os.path.join(folder_path, ext)))
+        image_files = scan_image_files(folder_path)
+        
+        event_name = os.path.basename(os.path.normpath(folder_path))
+        event_safe = re.sub(r'[^a-zA-Z0-9_-]', '_', event_name)
+        journal = BatchJournal(os.path.join('results/batch', f"{event_safe}_journal.jsonl"))
+        self.process_and_generate_reports(image_files, event_name, 'results/batch', journal=journal, resume=resume)
+    
+    def watch_batch_folder(self, folder_path: str, interval: float = 10.0):
+        """Continuously process receipts added to or changed in a folder."""
+        if not os.path.isdir(folder_path):
+            print(f"Error: Batch folder '{folder_path}' not found.")
+            return
         
         event_name = os.path.basename(os.path.normpath(folder_path))
-        self.process_and_generate_reports(image_files, event_name, 'results/batch')
+        event_safe = re.sub(r'[^a-zA-Z0-9_-]', '_', event_name)
+        watcher = FolderWatcher(folder_path, os.path.join('results/batch', f"{event_safe}_watch_index.json"), interval)
+        watcher.watch(lambda paths: self.process_and_generate_reports(paths, event_name, 'results/batch'))
+    
+    def generate_history_reports(self, **filters):
+        """Build a CSV and summary from stored receipts matching ``filters``.
+
+        Accepts the keyword filters of ``ReceiptStore.iter_receipts``.
+        """
+        label = '_'.join(str(v) for v in filters.values() if v is not None) or 'all'
+        label = re.sub(r'[^a-zA-Z0-9_-]', '_', label)
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        base_filename = os.path.join('results/history', f"history_{label}_{timestamp}")
+        
+        aggregator = SummaryAggregator()
+        with self.csv_exporter.open_sink(f"{base_filename}_expenses.csv") as csv_sink:
+            for receipt_data in self.store.iter_receipts(**filters):
+                csv_sink.write_receipt(receipt_data)
+                aggregator.add(receipt_data)
+        
+        if not aggregator.receipt_count:
+            print("No stored receipts match the given filters.")
+            return
+        
+        print(f"CSV report exported: {base_filename}_expenses.csv")
+        summary_report = self._save_summary(aggregator, [], f"{base_filename}_summary.txt")
+        print("\n" + "="*50)
+        print(summary_report)
+        print("="*50 + "\n")
     
     def process_event_images(self, image_paths: list[str], event_name: str):
         """Process multiple images for a specific event."""
@@ -106,14 +345,22 @@ class ReceiptController:
         else:
             print("Could not process the receipt.")
     
-    def load_receipt_for_questions(self, receipt_data: dict):
-        """Load receipt data into RAG system for questions."""
-        self.rag.load_receipt_context(receipt_data)
+    def load_receipt_for_questions(self, session_id: str, receipt_data: Receipt):
+        """Make a receipt the subject of a session's questions."""
+        self.context_store.put(session_id, receipt_data)
+    
+    def ask_receipt_question(self, session_id: str, question: str) -> str:
+        """Ask a question about the receipt loaded for a session."""
+        return self.rag.ask_question(question, self.context_store.get(session_id))
+    
+    def ask_receipt_question_stream(self, session_id: str, question: str):
+        """Return an iterator over the answer's pieces as they are generated."""
+        return self.rag.ask_question_stream(question, self.context_store.get(session_id))
     
-    def ask_receipt_question(self, question: str) -> str:
-        """Ask a question about the loaded receipt."""
-        return self.rag.ask_question(question)
+    def get_suggested_questions(self, session_id: str) -> list:
+        """Get suggested questions for the receipt loaded for a session."""
+        return self.rag.get_suggested_questions(self.context_store.get(session_id))
     
-    def get_suggested_questions(self) -> list:
-        """Get suggested questions for the current receipt."""
-        return self.rag.get_suggested_questions()
+    def has_receipt_for_questions(self, session_id: str) -> bool:
+        """Return whether a session has a receipt loaded that has not expired."""
+        return self.context_store.get(session_id) is not None
@@ -7,7 +7,11 @@ Processes receipt images for business expense tracking and reporting.
 import argparse
 import sys
 from dotenv import load_dotenv
-from controllers.receipt_controller import ReceiptController
+from models.image_preprocessor import DEFAULT_MAX_EDGE
+from models.receipt_model import MAX_PACK_SIZE
+from models.gemini_client import MissingAPIKeyError
+from models.model_backend import BACKENDS, create_backend
+from models.extraction_router import DEFAULT_ESCALATION_MODEL
 
 # Load environment variables from .env file
 load_dotenv()
@@ -26,9 +30,44 @@ Single Receipt: Processes one image and prints the summary.
 Event Processing: Processes multiple specified images for an event.
   python3 receipt_processor.py --event "Q1 Team Meeting" receipt1.jpg receipt2.png
 
-Batch Processing: Processes all images in a folder, using the folder name as the event.
+Batch Processing: Processes all images in a folder and its subfolders, using the folder name as the event.
   python3 receipt_processor.py --batch ./business_receipts/
 
+Watch Mode: Keeps polling a drop folder and processes only new or changed receipts.
+  python3 receipt_processor.py --batch ./business_receipts/ --watch
+
+Resuming: Continues an interrupted batch run without re-processing finished receipts.
+  python3 receipt_processor.py --batch ./business_receipts/ --resume
+
+History Reports: Queries every receipt processed so far, across runs and events.
+  python3 receipt_processor.py --history --category "Food & Beverage" --min-amount 75 --since 2025-01-01
+
+Concurrency: Keeps N receipt extractions in flight for event and batch runs.
+  python3 receipt_processor.py --batch ./business_receipts/ --concurrency 8
+
+Packing: Sends up to K receipts per model request, for batches of small receipts.
+  python3 receipt_processor.py --batch ./business_receipts/ --pack 5
+
+Profiling: Prints per-stage latency (p50/p95), payload bytes, tokens and errors at the end.
+  python3 receipt_processor.py --batch ./business_receipts/ --profile
+
+Simulated Backend: Runs the whole pipeline offline against a simulated model (no API key needed).
+  python3 receipt_processor.py --batch ./business_receipts/ --backend simulated
+
+Extraction results are cached on disk by image content, so unchanged receipts are
+not re-sent to the model. Use --no-cache to force fresh extraction.
+
+Images are downscaled, cropped and re-encoded before upload; --max-edge sets the
+target resolution and --no-preprocess sends the original file.
+
+Duplicate receipts (the same receipt photographed and screenshotted) are left
+out of the reports: an image that looks like an earlier receipt and has the same
+merchant, date and total is listed as a duplicate; use --no-dedup to disable.
+
+Every extraction is checked locally (line items add up, completeness grade).
+Receipts that fail are re-read by a stronger model at a higher resolution;
+use --no-escalate to keep the first extraction.
+
 REQUIREMENTS:
 - Python 3
 - A GEMINI_API_KEY set as an environment variable
@@ -38,18 +77,98 @@ REQUIREMENTS:
     parser.add_argument('images', nargs='*', help='One or more receipt image files to process.')
     parser.add_argument('--event', help='An event name to associate with multiple receipts.')
     parser.add_argument('--batch', help='Path to a folder containing receipt images to process as a batch.')
+    parser.add_argument('--resume', action='store_true',
+                        help='With --batch, skip receipts completed by an earlier interrupted run of the same folder.')
+    parser.add_argument('--watch', action='store_true',
+                        help='With --batch, keep polling the folder and process receipts as they are added or changed.')
+    parser.add_argument('--watch-interval', type=float, default=10.0, metavar='SECONDS',
+                        help='Polling interval for --watch (default: 10).')
+    parser.add_argument('--concurrency', type=int, default=1, metavar='N',
+                        help='Number of receipts to analyze concurrently (default: 1).')
+    parser.add_argument('--pack', type=int, default=1, metavar='K',
+                        help=f'Send up to K receipts per model request in event and batch runs '
+                             f'(default: 1, max: {MAX_PACK_SIZE}).')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Bypass the on-disk extraction cache and always call the model.')
+    parser.add_argument('--no-preprocess', action='store_true',
+                        help='Send images at full resolution instead of downscaling and re-encoding them.')
+    parser.add_argument('--no-dedup', action='store_true',
+                        help='Extract every image even if it looks like a duplicate of another receipt.')
+    parser.add_argument('--no-escalate', action='store_true',
+                        help='Keep extractions that fail the local checks instead of re-sending them to a stronger model.')
+    parser.add_argument('--profile', action='store_true',
+                        help='Print time spent per pipeline stage, bytes, tokens and errors when the run ends.')
+    parser.add_argument('--backend', choices=BACKENDS,
+                        help='Model backend to use (default: RECEIPT_MODEL_BACKEND, or gemini).')
+    parser.add_argument('--max-edge', type=int, default=DEFAULT_MAX_EDGE, metavar='PX',
+                        help=f'Longest image edge sent to the model after pre-processing (default: {DEFAULT_MAX_EDGE}).')
+    
+    history = parser.add_argument_group('history reports (with --history)')
+    history.add_argument('--history', action='store_true',
+                         help='Build a report from previously processed receipts in the local store.')
+    history.add_argument('--merchant', help='Only include receipts from this merchant.')
+    history.add_argument('--category', help='Only include line items in this category.')
+    history.add_argument('--min-amount', type=float, help='Only include line items of at least this amount.')
+    history.add_argument('--max-amount', type=float, help='Only include line items of at most this amount.')
+    history.add_argument('--since', metavar='YYYY-MM-DD', help='Only include receipts dated on or after this day.')
+    history.add_argument('--until', metavar='YYYY-MM-DD', help='Only include receipts dated on or before this day.')
     
     args = parser.parse_args()
     
-    if not args.images and not args.batch:
+    if args.concurrency < 1:
+        parser.error('--concurrency must be at least 1')
+    if not 1 <= args.pack <= MAX_PACK_SIZE:
+        parser.error(f'--pack must be between 1 and {MAX_PACK_SIZE}')
+    if args.resume and not args.batch:
+        parser.error('--resume can only be used with --batch')
+    if args.watch and not args.batch:
+        parser.error('--watch can only be used with --batch')
+    
+    if not args.images and not args.batch and not args.history:
         parser.print_help()
         sys.exit(1)
     
-    controller = ReceiptController()
+    # Imported after argument parsing so that --help and usage errors return immediately.
+    from controllers.receipt_controller import ReceiptController
+    controller = ReceiptController(
+        concurrency=args.concurrency,
+        use_cache=not args.no_cache,
+        preprocess=not args.no_preprocess,
+        max_edge=args.max_edge,
+        dedup=not args.no_dedup,
+        pack_size=args.pack,
+        backend=create_backend(args.backend),
+        escalate=not args.no_escalate,
+        escalation_backend=None if args.no_escalate else create_backend(args.backend, DEFAULT_ESCALATION_MODEL),
+    )
     controller.ensure_results_folders()
     
-    if args.batch:
-        controller.process_batch_folder(args.batch)
+    try:
+        run(controller, args)
+    except MissingAPIKeyError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    finally:
+        if args.profile:
+            controller.print_profile()
+
+
+def run(controller, args):
+    """Run the mode selected on the command line."""
+    if args.history:
+        controller.generate_history_reports(
+            event=args.event,
+            merchant=args.merchant,
+            category=args.category,
+            min_amount=args.min_amount,
+            max_amount=args.max_amount,
+            date_from=args.since,
+            date_to=args.until,
+        )
+    elif args.batch and args.watch:
+        controller.watch_batch_folder(args.batch, interval=args.watch_interval)
+    elif args.batch:
+        controller.process_batch_folder(args.batch, resume=args.resume)
     elif args.event:
         if not args.images:
             print("Error: Please specify at least one image file for --event mode.")
@@ -0,0 +1,61 @@
+"""
+Append-only journal of completed receipts, used to resume interrupted batch runs.
+"""
+
+import os
+import json
+import hashlib
+
+from models.receipt_types import Receipt
+
+
+def file_sha256(path: str) -> str:
+    """Return the SHA-256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class BatchJournal:
+    """JSONL journal with one line per completed receipt.
+
+    Entries are keyed by absolute path and content hash, so an image that was
+    edited or replaced since it was journaled is processed again on resume.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    @staticmethod
+    def make_key(image_path: str, content_hash: str) -> str:
+        return f"{os.path.abspath(image_path)}:{content_hash}"
+
+    def load(self) -> dict[str, Receipt]:
+        """Return journaled receipts keyed by path and content hash."""
+        completed = {}
+        if not os.path.exists(self.path):
+            return completed
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    completed[self.make_key(entry['path'], entry['sha256'])] = Receipt.from_dict(entry['receipt'])
+                except (ValueError, KeyError, AttributeError):
+                    # A run killed mid-write can leave a truncated last line.
+                    continue
+        return completed
+
+    def reset(self):
+        """Start a fresh journal, discarding earlier entries."""
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        open(self.path, 'w', encoding='utf-8').close()
+
+    def record(self, image_path: str, content_hash: str, receipt: Receipt):
+        """Append a completed receipt and flush it to disk immediately."""
+        entry = {'path': os.path.abspath(image_path), 'sha256': content_hash, 'receipt': receipt.to_dict()}
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
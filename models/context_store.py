@@ -0,0 +1,181 @@
+"""
+Per-session storage of the receipt a chat user is asking questions about,
+and of upload job status where it has to be shared between worker processes.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from models.receipt_types import Receipt
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BACKEND = os.getenv('RECEIPT_CONTEXT_STORE', 'memory')
+DEFAULT_CONTEXT_DB = os.getenv('RECEIPT_CONTEXT_DB', os.path.join(PROJECT_ROOT, 'results', 'sessions.db'))
+DEFAULT_TTL_SECONDS = float(os.getenv('RECEIPT_CONTEXT_TTL', '3600'))
+DEFAULT_MAX_SESSIONS = int(os.getenv('RECEIPT_CONTEXT_MAX_SESSIONS', '10000'))
+
+
+class MemoryContextStore:
+    """In-process LRU of receipts by session ID, with a sliding TTL.
+
+    Reading or writing a session moves it to the back of the LRU order and
+    restarts its TTL, so the front always holds the entry that expires
+    first. Expired and least recently used entries are both evicted from
+    the front, and every operation is O(1) amortized. Only suitable for a
+    single worker process.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_SESSIONS, ttl_seconds: float = DEFAULT_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> Receipt | None:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                return None
+            receipt, expires = entry
+            if expires <= now:
+                del self._entries[session_id]
+                return None
+            self._entries[session_id] = (receipt, now + self.ttl_seconds)
+            self._entries.move_to_end(session_id)
+            return receipt
+
+    def put(self, session_id: str, receipt: Receipt):
+        now = time.monotonic()
+        with self._lock:
+            self._entries[session_id] = (receipt, now + self.ttl_seconds)
+            self._entries.move_to_end(session_id)
+            self._evict(now)
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._entries.pop(session_id, None)
+
+    def put_job(self, job_id: str, job: dict):
+        """Jobs are only tracked by the job queue of the single worker process."""
+
+    def get_job(self, job_id: str) -> dict | None:
+        return None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _evict(self, now: float):
+        entries = self._entries
+        while entries:
+            oldest_id, (_, expires) = next(iter(entries.items()))
+            if expires > now and len(entries) <= self.max_entries:
+                break
+            del entries[oldest_id]
+
+
+class SQLiteContextStore:
+    """Receipts by session ID in a local SQLite file shared by worker processes.
+
+    Lookups go through the primary key. Entries expire about ``ttl_seconds``
+    after they were last written or read, and expired rows are swept
+    periodically on write. Upload jobs are kept in the same file, so any
+    worker can report a job that another one ran. Point
+    ``RECEIPT_CONTEXT_DB`` at the same file in every worker process.
+    """
+
+    # Sweep expired rows on every Nth write.
+    SWEEP_EVERY = 100
+
+    def __init__(self, db_path: str = DEFAULT_CONTEXT_DB, ttl_seconds: float = DEFAULT_TTL_SECONDS):
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS session_context ("
+            "session_id TEXT PRIMARY KEY, receipt TEXT NOT NULL, expires REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "job_id TEXT PRIMARY KEY, job TEXT NOT NULL, expires REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, session_id: str) -> Receipt | None:
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT receipt, expires FROM session_context WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                self._conn.execute("DELETE FROM session_context WHERE session_id = ?", (session_id,))
+                return None
+            if row[1] - now < self.ttl_seconds * 0.9:
+                # Refresh the TTL at most every tenth of it, so most reads do not write.
+                self._conn.execute("UPDATE session_context SET expires = ? WHERE session_id = ?",
+                                   (now + self.ttl_seconds, session_id))
+        return Receipt.from_dict(json.loads(row[0]))
+
+    def put(self, session_id: str, receipt: Receipt):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO session_context (session_id, receipt, expires) VALUES (?, ?, ?)",
+                (session_id, json.dumps(receipt.to_dict()), now + self.ttl_seconds),
+            )
+            self._count_write(now)
+
+    def delete(self, session_id: str):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM session_context WHERE session_id = ?", (session_id,))
+
+    def put_job(self, job_id: str, job: dict):
+        """Store a JSON-serializable snapshot of a job's status, replacing any earlier one."""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO jobs (job_id, job, expires) VALUES (?, ?, ?)",
+                (job_id, json.dumps(job), now + self.ttl_seconds),
+            )
+            self._count_write(now)
+
+    def get_job(self, job_id: str) -> dict | None:
+        with self._lock:
+            row = self._conn.execute("SELECT job, expires FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if row is None or row[1] <= time.time():
+            return None
+        return json.loads(row[0])
+
+    def _count_write(self, now: float):
+        self._writes += 1
+        if self._writes % self.SWEEP_EVERY == 0:
+            self._conn.execute("DELETE FROM session_context WHERE expires <= ?", (now,))
+            self._conn.execute("DELETE FROM jobs WHERE expires <= ?", (now,))
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM session_context").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def create_context_store(backend: str = None):
+    """Build the context store named by ``backend`` or ``RECEIPT_CONTEXT_STORE`` (``memory`` or ``sqlite``)."""
+    backend = (backend or DEFAULT_BACKEND).lower()
+    if backend == 'sqlite':
+        return SQLiteContextStore()
+    if backend != 'memory':
+        raise ValueError(f"Unknown context store backend: {backend!r} (expected 'memory' or 'sqlite')")
+    return MemoryContextStore()
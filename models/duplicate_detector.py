@@ -0,0 +1,228 @@
+"""
+Near-duplicate receipt detection using perceptual hashes.
+"""
+
+import os
+import json
+
+from models.receipt_types import Receipt
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_INDEX_PATH = os.getenv('RECEIPT_DEDUP_INDEX', os.path.join(PROJECT_ROOT, 'results', 'phash_index.jsonl'))
+# Hashes are HASH_SIZE x HASH_SIZE bits; images this many bits apart or fewer are compared by their fields.
+HASH_SIZE = 16
+DEFAULT_MAX_DISTANCE = int(os.getenv('RECEIPT_DEDUP_DISTANCE', '10'))
+
+
+def dhash(image_path: str, hash_size: int = HASH_SIZE) -> int:
+    """Compute a difference hash of the receipt content in an image.
+
+    Uniform borders are cropped first so the hash describes the printed
+    receipt rather than the surrounding background, and a re-photographed or
+    re-encoded copy stays close. Different receipts printed on the same
+    template can hash close too, so a match alone does not make a duplicate.
+    """
+    # PIL is imported on first use so that starting the CLI does not pay for it.
+    from PIL import Image, ImageChops
+    image = Image.open(image_path)
+    image.draft('L', (hash_size * 32, hash_size * 32))
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGBA', image.size, (255, 255, 255, 255))
+        image = Image.alpha_composite(background, image)
+    image = image.convert('L')
+    image.thumbnail((512, 512))
+
+    # A photo has the background around the paper, then the paper's own margin: crop both.
+    for _ in range(2):
+        corner = Image.new('L', image.size, image.getpixel((0, 0)))
+        bbox = ImageChops.difference(image, corner).point(lambda p: 255 if p > 40 else 0).getbbox()
+        if not bbox or bbox == (0, 0) + image.size:
+            break
+        # Skip the blurred edge of the paper, so the next pass starts on its margin.
+        inset = max(2, min(bbox[2] - bbox[0], bbox[3] - bbox[1]) // 100)
+        image = image.crop((bbox[0] + inset, bbox[1] + inset, bbox[2] - inset, bbox[3] - inset))
+
+    pixels = image.resize((hash_size + 1, hash_size), Image.LANCZOS).tobytes()
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+class HashIndex:
+    """Multi-index hash table for Hamming-distance lookups over fixed-size hashes.
+
+    Each hash of ``bits`` bits is split into ``bands`` substrings, each with its own
+    bucket table. If two hashes are within ``r`` bits, then by pigeonhole at
+    least one band differs by at most ``r // bands`` bits. So a lookup only
+    probes the buckets near each band of the query, which stays fast as the
+    index grows.
+    """
+
+    def __init__(self, bits: int = HASH_SIZE * HASH_SIZE, bands: int = 16):
+        self.bands = bands
+        self.band_bits = bits // bands
+        self.tables = [{} for _ in range(bands)]
+        self.size = 0
+
+    def add(self, key: int, value):
+        """Insert a hash with an associated value."""
+        self.size += 1
+        for table, band in zip(self.tables, self._split(key)):
+            table.setdefault(band, []).append((key, value))
+
+    def remove(self, key: int, value):
+        """Remove a hash added with ``value``."""
+        for table, band in zip(self.tables, self._split(key)):
+            bucket = table.get(band, [])
+            bucket[:] = [pair for pair in bucket if pair[1] is not value]
+        self.size -= 1
+
+    def find(self, key: int, max_distance: int) -> list[tuple[int, object]]:
+        """Return ``(distance, value)`` pairs within ``max_distance`` of ``key``."""
+        band_radius = max_distance // self.bands
+        matches = []
+        seen = set()
+        for table, band in zip(self.tables, self._split(key)):
+            for probe in self._neighbours(band, band_radius):
+                for candidate, value in table.get(probe, ()):
+                    if id(value) in seen:
+                        continue
+                    seen.add(id(value))
+                    distance = (key ^ candidate).bit_count()
+                    if distance <= max_distance:
+                        matches.append((distance, value))
+        return matches
+
+    def _split(self, key: int) -> list[int]:
+        mask = (1 << self.band_bits) - 1
+        return [(key >> (i * self.band_bits)) & mask for i in range(self.bands)]
+
+    def _neighbours(self, band: int, radius: int):
+        """Yield every band value within ``radius`` bit flips of ``band``."""
+        yield band
+        if radius == 0:
+            return
+        frontier = [(band, -1)]
+        for _ in range(radius):
+            next_frontier = []
+            for value, last_bit in frontier:
+                for bit in range(last_bit + 1, self.band_bits):
+                    flipped = value ^ (1 << bit)
+                    yield flipped
+                    next_frontier.append((flipped, bit))
+            frontier = next_frontier
+
+
+def _same_receipt(entry: dict, receipt: Receipt) -> bool:
+    """Whether an indexed receipt's merchant, date and total match an extracted receipt's."""
+    return (bool(receipt.receipt_total_cents) and entry.get('total_cents') == receipt.receipt_total_cents
+            and entry.get('date') == receipt.date
+            and (entry.get('merchant') or '').strip().lower() == receipt.merchant.strip().lower())
+
+
+class DuplicateDetector:
+    """Finds receipts that repeat one already extracted, in the same batch or an earlier run.
+
+    Receipts printed on the same merchant template look alike, so a close
+    perceptual hash only makes an image a candidate. It is a duplicate if its
+    extracted merchant, date and total also match the receipt it looks like.
+    Every receipt kept is appended to a JSONL index with those fields, so a
+    later batch also catches copies of receipts processed in earlier runs.
+    """
+
+    def __init__(self, index_path: str = DEFAULT_INDEX_PATH, max_distance: int = DEFAULT_MAX_DISTANCE,
+                 enabled: bool = True):
+        self.index_path = index_path
+        self.max_distance = max_distance
+        self.enabled = enabled
+        self.index = HashIndex()
+        self._loaded = False
+        # Absolute path -> (hash, index entry) for images hashed but not yet checked
+        self._hashed = {}
+        # Absolute path -> earlier receipts the image looks like, as (distance, index entry), closest first
+        self._candidates = {}
+        self._batch_paths = set()
+
+    def prepare(self, image_paths: list[str], event_name: str):
+        """Hash images and find the earlier receipts each one looks like.
+
+        Images are compared with each other in the given order, which should
+        be the order their receipts are passed to ``check``.
+        """
+        if not self.enabled or not image_paths:
+            return
+        self._load()
+        self._batch_paths = {os.path.abspath(p) for p in image_paths}
+        for path in image_paths:
+            abs_path = os.path.abspath(path)
+            try:
+                value = dhash(path)
+            except Exception as e:
+                print(f"Warning: could not hash {path} for duplicate detection: {e}")
+                continue
+            matches = sorted(self.index.find(value, self.max_distance), key=lambda m: m[0])
+            # The same file seen in an earlier run is a re-run, not a duplicate.
+            self._candidates[abs_path] = [(distance, entry) for distance, entry in matches
+                                          if entry['path'] != abs_path]
+            if any(entry['path'] == abs_path and distance == 0 for distance, entry in matches):
+                continue
+            entry = {'hash': f"{value:0{HASH_SIZE * HASH_SIZE // 4}x}", 'path': abs_path, 'event': event_name}
+            self.index.add(value, entry)
+            self._hashed[abs_path] = (value, entry)
+
+    def check(self, receipt: Receipt) -> dict | None:
+        """Return a duplicate entry if a receipt repeats an earlier one, or None if it is kept.
+
+        A kept receipt's hash and fields are saved, so later receipts are
+        compared with it. Receipts whose image was not prepared are kept.
+        """
+        abs_path = os.path.abspath(receipt.file_path)
+        hashed = self._hashed.pop(abs_path, None)
+        for distance, original in self._candidates.pop(abs_path, []):
+            if _same_receipt(original, receipt):
+                if hashed is not None:
+                    self.index.remove(*hashed)
+                return {
+                    'file_name': os.path.basename(receipt.file_path),
+                    'duplicate_of': os.path.basename(original['path']),
+                    'duplicate_of_event': original['event'],
+                    'previous_run': original['path'] not in self._batch_paths,
+                    'distance': distance,
+                }
+        if hashed is not None:
+            entry = hashed[1]
+            entry.update(merchant=receipt.merchant, date=receipt.date, total_cents=receipt.receipt_total_cents)
+            self._append([entry])
+        return None
+
+    def _load(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        if not os.path.exists(self.index_path):
+            return
+        with open(self.index_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    # Entries written before hashes were finer and carried fields cannot be compared.
+                    if len(entry['hash']) != HASH_SIZE * HASH_SIZE // 4 or 'total_cents' not in entry:
+                        continue
+                    self.index.add(int(entry['hash'], 16), entry)
+                except (ValueError, KeyError, TypeError):
+                    continue
+
+    def _append(self, entries: list[dict]):
+        if not entries:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+            with open(self.index_path, 'a', encoding='utf-8') as f:
+                for entry in entries:
+                    f.write(json.dumps(entry) + '\n')
+        except OSError as e:
+            print(f"Warning: could not update duplicate index: {e}")
@@ -0,0 +1,120 @@
+"""
+Persistent, content-addressed cache for receipt extractions.
+"""
+
+import os
+import json
+import hashlib
+import threading
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_CACHE_DIR = os.getenv('RECEIPT_CACHE_DIR', os.path.join(PROJECT_ROOT, 'results', 'cache'))
+DEFAULT_MAX_BYTES = int(os.getenv('RECEIPT_CACHE_MAX_MB', '256')) * 1024 * 1024
+
+
+class ExtractionCache:
+    """On-disk LRU cache of parsed receipt data keyed by image content hash.
+
+    Entries are JSON files named after a SHA-256 of the image bytes plus the
+    model/prompt version, so a changed image or prompt never hits a stale entry.
+    Recency is tracked through file mtimes; the oldest entries are evicted once
+    the cache grows past ``max_bytes``.
+    """
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES, enabled: bool = True):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._size = None
+
+    def make_key(self, image_bytes: bytes, *versions: str) -> str:
+        """Build a cache key from the image bytes and prompt/model version strings."""
+        digest = hashlib.sha256(image_bytes)
+        for part in versions:
+            digest.update(b'\0')
+            digest.update(str(part).encode('utf-8'))
+        return digest.hexdigest()
+
+    def get(self, key: str) -> dict | None:
+        """Return the cached extraction for ``key``, or None on a miss."""
+        if not self.enabled:
+            return None
+        path = self._entry_path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            os.utime(path)  # mark as recently used
+        except (OSError, json.JSONDecodeError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def put(self, key: str, data: dict):
+        """Store an extraction and evict least recently used entries if needed."""
+        if not self.enabled:
+            return
+        path = self._entry_path(key)
+        payload = json.dumps(data).encode('utf-8')
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(payload)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Warning: could not write extraction cache entry: {e}")
+            return
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan_size()
+            else:
+                self._size += len(payload)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def stats(self) -> dict:
+        """Return hit/miss counters for this cache instance."""
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': (self.hits / lookups) if lookups else 0.0,
+        }
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def _iter_entries(self):
+        if not os.path.isdir(self.cache_dir):
+            return
+        for shard in os.scandir(self.cache_dir):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith('.json'):
+                    yield entry
+
+    def _scan_size(self) -> int:
+        return sum(entry.stat().st_size for entry in self._iter_entries())
+
+    def _evict(self):
+        """Delete the least recently used entries until under the size limit."""
+        entries = sorted(
+            ((e.stat().st_mtime, e.stat().st_size, e.path) for e in self._iter_entries()),
+        )
+        self._size = sum(size for _, size, _ in entries)
+        target = int(self.max_bytes * 0.9)
+        for _, size, path in entries:
+            if self._size <= target:
+                break
+            try:
+                os.remove(path)
+                self._size -= size
+            except OSError:
+                continue
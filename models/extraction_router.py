@@ -0,0 +1,55 @@
+"""
+Extraction tiers and the local checks that decide when a receipt is escalated to the next one.
+"""
+
+import os
+from dataclasses import dataclass
+
+from models.image_preprocessor import ImagePreprocessor
+from models.receipt_types import Receipt, COMPLETENESS_GRADES, format_cents
+
+# Receipts failing the checks are re-extracted with this model; empty keeps the fast tier's model.
+DEFAULT_ESCALATION_MODEL = os.getenv('RECEIPT_ESCALATION_MODEL', 'gemini-1.5-pro')
+DEFAULT_ESCALATION_MAX_EDGE = int(os.getenv('RECEIPT_ESCALATION_MAX_EDGE', '2400'))
+# Extractions graded worse than this are escalated.
+DEFAULT_MIN_COMPLETENESS = os.getenv('RECEIPT_MIN_COMPLETENESS', 'C').strip().upper()
+# Rounding slack allowed between the line items and the subtotal.
+SUM_TOLERANCE_CENTS = 2
+
+
+@dataclass(slots=True)
+class ExtractionTier:
+    """A model, image resolution and prompt that receipts can be extracted with.
+
+    ``strict`` adds a self-check to the prompt: slower and longer answers,
+    for receipts a faster tier got wrong.
+    """
+
+    name: str
+    backend: object
+    preprocessor: ImagePreprocessor
+    strict: bool = False
+
+
+def check_receipt(receipt: Receipt | None, min_grade: str = DEFAULT_MIN_COMPLETENESS) -> list[str]:
+    """Return the reasons an extraction should be escalated, or an empty list if it passes.
+
+    An extraction passes if it parsed, its line items add up to the
+    subtotal (or the total less tax) and it is graded ``min_grade`` or better.
+    """
+    if receipt is None:
+        return ["response could not be parsed"]
+    problems = []
+    if not receipt.line_items:
+        problems.append("no line items")
+    items_cents = sum(item.amount_cents for item in receipt.line_items)
+    expected = receipt.subtotal_cents or receipt.receipt_total_cents - receipt.tax_cents
+    if not expected:
+        problems.append("no subtotal or total")
+    elif abs(items_cents - expected) > SUM_TOLERANCE_CENTS:
+        problems.append(f"line items sum to {format_cents(items_cents)}, not {format_cents(expected)}")
+    grade = receipt.completeness_score.strip().upper()
+    if (grade in COMPLETENESS_GRADES and min_grade in COMPLETENESS_GRADES
+            and COMPLETENESS_GRADES.index(grade) > COMPLETENESS_GRADES.index(min_grade)):
+        problems.append(f"completeness graded {grade}")
+    return problems
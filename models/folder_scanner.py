@@ -0,0 +1,153 @@
+"""
+Folder scanning for receipt images, with an incremental watch mode.
+"""
+
+import os
+import json
+import time
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.tiff', '.bmp')
+# A watched file that fails this many times is marked done until it changes.
+DEFAULT_MAX_ATTEMPTS = int(os.getenv('RECEIPT_WATCH_MAX_ATTEMPTS', '4'))
+
+
+def iter_image_entries(folder_path: str, recursive: bool = True):
+    """Yield ``os.DirEntry`` objects for receipt images under a folder.
+
+    Walks the tree once with ``os.scandir`` and matches extensions
+    case-insensitively. Hidden entries and symlinked directories are skipped.
+    """
+    stack = [folder_path]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    if entry.name.startswith('.'):
+                        continue
+                    if entry.is_dir(follow_symlinks=False):
+                        if recursive:
+                            stack.append(entry.path)
+                    elif entry.name.lower().endswith(IMAGE_EXTENSIONS) and entry.is_file():
+                        yield entry
+        except OSError as e:
+            print(f"Warning: could not scan {current}: {e}")
+
+
+def scan_image_files(folder_path: str, recursive: bool = True) -> list[str]:
+    """Return sorted paths of all receipt images under a folder."""
+    return sorted(entry.path for entry in iter_image_entries(folder_path, recursive))
+
+
+class FolderWatcher:
+    """Polls a folder and reports receipt images that are new or changed.
+
+    An index of ``(mtime, size)`` per file is kept in memory and saved to
+    ``index_path``, so a restarted watcher only picks up what changed while it
+    was down. A file is reported only once its signature is the same on two
+    polls in a row, so files still being copied in are not read half-written.
+    A file that fails is retried after a delay that doubles with every
+    attempt, and given up on after ``max_attempts`` until it changes.
+    """
+
+    def __init__(self, folder_path: str, index_path: str, interval: float = 10.0,
+                 max_attempts: int = DEFAULT_MAX_ATTEMPTS):
+        self.folder_path = folder_path
+        self.index_path = index_path
+        self.interval = interval
+        self.max_attempts = max_attempts
+        self.seen = self._load_index()
+        self._pending = {}
+        # path -> (signature, failed attempts, time of the next retry)
+        self._failures = {}
+
+    def poll(self) -> list[str]:
+        """Return paths that are new or changed since they were last marked done."""
+        ready = []
+        current = {}
+        for entry in iter_image_entries(self.folder_path):
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            signature = [stat.st_mtime_ns, stat.st_size]
+            current[entry.path] = signature
+            if self.seen.get(entry.path) == signature:
+                continue
+            if self._pending.get(entry.path) == signature:
+                failure = self._failures.get(entry.path)
+                if failure and failure[0] == signature and time.monotonic() < failure[2]:
+                    continue
+                ready.append(entry.path)
+        self._pending = {path: sig for path, sig in current.items() if self.seen.get(path) != sig}
+        self._failures = {path: failure for path, failure in self._failures.items()
+                          if self._pending.get(path) == failure[0]}
+        return sorted(ready)
+
+    def mark_done(self, paths: list[str]):
+        """Record paths as processed at their current signature and save the index."""
+        for path in paths:
+            signature = self._pending.pop(path, None)
+            if signature is not None:
+                self.seen[path] = signature
+        self._save_index()
+
+    def mark_failed(self, paths: list[str]):
+        """Schedule failed paths for a later retry, or mark them done once out of attempts."""
+        given_up = []
+        for path in paths:
+            signature = self._pending.get(path)
+            if signature is None:
+                continue
+            failure = self._failures.get(path)
+            attempts = failure[1] + 1 if failure and failure[0] == signature else 1
+            if attempts >= self.max_attempts:
+                self._failures.pop(path, None)
+                given_up.append(path)
+                print(f"Giving up on {path} after {attempts} failed attempt(s); it is retried if the file changes.")
+            else:
+                delay = self.interval * 2 ** attempts
+                self._failures[path] = (signature, attempts, time.monotonic() + delay)
+                print(f"Could not process {path} (attempt {attempts} of {self.max_attempts}); retrying in {delay:g}s.")
+        if given_up:
+            self.mark_done(given_up)
+
+    def watch(self, callback):
+        """Call ``callback(paths)`` with each new group of ready files until interrupted.
+
+        ``callback`` returns the paths it could not process. Only the others
+        are marked done; failed files, or all of them if ``callback`` raises,
+        are retried with backoff by ``mark_failed``.
+        """
+        print(f"Watching '{self.folder_path}' every {self.interval:g}s (Ctrl+C to stop)...")
+        try:
+            while True:
+                ready = self.poll()
+                if ready:
+                    print(f"\nDetected {len(ready)} new or changed receipt(s).")
+                    try:
+                        failed = set(callback(ready) or [])
+                    except Exception as e:
+                        print(f"Error processing receipts: {e}")
+                        failed = set(ready)
+                    self.mark_done([path for path in ready if path not in failed])
+                    self.mark_failed(sorted(failed))
+                time.sleep(self.interval)
+        except KeyboardInterrupt:
+            print("\nStopped watching.")
+
+    def _load_index(self) -> dict:
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_index(self):
+        try:
+            tmp_path = self.index_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.seen, f)
+            os.replace(tmp_path, self.index_path)
+        except OSError as e:
+            print(f"Warning: could not save watch index: {e}")
@@ -0,0 +1,49 @@
+"""
+Shared Gemini client, configured on first use.
+"""
+
+import os
+import threading
+
+MODEL_NAME = "gemini-1.5-flash"
+
+
+class MissingAPIKeyError(ValueError):
+    """Raised when a model is needed but GEMINI_API_KEY is not set."""
+
+    def __init__(self):
+        super().__init__("GEMINI_API_KEY environment variable not set. "
+                         "Please copy .env.example to .env and set your API key.")
+
+
+_lock = threading.Lock()
+_genai = None
+_models = {}
+
+
+def get_model(system_instruction: str = None, model_name: str = MODEL_NAME):
+    """Return a shared ``GenerativeModel``, importing and configuring the SDK on the first call.
+
+    ``google.generativeai`` takes most of a second to import, so nothing
+    imports it until a model is actually needed. The SDK is configured once
+    per process and models are reused by name and system instruction.
+    Raises ``MissingAPIKeyError`` if no API key is set.
+    """
+    global _genai
+    key = (model_name, system_instruction)
+    model = _models.get(key)
+    if model is not None:
+        return model
+    with _lock:
+        model = _models.get(key)
+        if model is not None:
+            return model
+        if _genai is None:
+            api_key = os.getenv('GEMINI_API_KEY')
+            if not api_key:
+                raise MissingAPIKeyError()
+            import google.generativeai as genai
+            genai.configure(api_key=api_key)
+            _genai = genai
+        model = _models[key] = _genai.GenerativeModel(model_name, system_instruction=system_instruction)
+        return model
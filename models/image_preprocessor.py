@@ -0,0 +1,192 @@
+"""
+Image pre-processing applied to receipts before they are sent to the model.
+"""
+
+import io
+import os
+import math
+import threading
+from typing import TYPE_CHECKING
+
+from models.metrics import metrics, IMAGE_BYTES
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+DEFAULT_MAX_EDGE = int(os.getenv('RECEIPT_MAX_EDGE', '1600'))
+DEFAULT_JPEG_QUALITY = int(os.getenv('RECEIPT_JPEG_QUALITY', '80'))
+# Images taller than this many times their width are split into tiles; 0 disables tiling.
+DEFAULT_TILE_ASPECT = float(os.getenv('RECEIPT_TILE_ASPECT', '2.5'))
+# Each tile is this many times as tall as it is wide, and overlaps the next by this share of its height.
+TILE_HEIGHT_RATIO = 1.5
+TILE_OVERLAP = 0.15
+MAX_TILES = 8
+
+MIME_TYPES = {
+    'JPEG': 'image/jpeg',
+    'PNG': 'image/png',
+    'WEBP': 'image/webp',
+}
+
+
+class ImagePreprocessor:
+    """Downscales, crops and re-encodes receipt images to shrink upload payloads.
+
+    ``process`` returns a ``{'mime_type', 'data'}`` part ready for
+    ``generate_content`` and records the byte counts before and after.
+    ``process_tiles`` does the same, but splits images taller than
+    ``tile_aspect`` times their width into overlapping horizontal tiles,
+    so that long receipts are not shrunk until their text is unreadable.
+    """
+
+    def __init__(self, max_edge: int = DEFAULT_MAX_EDGE, grayscale: bool = True, autocrop: bool = True,
+                 quality: int = DEFAULT_JPEG_QUALITY, enabled: bool = True, tile_aspect: float = DEFAULT_TILE_ASPECT):
+        self.max_edge = max_edge
+        self.tile_aspect = tile_aspect
+        self.grayscale = grayscale
+        self.autocrop = autocrop
+        self.quality = quality
+        self.enabled = enabled
+        # Running totals rather than a record per image, so a long-lived process does not grow.
+        self._images = 0
+        self._original_bytes = 0
+        self._processed_bytes = 0
+        self._lock = threading.Lock()
+
+    def signature(self) -> str:
+        """Describe the settings, so cached extractions are tied to them."""
+        if not self.enabled:
+            return "raw"
+        return (f"edge={self.max_edge},gray={int(self.grayscale)},crop={int(self.autocrop)},q={self.quality},"
+                f"tile={self.tile_aspect:g}")
+
+    def process(self, image_bytes: bytes, file_name: str = '') -> dict:
+        """Return the model payload for an image, pre-processed when enabled.
+
+        Raises the underlying PIL error if the image cannot be decoded.
+        """
+        return self._process_parts(image_bytes, file_name, tile=False)[0]
+    
+    def process_tiles(self, image_bytes: bytes, file_name: str = '') -> list[dict]:
+        """Return the model payload for an image as one part, or as overlapping tiles if it is tall.
+
+        Tiles are listed top to bottom. Raises the underlying PIL error if the
+        image cannot be decoded.
+        """
+        return self._process_parts(image_bytes, file_name, tile=True)
+    
+    def _process_parts(self, image_bytes: bytes, file_name: str, tile: bool) -> list[dict]:
+        with metrics.stage('preprocess'):
+            parts = self._process(image_bytes, file_name, tile)
+        metrics.inc(IMAGE_BYTES, len(image_bytes), payload='original')
+        metrics.inc(IMAGE_BYTES, sum(len(part['data']) for part in parts), payload='sent')
+        return parts
+    
+    def _process(self, image_bytes: bytes, file_name: str, tile: bool = False) -> list[dict]:
+        # PIL is imported on first use so that starting the CLI does not pay for it.
+        from PIL import Image, ImageOps
+        image = Image.open(io.BytesIO(image_bytes))
+        original_mime = MIME_TYPES.get(image.format)
+        if not self.enabled:
+            if original_mime:
+                return [{'mime_type': original_mime, 'data': image_bytes}]
+            return [self._encode(image.convert('RGB'))]
+
+        mode = 'L' if self.grayscale else 'RGB'
+        if image.format == 'JPEG':
+            # Let the JPEG decoder skip detail we are about to throw away.
+            image.draft(mode, (self.max_edge, self.max_edge))
+        image = ImageOps.exif_transpose(image)
+        image = self._flatten(image).convert(mode)
+
+        if self.autocrop:
+            image = self._crop_borders(image)
+        width, height = image.size
+        if tile and self._should_tile(width, height):
+            parts = []
+            for box in self._tile_boxes(width, height):
+                tile_image = image.crop(box)
+                if max(tile_image.size) > self.max_edge:
+                    tile_image.thumbnail((self.max_edge, self.max_edge), Image.LANCZOS)
+                parts.append(self._encode(tile_image))
+            self._record(len(image_bytes), sum(len(part['data']) for part in parts))
+            print(f"  -> Tall image ({width}x{height}): split into {len(parts)} overlapping tiles")
+            return parts
+
+        if max(image.size) > self.max_edge:
+            image.thumbnail((self.max_edge, self.max_edge), Image.LANCZOS)
+
+        part = self._encode(image)
+        if original_mime and len(part['data']) >= len(image_bytes):
+            # Small, already-compressed images are better sent as they are.
+            part = {'mime_type': original_mime, 'data': image_bytes}
+
+        self._record(len(image_bytes), len(part['data']))
+        return [part]
+
+    def _should_tile(self, width: int, height: int) -> bool:
+        """Whether a tall image would lose resolution as one part that its tiles keep."""
+        if not self.tile_aspect or height <= width * self.tile_aspect or height <= self.max_edge:
+            return False
+        _, top, _, bottom = self._tile_boxes(width, height)[0]
+        return max(width, bottom - top) < height
+    
+    @staticmethod
+    def _tile_boxes(width: int, height: int) -> list[tuple[int, int, int, int]]:
+        """Split a tall image into evenly spaced, overlapping crop boxes from top to bottom."""
+        tile_height = int(width * TILE_HEIGHT_RATIO)
+        overlap = int(tile_height * TILE_OVERLAP)
+        count = math.ceil((height - overlap) / (tile_height - overlap))
+        if count <= 1:
+            # A tile aspect below TILE_HEIGHT_RATIO lets images that fit in one tile get here.
+            return [(0, 0, width, height)]
+        if count > MAX_TILES:
+            # Very long receipts get taller tiles rather than more requests.
+            count = MAX_TILES
+            tile_height = math.ceil((height + overlap * (count - 1)) / count)
+        step = (height - tile_height) / (count - 1)
+        return [(0, round(i * step), width, round(i * step) + tile_height) for i in range(count)]
+
+    def totals(self) -> dict:
+        """Return total payload bytes before and after pre-processing."""
+        with self._lock:
+            return {'images': self._images, 'original_bytes': self._original_bytes,
+                    'processed_bytes': self._processed_bytes}
+
+    def _record(self, original: int, processed: int):
+        with self._lock:
+            self._images += 1
+            self._original_bytes += original
+            self._processed_bytes += processed
+        print(f"  -> Payload: {original / 1024:.1f} KB -> {processed / 1024:.1f} KB")
+
+    def _encode(self, image: 'Image.Image') -> dict:
+        buffer = io.BytesIO()
+        image.save(buffer, format='JPEG', quality=self.quality, optimize=True)
+        return {'mime_type': 'image/jpeg', 'data': buffer.getvalue()}
+
+    def _flatten(self, image: 'Image.Image') -> 'Image.Image':
+        """Composite transparent images onto white so padding does not turn black."""
+        from PIL import Image
+        if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+            image = image.convert('RGBA')
+            background = Image.new('RGBA', image.size, (255, 255, 255, 255))
+            return Image.alpha_composite(background, image)
+        return image
+
+    def _crop_borders(self, image: 'Image.Image', threshold: int = 24, margin: int = 8) -> 'Image.Image':
+        """Trim uniform borders that match the top-left corner colour."""
+        from PIL import Image, ImageChops
+        background = Image.new(image.mode, image.size, image.getpixel((0, 0)))
+        diff = ImageChops.difference(image, background)
+        if diff.mode != 'L':
+            diff = diff.convert('L')
+        bbox = diff.point(lambda p: 255 if p > threshold else 0).getbbox()
+        if not bbox:
+            return image
+        left, top, right, bottom = bbox
+        width, height = image.size
+        bbox = (max(left - margin, 0), max(top - margin, 0), min(right + margin, width), min(bottom + margin, height))
+        if bbox == (0, 0, width, height):
+            return image
+        return image.crop(bbox)
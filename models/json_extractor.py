@@ -0,0 +1,168 @@
+"""
+Linear-time extraction and repair of JSON in a model response.
+"""
+
+import json
+
+FENCE = '```'
+# How many '{' positions to try before giving up on a response.
+MAX_CANDIDATES = 4
+
+_decoder = json.JSONDecoder(strict=False)
+_CLOSERS = {'{': '}', '[': ']'}
+
+
+class JSONExtractionError(ValueError):
+    """Raised when no JSON object can be recovered from a response."""
+
+
+def strip_markdown_fences(text: str, opener: str = '{') -> str:
+    """Return the body of the first fenced block that holds ``opener``, or ``text`` unchanged."""
+    open_at = text.find(FENCE)
+    if open_at == -1:
+        return text
+    body_start = text.find('\n', open_at)
+    if body_start == -1:
+        return text
+    close_at = text.find(FENCE, body_start)
+    body = text[body_start + 1:close_at if close_at != -1 else len(text)]
+    return body if opener in body else text
+
+
+def extract_json_object(text: str) -> tuple[dict, list[str]]:
+    """Find, decode and if needed repair the first JSON object in ``text``.
+
+    Returns the object and a list naming any repairs that were applied
+    (``"trailing commas"``, ``"truncated output"``). Raises
+    ``JSONExtractionError`` if nothing usable is found.
+    """
+    body = strip_markdown_fences(text)
+    start = body.find('{')
+    if start == -1:
+        raise JSONExtractionError("No JSON object found in the response.")
+
+    last_error = None
+    for _ in range(MAX_CANDIDATES):
+        try:
+            value, _ = _decoder.raw_decode(body, start)
+            if isinstance(value, dict):
+                return value, []
+        except (json.JSONDecodeError, RecursionError) as e:
+            # RecursionError: nesting deeper than the decoder can follow.
+            last_error = e
+
+        repaired, repairs = repair_json(body, start)
+        if repairs:
+            try:
+                value = _decoder.decode(repaired)
+                if isinstance(value, dict) and value:
+                    return value, repairs
+            except (json.JSONDecodeError, RecursionError) as e:
+                last_error = e
+
+        start = body.find('{', start + 1)
+        if start == -1:
+            break
+
+    raise JSONExtractionError(f"Could not parse JSON object: {last_error}")
+
+
+def extract_json_array(text: str) -> tuple[list, bool]:
+    """Decode the elements of the first JSON array in ``text`` one at a time.
+
+    Returns the elements that decoded completely and whether the array was
+    closed. A truncated or malformed array yields the elements before the
+    damage instead of failing as a whole. Raises ``JSONExtractionError`` if
+    there is no array at all.
+    """
+    body = strip_markdown_fences(text, '[')
+    pos = body.find('[')
+    if pos == -1:
+        raise JSONExtractionError("No JSON array found in the response.")
+
+    items = []
+    pos += 1
+    end = len(body)
+    while pos < end:
+        ch = body[pos]
+        if ch in ' \t\r\n,':
+            pos += 1
+        elif ch == ']':
+            return items, True
+        else:
+            try:
+                value, pos = _decoder.raw_decode(body, pos)
+            except (json.JSONDecodeError, RecursionError):
+                break
+            items.append(value)
+    return items, False
+
+
+def repair_json(text: str, start: int = 0) -> tuple[str, list[str]]:
+    """Rewrite the JSON value beginning at ``start`` in one pass over the text.
+
+    Trailing commas before ``}``/``]`` are dropped. If the text ends before
+    the value is closed, it is cut back to the last complete array element or
+    top-level member, so a half-written line item is dropped rather than kept
+    with missing fields, and the open containers are closed. Returns the
+    rewritten text and the repairs made.
+    """
+    out = []
+    stack = []
+    repairs = []
+    in_string = False
+    escaped = False
+    # (output length, open containers) after the last complete element.
+    safe_point = None
+
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_string:
+            out.append(ch)
+            if escaped:
+                escaped = False
+            elif ch == '\\':
+                escaped = True
+            elif ch == '"':
+                in_string = False
+            continue
+
+        if ch == '"':
+            in_string = True
+            out.append(ch)
+        elif ch in '{[':
+            stack.append(ch)
+            out.append(ch)
+            if ch == '[' or len(stack) == 1:
+                safe_point = (len(out), tuple(stack))
+        elif ch in '}]':
+            while out and out[-1] in ' \t\r\n':
+                out.pop()
+            if out and out[-1] == ',':
+                out.pop()
+                if 'trailing commas' not in repairs:
+                    repairs.append('trailing commas')
+            if stack:
+                stack.pop()
+            out.append(ch)
+            if not stack:
+                return ''.join(out), repairs
+            if stack[-1] == '[' or len(stack) == 1:
+                safe_point = (len(out), tuple(stack))
+        elif ch == ',' and (stack[-1:] == ['['] or len(stack) == 1):
+            safe_point = (len(out), tuple(stack))
+            out.append(ch)
+        else:
+            out.append(ch)
+
+    if not stack:
+        return ''.join(out), repairs
+
+    # Truncated response: keep everything up to the last complete member.
+    length, open_containers = safe_point
+    del out[length:]
+    while out and out[-1] in ' \t\r\n,':
+        out.pop()
+    out.extend(_CLOSERS[c] for c in reversed(open_containers))
+    repairs.append('truncated output')
+    return ''.join(out), repairs
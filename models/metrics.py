@@ -0,0 +1,167 @@
+"""
+Lightweight in-process metrics: latency histograms and counters, with a
+profile table and a Prometheus text export.
+"""
+
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Histogram bucket upper bounds in seconds, roughly logarithmic from 1 ms to 2 minutes.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+STAGE_SECONDS = 'receipt_stage_seconds'
+STAGE_ERRORS = 'receipt_stage_errors_total'
+IMAGE_BYTES = 'receipt_image_bytes_total'
+MODEL_REQUESTS = 'receipt_model_requests_total'
+MODEL_TOKENS = 'receipt_model_tokens_total'
+MODEL_RETRIES = 'receipt_model_retries_total'
+JSON_REPAIRS = 'receipt_json_repairs_total'
+CHAT_ANSWERS = 'receipt_chat_answers_total'
+TIER_RESULTS = 'receipt_tier_results_total'
+
+
+class Histogram:
+    """Bucketed distribution of observed values, with their count, sum and maximum."""
+
+    __slots__ = ('buckets', 'counts', 'count', 'sum', 'max')
+
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last slot counts values above every bound
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile by interpolating within its bucket."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                low = self.buckets[i - 1] if i else 0.0
+                high = self.buckets[i] if i < len(self.buckets) else self.max
+                return min(low + (high - low) * (rank - seen) / count, self.max)
+            seen += count
+        return self.max
+
+
+class MetricsRegistry:
+    """Thread-safe counters and histograms keyed by metric name and labels.
+
+    Recording takes one lock and a dict lookup, so it is cheap enough for
+    per-receipt hot paths. Labels are passed as keyword arguments and must
+    be low-cardinality (stage names, request kinds), never file names.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    @contextmanager
+    def stage(self, stage: str):
+        """Time a pipeline stage; an exception escaping it also counts as an error of that stage."""
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.inc(STAGE_ERRORS, stage=stage)
+            raise
+        finally:
+            self.observe(STAGE_SECONDS, time.perf_counter() - start, stage=stage)
+
+    def error(self, stage: str):
+        """Count a failure that a stage handled without raising."""
+        self.inc(STAGE_ERRORS, stage=stage)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def format_table(self) -> str:
+        """Render stage latencies and counters as a plain-text profile table."""
+        with self._lock:
+            histograms = {key: (h.count, h.sum, h.quantile(0.5), h.quantile(0.95), h.max)
+                          for key, h in self._histograms.items()}
+            counters = dict(self._counters)
+        if not histograms and not counters:
+            return "No metrics recorded."
+
+        lines = [f"{'stage':<22}{'count':>8}{'errors':>8}{'total s':>10}{'mean ms':>10}"
+                 f"{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}"]
+        for (name, labels), (count, total, p50, p95, peak) in sorted(histograms.items()):
+            if name != STAGE_SECONDS:
+                continue
+            errors = counters.get((STAGE_ERRORS, labels), 0)
+            lines.append(f"{dict(labels)['stage']:<22}{count:>8}{errors:>8.0f}{total:>10.2f}"
+                         f"{total / count * 1000:>10.1f}{p50 * 1000:>10.1f}{p95 * 1000:>10.1f}{peak * 1000:>10.1f}")
+        other = [(name, labels, value) for (name, labels), value in sorted(counters.items()) if name != STAGE_ERRORS]
+        if other:
+            lines.append("")
+            for name, labels, value in other:
+                label_text = ','.join(f"{k}={v}" for k, v in labels)
+                metric = f"{name}{{{label_text}}}" if label_text else name
+                lines.append(f"{metric:<64}{value:>14,.0f}")
+        return '\n'.join(lines)
+
+    def prometheus_text(self) -> str:
+        """Render every metric in the Prometheus text exposition format."""
+        with self._lock:
+            histograms = {key: (list(h.counts), h.count, h.sum, h.buckets) for key, h in self._histograms.items()}
+            counters = dict(self._counters)
+
+        lines = []
+        typed = set()
+        for (name, labels), value in sorted(counters.items()):
+            if name not in typed:
+                lines.append(f"# TYPE {name} counter")
+                typed.add(name)
+            lines.append(f"{name}{_labels(labels)} {value:g}")
+        for (name, labels), (counts, count, total, buckets) in sorted(histograms.items()):
+            if name not in typed:
+                lines.append(f"# TYPE {name} histogram")
+                typed.add(name)
+            cumulative = 0
+            for bound, bucket_count in zip(buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{_labels(labels + (('le', f'{bound:g}'),))} {cumulative}")
+            lines.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {count}")
+            lines.append(f"{name}_sum{_labels(labels)} {total:.6f}")
+            lines.append(f"{name}_count{_labels(labels)} {count}")
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(labels: tuple) -> str:
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + '}'
+
+
+# Process-wide registry shared by the pipeline, the CLI profile table and the web /metrics route.
+metrics = MetricsRegistry()
@@ -0,0 +1,248 @@
+"""
+Model backends: the Gemini API, and a simulated backend for offline runs and benchmarks.
+"""
+
+import os
+import re
+import json
+import math
+import time
+import random
+import hashlib
+import threading
+from dataclasses import dataclass
+
+from models.gemini_client import MODEL_NAME, get_model
+
+DEFAULT_BACKEND = os.getenv('RECEIPT_MODEL_BACKEND', 'gemini')
+BACKENDS = ('gemini', 'simulated')
+# Seconds before a Gemini request is abandoned as timed out, so it can be retried.
+DEFAULT_TIMEOUT = float(os.getenv('RECEIPT_MODEL_TIMEOUT', '60'))
+
+# Gemini bills each image as a fixed number of prompt tokens.
+TOKENS_PER_IMAGE = 258
+# Share of a simulated streamed response's latency spent before its first piece.
+FIRST_TOKEN_SHARE = 0.25
+SIM_CATEGORIES = ["Food & Beverage", "Tools & Equipment", "Raw Materials", "Software & Subscriptions",
+                  "Event Fees", "Travel & Lodging", "Office Supplies", "Miscellaneous"]
+SIM_MERCHANTS = ["Home Depot", "Staples", "Starbucks", "Uber", "Delta Air Lines", "Marriott", "Costco", "Adobe"]
+
+
+class ModelError(Exception):
+    """A model request failed in a way that may succeed if retried."""
+
+
+class RateLimitError(ModelError):
+    """The model refused the request because a quota was exceeded (HTTP 429)."""
+
+
+class TransientModelError(ModelError):
+    """The model was unavailable or timed out (HTTP 5xx)."""
+
+
+@dataclass(slots=True)
+class ModelResponse:
+    """Text returned by a backend and the tokens it was billed for."""
+
+    text: str
+    prompt_tokens: int = 0
+    output_tokens: int = 0
+
+
+class GeminiBackend:
+    """Sends requests to the Gemini API through the shared, lazily configured client."""
+
+    def __init__(self, timeout: float = DEFAULT_TIMEOUT, model_name: str = MODEL_NAME):
+        self.timeout = timeout
+        self.name = model_name
+
+    def generate(self, contents, system_instruction: str = None) -> ModelResponse:
+        """Generate a response, raising ``RateLimitError`` or ``TransientModelError`` for retryable failures."""
+        model = get_model(system_instruction=system_instruction, model_name=self.name)
+        try:
+            response = model.generate_content(contents, request_options={'timeout': self.timeout})
+            text = response.text
+        except Exception as e:
+            raise _classify(e) from e
+        return _with_usage(text, response)
+
+    def generate_stream(self, contents, system_instruction: str = None):
+        """Yield the response in pieces as it is generated; the last piece carries the token counts."""
+        model = get_model(system_instruction=system_instruction, model_name=self.name)
+        try:
+            for chunk in model.generate_content(contents, stream=True, request_options={'timeout': self.timeout}):
+                yield _with_usage(chunk.text, chunk)
+        except Exception as e:
+            raise _classify(e) from e
+
+
+def _with_usage(text: str, response) -> ModelResponse:
+    usage = getattr(response, 'usage_metadata', None)
+    return ModelResponse(text, getattr(usage, 'prompt_token_count', 0) or 0,
+                         getattr(usage, 'candidates_token_count', 0) or 0)
+
+
+def _classify(error: Exception) -> Exception:
+    """Map Google API errors to the retryable error types by their HTTP status."""
+    code = getattr(error, 'code', None)
+    code = getattr(code, 'value', code)
+    if code == 429:
+        return RateLimitError(str(error))
+    if code in (500, 502, 503, 504) or isinstance(error, (TimeoutError, ConnectionError)):
+        return TransientModelError(str(error))
+    return error
+
+
+class SimulatedBackend:
+    """Offline stand-in for the model, for benchmarks and runs without network or key.
+
+    Extraction requests get receipt JSON derived from a hash of each image,
+    so the same image always yields the same receipt; packed requests get a
+    JSON array with ``image_index`` labels. Chat prompts get a short canned
+    answer. Latency is log-normal around ``latency_ms``. A fraction of
+    requests fail with ``TransientModelError`` or ``RateLimitError``, and
+    with ``requests_per_minute`` set, requests beyond that quota are
+    rejected with ``RateLimitError`` like a real API would.
+    """
+
+    name = 'simulated'
+
+    def __init__(self, latency_ms: float = 800, latency_sigma: float = 0.35, per_image_ms: float = 0,
+                 error_rate: float = 0.0, rate_limit_rate: float = 0.0, requests_per_minute: float = 0,
+                 canned: dict = None, seed: int = None):
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.per_image_ms = per_image_ms
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.requests_per_minute = requests_per_minute
+        self.canned = canned
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        # Quota bucket: holds up to one second's worth of requests.
+        self._capacity = max(1.0, requests_per_minute / 60)
+        self._tokens = self._capacity
+        self._refilled = time.monotonic()
+
+    def generate(self, contents, system_instruction: str = None) -> ModelResponse:
+        latency, response = self._plan(contents, system_instruction)
+        time.sleep(latency)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    def generate_stream(self, contents, system_instruction: str = None):
+        """Yield the response word by word, the first after ``FIRST_TOKEN_SHARE`` of its latency."""
+        latency, response = self._plan(contents, system_instruction)
+        time.sleep(latency * FIRST_TOKEN_SHARE)
+        if isinstance(response, Exception):
+            raise response
+        pieces = re.findall(r'\S+\s*', response.text) or ['']
+        for i, piece in enumerate(pieces):
+            if i:
+                time.sleep(latency * (1 - FIRST_TOKEN_SHARE) / (len(pieces) - 1))
+            if i < len(pieces) - 1:
+                yield ModelResponse(piece)
+            else:
+                yield ModelResponse(piece, response.prompt_tokens, response.output_tokens)
+
+    def _plan(self, contents, system_instruction: str = None) -> tuple[float, ModelResponse | Exception]:
+        """Return a request's latency in seconds and its response or error; raise at once if throttled."""
+        parts = contents if isinstance(contents, list) else [contents]
+        images = [part['data'] for part in parts if isinstance(part, dict)]
+        prompt_chars = sum(len(part) for part in parts if isinstance(part, str)) + len(system_instruction or '')
+
+        with self._lock:
+            throttled = not self._take_quota() or self._random.random() < self.rate_limit_rate
+            failed = not throttled and self._random.random() < self.error_rate
+            latency = self.latency_ms * math.exp(self.latency_sigma * self._random.gauss(0, 1))
+        if throttled:
+            time.sleep(min(latency, 50) / 1000)
+            raise RateLimitError("429 Resource has been exhausted (simulated)")
+        latency = (latency + self.per_image_ms * len(images)) / 1000
+        if failed:
+            return latency, TransientModelError("503 The service is currently unavailable (simulated)")
+
+        if not images:
+            text = self._chat_answer(parts[-1] if parts and isinstance(parts[-1], str) else '')
+        elif len(images) == 1:
+            text = "```json\n" + json.dumps(self._receipt(images[0]), indent=2) + "\n```"
+        else:
+            receipts = [dict(self._receipt(data), image_index=i) for i, data in enumerate(images, 1)]
+            text = "```json\n" + json.dumps(receipts, indent=2) + "\n```"
+        return latency, ModelResponse(text, prompt_chars // 4 + TOKENS_PER_IMAGE * len(images), len(text) // 4)
+
+    def _take_quota(self) -> bool:
+        if not self.requests_per_minute:
+            return True
+        now = time.monotonic()
+        self._tokens = min(self._capacity, self._tokens + (now - self._refilled) * self.requests_per_minute / 60)
+        self._refilled = now
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    def _receipt(self, image_data: bytes) -> dict:
+        if self.canned is not None:
+            return self.canned
+        rng = random.Random(hashlib.sha256(image_data).digest())
+        items = []
+        for _ in range(rng.randint(1, 8)):
+            amount = rng.randint(199, 12000)
+            items.append({
+                'item': f"Item {rng.randint(1, 999)}",
+                'amount': f"{amount / 100:.2f}",
+                'category': rng.choice(SIM_CATEGORIES),
+                'justification': "Supplies for business operations",
+                'needs_approval': amount > 7500,
+                'approval_reason': "High-value item" if amount > 7500 else "",
+            })
+        subtotal = sum(round(float(item['amount']) * 100) for item in items)
+        tax = subtotal * 8 // 100
+        return {
+            'merchant': rng.choice(SIM_MERCHANTS),
+            'date': f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            'location': "Austin, TX",
+            'receipt_total': f"{(subtotal + tax) / 100:.2f}",
+            'subtotal': f"{subtotal / 100:.2f}",
+            'tax': f"{tax / 100:.2f}",
+            'line_items': items,
+            'flags': [],
+            'completeness_score': 'A',
+        }
+
+    @staticmethod
+    def _chat_answer(prompt: str) -> str:
+        question = prompt.rsplit('QUESTION:', 1)[-1].strip()
+        lines = prompt.count('\n')
+        return f'Simulated answer to "{question}" from {lines} lines of receipt context.'
+
+
+def create_backend(name: str = None, model_name: str = None):
+    """Build the backend named by ``name`` or ``RECEIPT_MODEL_BACKEND`` (``gemini`` or ``simulated``).
+
+    ``model_name`` picks the Gemini model (default ``gemini-1.5-flash``).
+    The simulated backend is configured from ``RECEIPT_SIM_*`` environment
+    variables; ``RECEIPT_SIM_CANNED`` points at a JSON file to return for every receipt.
+    """
+    name = (name or DEFAULT_BACKEND).lower()
+    if name == 'gemini':
+        return GeminiBackend(model_name=model_name or MODEL_NAME)
+    if name != 'simulated':
+        raise ValueError(f"Unknown model backend: {name!r} (expected one of {', '.join(BACKENDS)})")
+    canned = None
+    if os.getenv('RECEIPT_SIM_CANNED'):
+        with open(os.getenv('RECEIPT_SIM_CANNED'), encoding='utf-8') as f:
+            canned = json.load(f)
+    seed = os.getenv('RECEIPT_SIM_SEED')
+    return SimulatedBackend(
+        latency_ms=float(os.getenv('RECEIPT_SIM_LATENCY_MS', '800')),
+        latency_sigma=float(os.getenv('RECEIPT_SIM_LATENCY_SIGMA', '0.35')),
+        per_image_ms=float(os.getenv('RECEIPT_SIM_PER_IMAGE_MS', '0')),
+        error_rate=float(os.getenv('RECEIPT_SIM_ERROR_RATE', '0')),
+        rate_limit_rate=float(os.getenv('RECEIPT_SIM_RATE_LIMIT_RATE', '0')),
+        requests_per_minute=float(os.getenv('RECEIPT_SIM_RPM', '0')),
+        canned=canned,
+        seed=int(seed) if seed else None,
+    )
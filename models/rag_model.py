@@ -2,104 +2,145 @@
 RAG (Retrieval-Augmented Generation) model for receipt question answering.
 """
 
-import os
-import json
-from datetime import datetime
-import google.generativeai as genai
+import time
 from dotenv import load_dotenv
 
-load_dotenv()
-
+from models.model_backend import create_backend
+from models.metrics import metrics, STAGE_SECONDS, MODEL_REQUESTS, MODEL_TOKENS, CHAT_ANSWERS
+from models.receipt_types import Receipt
+from models.receipt_answers import AnswerCache, match_intent, answer_intent
+from models.receipt_retriever import ReceiptRetriever, parse_filters, entity_key
+from models.receipt_context import ReceiptContextEncoder, estimate_tokens
 
-class ReceiptRAG:
-    """RAG system for answering questions about receipt data."""
-    
-    def __init__(self):
-        self.model = self._configure_gemini()
-        self.receipt_context = None
-    
-    def _configure_gemini(self):
-        """Configure the Gemini model."""
-        api_key = os.getenv('GEMINI_API_KEY')
-        if not api_key:
-            raise ValueError("GEMINI_API_KEY not found in environment variables")
-        
-        genai.configure(api_key=api_key)
-        return genai.GenerativeModel("gemini-1.5-flash")
-    
-    def load_receipt_context(self, receipt_data: dict):
-        """Load receipt data as context for questions."""
-        self.receipt_context = receipt_data
-    
-    def ask_question(self, question: str) -> str:
-        """Ask a question about the loaded receipt data."""
-        if not self.receipt_context:
-            return "No receipt data loaded. Please upload and process a receipt first."
-        
-        # Prepare context from receipt data
-        context = self._format_receipt_context()
-        
-        prompt = f"""You are a helpful assistant that answers questions about business receipts. 
-You have access to the following receipt data:
-
-{context}
-
-User Question: {question}
+load_dotenv()
 
-Instructions:
+# Sent once as the model's system instruction rather than with every question.
+SYSTEM_INSTRUCTIONS = """You are a helpful assistant that answers questions about business receipts.
+The receipt data comes first, then the user's question.
+- RECEIPT is the receipt the user has loaded; ITEMS lists its line items, one per line, with the columns named in its heading
+- Questions about "this receipt" refer to RECEIPT; use HISTORICAL RECEIPTS for questions across receipts or events
+- For totals across receipts, use the "All matching line items" figures rather than adding up the listed line items
 - Answer the question based ONLY on the provided receipt data
 - Be specific and reference actual values from the receipt
 - If the information is not available in the receipt, say so clearly
 - Keep responses concise but informative
-- For monetary amounts, always include the currency symbol
+- For monetary amounts, always include the currency symbol"""
 
-Answer:"""
 
-        try:
-            response = self.model.generate_content(prompt)
-            return response.text.strip()
-        except Exception as e:
-            return f"Error processing question: {str(e)}"
+class ReceiptRAG:
+    """RAG system for answering questions about receipt data.
+
+    Holds no per-user state: the receipt a question is about is passed in on
+    every call, so one instance can serve any number of sessions. With a
+    retriever, line items from every stored receipt that match the question
+    are added to the prompt, so questions can span receipts and events.
+    """
     
-    def _format_receipt_context(self) -> str:
-        """Format receipt data into readable context."""
-        if not self.receipt_context:
-            return "No receipt data available."
-        
-        context = f"""
-RECEIPT INFORMATION:
-- Merchant: {self.receipt_context.get('merchant', 'N/A')}
-- Date: {self.receipt_context.get('date', 'N/A')}
-- Location: {self.receipt_context.get('location', 'N/A')}
-- Total Amount: ${self.receipt_context.get('receipt_total', '0.00')}
-- Subtotal: ${self.receipt_context.get('subtotal', '0.00')}
-- Tax: ${self.receipt_context.get('tax', '0.00')}
+    def __init__(self, retriever: ReceiptRetriever = None, backend=None):
+        self.backend = backend or create_backend()
+        self.answer_cache = AnswerCache()
+        self.context_encoder = ReceiptContextEncoder()
+        self.retriever = retriever
+    
+    def ask_question(self, question: str, receipt: Receipt | None) -> str:
+        """Ask a question about the given receipt and, with a retriever, stored receipt history."""
+        return ''.join(self.ask_question_stream(question, receipt)).strip()
+    
+    def ask_question_stream(self, question: str, receipt: Receipt | None):
+        """Yield the answer to a question in pieces as the model generates it.
 
-ITEMS PURCHASED:
-"""
+        Local, cached and error answers are yielded as a single piece. The
+        time to the first piece is recorded as the ``chat_first_token`` stage
+        and the whole generation as ``chat_model_request``.
+        """
+        if not receipt and self.retriever is None:
+            yield "No receipt data loaded. Please upload and process a receipt first."
+            return
         
-        for i, item in enumerate(self.receipt_context.get('line_items', []), 1):
-            context += f"""
-{i}. {item.get('item', 'Unknown Item')}
-   - Amount: ${item.get('amount', '0.00')}
-   - Category: {item.get('category', 'Uncategorized')}
-   - Justification: {item.get('justification', 'N/A')}
-   - Needs Approval: {item.get('needs_approval', False)}
-"""
+        # Factual questions about receipt fields are answered exactly, without the model,
+        # unless they are scoped to other receipts
+        intent = match_intent(question) if receipt and not self._beyond_receipt(question, receipt) else None
+        if intent:
+            metrics.inc(CHAT_ANSWERS, source='local')
+            yield answer_intent(intent, receipt)
+            return
         
-        if self.receipt_context.get('flags'):
-            context += f"\nFLAGS/ISSUES:\n"
-            for flag in self.receipt_context['flags']:
-                context += f"- {flag}\n"
+        history = ""
+        history_version = None
+        if self.retriever is not None:
+            exclude = receipt.content_hash if receipt else None
+            with metrics.stage('chat_retrieve'):
+                history = self.retriever.format_context(self.retriever.retrieve(question, exclude_receipt=exclude))
+            history_version = self.retriever.version()
+        if not receipt and not history:
+            yield "No stored receipts match that question. Please upload and process a receipt first."
+            return
         
-        context += f"\nQuality Score: {self.receipt_context.get('completeness_score', 'N/A')}"
-        context += f"\nProcessed: {self.receipt_context.get('processed_date', 'N/A')}"
+        cache_key = self.answer_cache.make_key(receipt, question, history_version)
+        cached = self.answer_cache.get(cache_key)
+        if cached is not None:
+            metrics.inc(CHAT_ANSWERS, source='cache')
+            yield cached
+            return
         
-        return context
+        # The receipt context is encoded once per receipt; only history and the question vary
+        receipt_context, receipt_tokens = self.context_encoder.encode(receipt) if receipt else ("", 0)
+        sections = [section for section in (receipt_context, history) if section]
+        prompt = '\n\n'.join(sections + [f"QUESTION: {question}"])
+        
+        metrics.inc(MODEL_REQUESTS, kind='chat')
+        start = time.perf_counter()
+        first_token = None
+        pieces = []
+        response = None
+        try:
+            for response in self.backend.generate_stream(prompt, system_instruction=SYSTEM_INSTRUCTIONS):
+                text = response.text if pieces else response.text.lstrip()
+                if not text:
+                    continue
+                if first_token is None:
+                    first_token = time.perf_counter() - start
+                    metrics.observe(STAGE_SECONDS, first_token, stage='chat_first_token')
+                pieces.append(text)
+                yield text
+        except Exception as e:
+            metrics.error('chat_model_request')
+            metrics.inc(CHAT_ANSWERS, source='error')
+            yield f"\n\n[Answer interrupted: {str(e)}]" if pieces else f"Error processing question: {str(e)}"
+            return
+        elapsed = time.perf_counter() - start
+        metrics.observe(STAGE_SECONDS, elapsed, stage='chat_model_request')
+        
+        prompt_tokens = response.prompt_tokens if response else 0
+        output_tokens = response.output_tokens if response else 0
+        metrics.inc(MODEL_TOKENS, prompt_tokens, kind='chat', direction='prompt')
+        metrics.inc(MODEL_TOKENS, output_tokens, kind='chat', direction='output')
+        metrics.inc(CHAT_ANSWERS, source='model')
+        print(f"RAG request: {prompt_tokens} prompt tokens "
+              f"(~{receipt_tokens} receipt, ~{estimate_tokens(history) if history else 0} history), "
+              f"{output_tokens} output tokens, first token {(first_token or elapsed) * 1000:.0f} ms, "
+              f"total {elapsed * 1000:.0f} ms")
+        self.answer_cache.put(cache_key, ''.join(pieces).strip())
     
-    def get_suggested_questions(self) -> list:
+    def _beyond_receipt(self, question: str, receipt: Receipt) -> bool:
+        """Whether a question asks about more than the given receipt.
+
+        Date and amount bounds, and stored merchants or events other than the
+        receipt's own, scope a question to history. Words like "across" and
+        "all" are caught by ``match_intent`` itself.
+        """
+        _, filters = parse_filters(question)
+        if filters:
+            return True
+        if self.retriever is None:
+            return False
+        named = self.retriever.named_entities(question)
+        own = {'merchant': entity_key(receipt.merchant or ''), 'event': entity_key(receipt.event_name or '')}
+        return any(entity_key(name) != own[kind] for kind in own for name in named.get(kind, []))
+    
+    def get_suggested_questions(self, receipt: Receipt | None) -> list:
         """Get suggested questions based on the receipt data."""
-        if not self.receipt_context:
+        if not receipt:
             return ["Please upload a receipt first to see suggested questions."]
         
         suggestions = [
@@ -114,10 +155,13 @@ ITEMS PURCHASED:
         ]
         
         # Add context-specific suggestions
-        if self.receipt_context.get('flags'):
+        if receipt.flags:
             suggestions.append("Are there any issues with this receipt?")
         
-        if len(self.receipt_context.get('line_items', [])) > 1:
+        if len(receipt.line_items) > 1:
             suggestions.append("How many items were purchased?")
         
+        if self.retriever is not None and receipt.merchant and receipt.merchant != 'Unknown Vendor':
+            suggestions.append(f"How much have we spent at {receipt.merchant} across all events?")
+        
         return suggestions
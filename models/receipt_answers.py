@@ -0,0 +1,158 @@
+"""
+Deterministic answers to common receipt questions, and a cache for model answers.
+"""
+
+import re
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+from models.receipt_types import Receipt, format_cents
+
+# Questions that ask for judgement or explanation, or reach beyond one receipt,
+# always go to the model, even if they mention a field this module could look up.
+OPEN_ENDED = re.compile(r'\b(why|should|could|would|reasonable|justif\w*|explain|compar\w*|policy|suspicious|'
+                        r'valid|legitimate|allowed|reimburs\w*|recommend\w*|summar\w*|describe|personal|'
+                        r'across|all(?! (the )?items$)|events?|quarters?|years?)\b')
+
+# (intent, pattern) pairs matched in order against the normalized question.
+INTENTS = [
+    ('item_count', re.compile(r'^how many (line )?items?( were| did)?( (purchased|bought|there|on (the|this) receipt))?$')),
+    ('most_expensive', re.compile(r'^(what|which) (was|is) the (most expensive|priciest|highest priced|costliest|biggest)'
+                                  r'( (item|purchase|line item|thing))?( (purchased|bought|on (this|the) receipt))?$')),
+    ('cheapest', re.compile(r'^(what|which) (was|is) the (cheapest|least expensive|lowest priced)'
+                            r'( (item|purchase|line item|thing))?( (purchased|bought|on (this|the) receipt))?$')),
+    ('subtotal', re.compile(r'^(what|how much) (was|is) the subtotal$')),
+    ('tax', re.compile(r'^how much tax (was|did (we|i)) (paid|pay|charged)$|^what (was|is) the (total )?tax( amount| paid)?$')),
+    ('total', re.compile(r'^what (was|is) the (receipt )?total( amount)?( spent| paid)?$'
+                         r'|^how much (was|did (we|i)) (spent|spend|paid|pay)( in total| total)?$'
+                         r'|^what was the total amount (spent|paid)$')),
+    ('merchant', re.compile(r'^(what|which) (store|merchant|vendor|shop|business) (was|is) (this|it) (from|at)$'
+                            r'|^(who|what) (was|is) the (merchant|vendor|store)$|^where was this (purchase|receipt) from$')),
+    ('date', re.compile(r'^when was (this|the) (purchase|receipt|transaction) (made|issued|dated)?$'
+                        r'|^what (was|is) the (date|purchase date|transaction date)( of (this|the) (purchase|receipt))?$')),
+    ('location', re.compile(r'^where was (this|the) (purchase|receipt|transaction) (made|located)$'
+                            r'|^what (was|is) the location$')),
+    ('items', re.compile(r'^what items (were|did (we|i)) (purchased|bought|buy|purchase)$'
+                         r'|^(list|show) (all )?(the )?items$|^what was (purchased|bought)$')),
+    ('approval', re.compile(r'^(are there )?any items (that )?(need|needs|require|requires|requiring) approval$'
+                            r'|^(which|what) items (need|needs|require|requires) approval$')),
+    ('categories', re.compile(r'^what (categories|expense categories) (of expenses )?(are|were) (included|on (this|the) receipt)$'
+                              r'|^what categories of expenses are included$')),
+    ('flags', re.compile(r'^are there any (issues|problems|flags) (with|on) (this|the) receipt$'
+                         r'|^(what|which) (issues|problems|flags) (are there|were found)$')),
+]
+
+DEFAULT_CACHE_ENTRIES = 2048
+
+
+def normalize_question(question: str) -> str:
+    """Lower-case a question and reduce it to words separated by single spaces."""
+    text = re.sub(r"\b(what|who|where|when|how)['\u2019]s\b", r'\1 is', question.lower())
+    return ' '.join(re.sub(r"[^a-z0-9$&]+", ' ', text).split())
+
+
+def match_intent(question: str) -> str | None:
+    """Return the intent of a question that can be answered from receipt fields, or None."""
+    normalized = normalize_question(question)
+    if OPEN_ENDED.search(normalized):
+        return None
+    for intent, pattern in INTENTS:
+        if pattern.search(normalized):
+            return intent
+    return None
+
+
+def answer_intent(intent: str, receipt: Receipt) -> str:
+    """Answer a matched intent exactly from the structured receipt."""
+    items = receipt.line_items
+    if intent == 'total':
+        return f"The total amount spent at {receipt.merchant} was ${receipt.receipt_total}."
+    if intent == 'subtotal':
+        return f"The subtotal was ${receipt.subtotal}."
+    if intent == 'tax':
+        return f"${receipt.tax} was paid in tax."
+    if intent == 'merchant':
+        return f"This receipt is from {receipt.merchant}."
+    if intent == 'date':
+        if receipt.date == 'Not Available':
+            return "The purchase date is not available on this receipt."
+        return f"The purchase was made on {receipt.date}."
+    if intent == 'location':
+        if receipt.location == 'Not Available':
+            return "The location is not available on this receipt."
+        return f"The purchase was made in {receipt.location}."
+    if intent == 'item_count':
+        return f"{len(items)} item(s) were purchased."
+    if not items and intent in ('items', 'most_expensive', 'cheapest', 'approval', 'categories'):
+        return "No line items were found on this receipt."
+    if intent == 'items':
+        lines = [f"- {item.item}: ${item.amount}" for item in items]
+        return f"{len(items)} item(s) were purchased:\n" + '\n'.join(lines)
+    if intent == 'most_expensive':
+        item = max(items, key=lambda i: i.amount_cents)
+        return f"The most expensive item was {item.item} at ${item.amount}."
+    if intent == 'cheapest':
+        item = min(items, key=lambda i: i.amount_cents)
+        return f"The cheapest item was {item.item} at ${item.amount}."
+    if intent == 'approval':
+        flagged = [item for item in items if item.needs_approval]
+        if not flagged:
+            return "No items need approval."
+        lines = [f"- {item.item}: ${item.amount} ({item.approval_reason or 'no reason given'})" for item in flagged]
+        return f"{len(flagged)} item(s) need approval:\n" + '\n'.join(lines)
+    if intent == 'categories':
+        totals = {}
+        for item in items:
+            totals[item.category] = totals.get(item.category, 0) + item.amount_cents
+        lines = [f"- {category}: ${format_cents(cents)}"
+                 for category, cents in sorted(totals.items(), key=lambda x: x[1], reverse=True)]
+        return "Expense categories on this receipt:\n" + '\n'.join(lines)
+    if intent == 'flags':
+        if not receipt.flags:
+            return "No issues were flagged on this receipt."
+        return "Issues flagged on this receipt:\n" + '\n'.join(f"- {flag}" for flag in receipt.flags)
+    raise ValueError(f"Unknown intent: {intent}")
+
+
+def receipt_fingerprint(receipt: Receipt) -> str:
+    """Hash the extracted content of a receipt, ignoring file and processing metadata."""
+    data = receipt.to_dict()
+    for key in ('file_name', 'file_path', 'event_name', 'processed_date', 'content_hash'):
+        data.pop(key, None)
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class AnswerCache:
+    """LRU cache of model answers keyed by receipt content and normalized question."""
+
+    def __init__(self, max_entries: int = DEFAULT_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(receipt: Receipt | None, question: str, history_version: str = None) -> str:
+        """Key an answer by receipt content, question and, if history was used, its index version."""
+        fingerprint = receipt_fingerprint(receipt) if receipt else ''
+        return f"{fingerprint}:{history_version or ''}:{normalize_question(question)}"
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            answer = self._entries.get(key)
+            if answer is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return answer
+
+    def put(self, key: str, answer: str):
+        with self._lock:
+            self._entries[key] = answer
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
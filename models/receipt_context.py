@@ -0,0 +1,126 @@
+"""
+Compact prompt encoding of receipts for the chat model, with token budgeting.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+from models.receipt_types import Receipt, format_cents
+
+# Rough token allowance for the loaded receipt in one prompt.
+DEFAULT_CONTEXT_TOKENS = int(os.getenv('RECEIPT_RAG_CONTEXT_TOKENS', '2000'))
+MAX_CACHED_CONTEXTS = 1024
+# Item names are cut to this many characters once shorter fields have been trimmed.
+SHORT_ITEM_CHARS = 40
+
+# Trim levels, applied in order until the receipt fits its budget. Each level
+# drops the lowest-value detail still present.
+FULL, NO_JUSTIFICATION, NO_APPROVAL_REASON, SHORT_NAMES, TOP_ITEMS = range(5)
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate the model token count of ``text`` (about four characters per token)."""
+    return len(text) // 4 + 1
+
+
+class ReceiptContextEncoder:
+    """Encodes receipts as compact prompt context and caches the result per receipt.
+
+    Each line item is a single ``amount | item | category`` row, with its
+    approval status and justification appended while the budget allows.
+    When a receipt is over ``token_budget``, justifications go first, then
+    approval reasons, then long item names are shortened, and finally only
+    the most expensive items are listed with the rest summarized by category.
+    Encodings are cached by file path and processing time, so a receipt is
+    encoded once however many questions are asked about it.
+    """
+
+    def __init__(self, token_budget: int = DEFAULT_CONTEXT_TOKENS, max_entries: int = MAX_CACHED_CONTEXTS):
+        self.token_budget = token_budget
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def encode(self, receipt: Receipt) -> tuple[str, int]:
+        """Return the receipt's prompt context and its estimated token count."""
+        key = (receipt.file_path, receipt.processed_date) if receipt.processed_date else None
+        if key is not None:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    return entry
+
+        entry = self._encode(receipt)
+        if key is not None:
+            with self._lock:
+                self._entries[key] = entry
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return entry
+
+    def _encode(self, receipt: Receipt) -> tuple[str, int]:
+        for level in (FULL, NO_JUSTIFICATION, NO_APPROVAL_REASON, SHORT_NAMES):
+            header = self._header(receipt, level)
+            rows = [self._row(i, item, level) for i, item in enumerate(receipt.line_items, 1)]
+            used = estimate_tokens(header)
+            tokens = used + sum(estimate_tokens(row) for row in rows)
+            if tokens <= self.token_budget:
+                return '\n'.join([header, *rows]), tokens
+
+        # Still over budget: list the most expensive items that fit, in receipt order.
+        ranked = sorted(range(len(rows)), key=lambda i: receipt.line_items[i].amount_cents, reverse=True)
+        kept = set()
+        for i in ranked:
+            cost = estimate_tokens(rows[i])
+            # Leave room for the summary line of the items left out.
+            if used + cost + 40 > self.token_budget:
+                break
+            kept.add(i)
+            used += cost
+        lines = [header] + [rows[i] for i in sorted(kept)]
+        lines.append(self._summarize_rest([item for i, item in enumerate(receipt.line_items) if i not in kept]))
+        text = '\n'.join(lines)
+        return text, estimate_tokens(text)
+
+    @staticmethod
+    def _header(receipt: Receipt, level: int) -> str:
+        lines = [
+            f"RECEIPT: {receipt.merchant} | date {receipt.date} | location {receipt.location} | "
+            f"total ${receipt.receipt_total} | subtotal ${receipt.subtotal} | tax ${receipt.tax} | "
+            f"event {receipt.event_name} | quality {receipt.completeness_score}",
+        ]
+        if receipt.flags:
+            lines.append(f"FLAGS: {'; '.join(receipt.flags)}")
+        columns = "# | amount | item | category | approval" + (" | justification" if level < NO_JUSTIFICATION else "")
+        lines.append(f"ITEMS ({len(receipt.line_items)}; {columns}):")
+        return '\n'.join(lines)
+
+    @staticmethod
+    def _row(position: int, item, level: int) -> str:
+        name = item.item
+        if level >= SHORT_NAMES and len(name) > SHORT_ITEM_CHARS:
+            name = name[:SHORT_ITEM_CHARS - 3] + '...'
+        row = f"{position} | ${item.amount} | {name} | {item.category}"
+        if item.needs_approval:
+            reason = item.approval_reason if level < NO_APPROVAL_REASON else ''
+            row += f" | NEEDS APPROVAL: {reason}" if reason else " | NEEDS APPROVAL"
+        elif level < NO_JUSTIFICATION and item.justification:
+            row += " | -"
+        if level < NO_JUSTIFICATION and item.justification:
+            row += f" | {item.justification}"
+        return row
+
+    @staticmethod
+    def _summarize_rest(items: list) -> str:
+        totals = {}
+        for item in items:
+            totals[item.category] = totals.get(item.category, 0) + item.amount_cents
+        by_category = ', '.join(f"{category} ${format_cents(cents)}"
+                                for category, cents in sorted(totals.items(), key=lambda x: x[1], reverse=True))
+        approvals = sum(1 for item in items if item.needs_approval)
+        line = f"... {len(items)} more items totaling ${format_cents(sum(totals.values()))} ({by_category})"
+        if approvals:
+            line += f"; {approvals} of them need approval"
+        return line
@@ -3,53 +3,213 @@ Receipt data model and core processing logic.
 """
 
 import os
-import sys
-import json
-import re
+import time
+import hashlib
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from PIL import Image
-import google.generativeai as genai
 from dotenv import load_dotenv
 
+from models.gemini_client import MissingAPIKeyError
+from models.model_backend import create_backend
+from models.metrics import metrics, MODEL_REQUESTS, MODEL_TOKENS, JSON_REPAIRS, TIER_RESULTS
+from models.extraction_cache import ExtractionCache
+from models.image_preprocessor import ImagePreprocessor
+from models.receipt_types import Receipt, format_cents
+from models.receipt_tiles import merge_tile_receipts
+from models.extraction_router import ExtractionTier, check_receipt, DEFAULT_MIN_COMPLETENESS
+from models.json_extractor import extract_json_object, extract_json_array, JSONExtractionError
+
 # Load environment variables from .env file
 load_dotenv()
 
+# Bump whenever the extraction prompt changes so cached results are not reused.
+PROMPT_VERSION = "1"
+# How much of an unparseable response to print when reporting the failure.
+RESPONSE_EXCERPT_CHARS = 300
+# Upper bound for --pack; larger packs risk truncated responses.
+MAX_PACK_SIZE = 10
+REQUEST_KINDS = ('single', 'packed', 'tiled', 'escalated')
+
 
 class ReceiptProcessor:
-    """Core receipt processing model."""
+    """Core receipt processing model.
+
+    With ``pack_size`` above 1, batches send up to that many images in one
+    request and ask for a JSON array with one receipt per image. Requests go
+    to ``backend`` (see ``models.model_backend``); by default the one named
+    by ``RECEIPT_MODEL_BACKEND``.
+
+    Every extraction is checked locally (see ``check_receipt``). With an
+    ``escalation`` tier, receipts failing the checks are extracted again
+    with it, and the better of the two extractions is kept.
+    """
     
-    def __init__(self):
-        self.model = self._configure_gemini()
-    
-    def _configure_gemini(self):
-        """Configure the Gemini model and ensure API key is present."""
-        api_key = os.getenv('GEMINI_API_KEY')
-        if not api_key:
-            print("Error: GEMINI_API_KEY environment variable not set.")
-            print("Please copy .env.example to .env and set your API key.")
-            sys.exit(1)
-            sys.exit(1)
-        
-        genai.configure(api_key=api_key)
-        return genai.GenerativeModel("gemini-1.5-flash")
-    
-    def analyze_receipt_image(self, image_path: str, event_name: str = None) -> str:
-        """Analyze a receipt image and generate structured data."""
+    def __init__(self, cache: ExtractionCache | None = None, preprocessor: ImagePreprocessor | None = None,
+                 pack_size: int = 1, backend=None, escalation: ExtractionTier | None = None,
+                 min_grade: str = DEFAULT_MIN_COMPLETENESS):
+        self.backend = backend or create_backend()
+        self.cache = cache
+        self.preprocessor = preprocessor or ImagePreprocessor()
+        self.pack_size = max(1, min(pack_size, MAX_PACK_SIZE))
+        self.tiers = [ExtractionTier('fast', self.backend, self.preprocessor)]
+        if escalation:
+            self.tiers.append(escalation)
+        self.min_grade = min_grade
+        self._stats_lock = threading.Lock()
+        # Per request kind ('single', 'packed', 'tiled' or 'escalated'): requests, receipts sent and token counts.
+        # 'retried' counts packed receipts that had to be re-sent on their own.
+        self.request_stats = {
+            kind: {'requests': 0, 'receipts': 0, 'retried': 0, 'prompt_tokens': 0, 'output_tokens': 0}
+            for kind in REQUEST_KINDS
+        }
+        # Per tier: receipts checked, how many passed, and extractions timed with their total seconds.
+        self.tier_stats = {
+            tier.name: {'receipts': 0, 'accepted': 0, 'extractions': 0, 'seconds': 0.0}
+            for tier in self.tiers
+        }
+    
+    def analyze_receipt_image(self, image_path: str, event_name: str = None, image_bytes: bytes | None = None) -> str:
+        """Analyze a receipt image and generate structured data.
+
+        If ``image_bytes`` is given it is used instead of re-reading ``image_path``.
+        The image goes through the pre-processor before being sent.
+        """
+        image_parts = self._prepare_image(image_path, image_bytes, tile=False)
+        if image_parts is None:
+            return ""
+        prompt = self._build_prompt(event_name)
+        return self._generate([prompt, image_parts[0]], 'single', 1)
+    
+    def _prepare_image(self, image_path: str, image_bytes: bytes | None, tile: bool,
+                       preprocessor: ImagePreprocessor | None = None) -> list[dict] | None:
+        """Read and pre-process an image into model parts, or return None if it cannot be opened.
+
+        With ``tile`` a tall image comes back as several overlapping tiles.
+        """
+        preprocessor = preprocessor or self.preprocessor
         try:
-            image = Image.open(image_path)
+            if image_bytes is None:
+                with open(image_path, 'rb') as f:
+                    image_bytes = f.read()
+            if tile:
+                return preprocessor.process_tiles(image_bytes, os.path.basename(image_path))
+            return [preprocessor.process(image_bytes, os.path.basename(image_path))]
         except FileNotFoundError:
+            metrics.error('read_image')
             print(f"Error: Image file not found at {image_path}")
-            return ""
+            return None
         except Exception as e:
             print(f"Error opening image {image_path}: {e}")
+            return None
+    
+    def analyze_receipt_tiles(self, image_parts: list[dict], event_name: str = None,
+                              tier: ExtractionTier | None = None) -> list[str]:
+        """Analyze the tiles of one tall receipt concurrently, one request per tile.
+
+        Returns the responses in tile order; a failed request gives "".
+        """
+        tier = tier or self.tiers[0]
+        kind = 'tiled' if tier is self.tiers[0] else 'escalated'
+        count = len(image_parts)
+        contents = [[self._build_prompt(event_name, tile=(index, count), strict=tier.strict), image_part]
+                    for index, image_part in enumerate(image_parts, 1)]
+        with ThreadPoolExecutor(max_workers=count) as executor:
+            responses = list(executor.map(
+                lambda tile_contents: self._generate(tile_contents, kind, 0, tier.backend), contents))
+        with self._stats_lock:
+            self.request_stats[kind]['receipts'] += 1
+        return responses
+    
+    def analyze_receipt_pack(self, image_parts: list[dict], event_name: str = None) -> str:
+        """Analyze several pre-processed receipt images in a single request.
+
+        Each image is preceded by an ``Image N`` label that the response
+        refers back to.
+        """
+        contents = [self._build_prompt(event_name, len(image_parts))]
+        for index, image_part in enumerate(image_parts, 1):
+            contents.append(f"Image {index}:")
+            contents.append(image_part)
+        return self._generate(contents, 'packed', len(image_parts))
+    
+    def _generate(self, contents: list, kind: str, receipts: int, backend=None) -> str:
+        """Call the model, or ``backend`` if given, and record request and token usage.
+
+        ``MissingAPIKeyError`` propagates, so cached receipts and reports from
+        the store still work offline but a batch stops at its first request.
+        """
+        metrics.inc(MODEL_REQUESTS, kind=kind)
+        try:
+            # Covers the upload and the model's latency; the SDK does not report them separately.
+            with metrics.stage('model_request'):
+                response = (backend or self.backend).generate(contents)
+        except MissingAPIKeyError:
+            raise
+        except Exception as e:
+            print(f"An error occurred during the API call: {e}")
             return ""
+        
+        prompt_tokens = response.prompt_tokens
+        output_tokens = response.output_tokens
+        metrics.inc(MODEL_TOKENS, prompt_tokens, kind=kind, direction='prompt')
+        metrics.inc(MODEL_TOKENS, output_tokens, kind=kind, direction='output')
+        with self._stats_lock:
+            stats = self.request_stats[kind]
+            stats['requests'] += 1
+            stats['receipts'] += receipts
+            stats['prompt_tokens'] += prompt_tokens
+            stats['output_tokens'] += output_tokens
+        return response.text
+    
+    def _build_prompt(self, event_name: str = None, image_count: int = 1, tile: tuple[int, int] | None = None,
+                      strict: bool = False) -> str:
+        """Build the extraction prompt, optionally scoped to an event.
 
-        event_context = f"This receipt is for the business event: '{event_name}'." if event_name else ""
+        With ``image_count`` above 1 the prompt asks for a JSON array with one
+        receipt object per image. ``tile`` is ``(part, parts)`` when the image
+        is one strip of a tall receipt. ``strict`` asks the model to check its
+        reading before answering, for receipts escalated after a failed extraction.
+        """
+        if image_count == 1:
+            subject = "the provided receipt IMAGE"
+            event_context = f"This receipt is for the business event: '{event_name}'." if event_name else ""
+            looking_at = "You are looking directly at a photo of a receipt."
+            if tile:
+                part, parts = tile
+                subject = "the provided section of a receipt IMAGE"
+                looking_at = (f"You are looking at part {part} of {parts} of one long receipt, cut into overlapping "
+                              "horizontal strips from top to bottom. Extract only what is visible in this part: fill "
+                              "in `merchant`, `date`, `location`, `receipt_total`, `subtotal` and `tax` only if they "
+                              "are printed in it, and otherwise use their defaults. Include an item cut off at the top "
+                              "or bottom edge only if both its name and price are readable. Do not flag totals that "
+                              "do not match, since the other parts hold the remaining items.")
+            output_format = ("Your entire response MUST be a single, valid JSON object. Do not include any text, "
+                             "explanations, or markdown formatting outside of the JSON structure itself.")
+        else:
+            subject = f"each of the {image_count} provided receipt IMAGES"
+            event_context = f"These receipts are for the business event: '{event_name}'." if event_name else ""
+            looking_at = ("You are looking at photos of separate receipts, each introduced by an \"Image N\" label. "
+                          "Never mix items or totals between images.")
+            output_format = (f"Your entire response MUST be a single, valid JSON array of exactly {image_count} objects, "
+                             "one per image, in image order. Each object has all the fields above plus `image_index`: "
+                             "the number N from that image's \"Image N\" label. Do not include any text, "
+                             "explanations, or markdown formatting outside of the JSON structure itself.")
+        
+        checks = ""
+        if strict:
+            balance = ("" if tile else "Check that the line item amounts add up to the subtotal (or the total "
+                       "less tax if there is no subtotal). If they do not, look again for missed, duplicated or "
+                       "misread lines before answering. ")
+            checks = ("\n6.  **Double-Check:** A previous reading of this receipt was rejected. Read every line "
+                      f"again. {balance}Record discounts and coupons as line items with negative amounts. Grade "
+                      "`completeness_score` strictly.")
         
-        prompt = f"""You are an expert financial processor for a business organization. Your task is to analyze the provided receipt IMAGE and convert it into a structured JSON format.
+        return f"""You are an expert financial processor for a business organization. Your task is to analyze {subject} and convert it into a structured JSON format.
 
 **CONTEXT:**
-- You are looking directly at a photo of a receipt. Use your vision capabilities to read all text, including logos and layouts, to understand the contents.
+- {looking_at} Use your vision capabilities to read all text, including logos and layouts, to understand the contents.
 - The business can only reimburse expenses directly related to its operations.
 {event_context}
 
@@ -71,156 +231,503 @@ class ReceiptProcessor:
 4.  **Add Flags:**
     - Create a list of strings in the `flags` field for any major problems, such as "Receipt total does not match sum of line items", "Potentially personal items found", or "Date is missing". **Do not** flag store numbers or transaction IDs.
 5.  **Assess Quality:**
-    - `completeness_score`: Give an A-F grade based on how clear and complete the receipt image is. (A=perfect, C=readable but missing info, F=unreadable).
+    - `completeness_score`: Give an A-F grade based on how clear and complete the receipt image is. (A=perfect, C=readable but missing info, F=unreadable).{checks}
 
 **REQUIRED OUTPUT FORMAT:**
-Your entire response MUST be a single, valid JSON object. Do not include any text, explanations, or markdown formatting outside of the JSON structure itself.
+{output_format}
 """
-        try:
-            response = self.model.generate_content([prompt, image])
-            return response.text
-        except Exception as e:
-            print(f"An error occurred during the API call: {e}")
-            return ""
     
-    def parse_receipt_json(self, json_text: str) -> dict | None:
-        """Parse response and robustly extract JSON data using regex."""
+    def parse_receipt_json(self, json_text: str) -> Receipt | None:
+        """Parse response and robustly extract JSON data.
+
+        Markdown fences are stripped and common defects such as trailing
+        commas or truncated output are repaired. The JSON is then validated
+        into a ``Receipt``.
+        """
         if not json_text:
             return None
         
-        # Regex to find a JSON object, even if it's wrapped in markdown
-        match = re.search(r"```json\s*(\{.*?\})\s*```", json_text, re.DOTALL)
-        if not match:
-            match = re.search(r"(\{.*\})", json_text, re.DOTALL)
+        try:
+            with metrics.stage('parse'):
+                data, repairs = extract_json_object(json_text)
+        except JSONExtractionError as e:
+            print(f"Error: {e}")
+            excerpt = json_text[:RESPONSE_EXCERPT_CHARS]
+            print(f"--- Response excerpt ({len(json_text)} chars) ---\n{excerpt}\n--------------------------")
+            return None
+        
+        if repairs:
+            metrics.inc(JSON_REPAIRS)
+            print(f"  -> Repaired model JSON ({', '.join(repairs)}).")
+        return Receipt.from_dict(data)
+    
+    def parse_packed_json(self, json_text: str, count: int) -> list[Receipt | None]:
+        """Parse a packed response into one receipt per image, in image order.
+
+        Objects are matched to images by their ``image_index``. Images with no
+        usable object in the response come back as ``None``.
+        """
+        results = [None] * count
+        if not json_text:
+            return results
+        
+        try:
+            with metrics.stage('parse'):
+                items, complete = extract_json_array(json_text)
+        except JSONExtractionError as e:
+            print(f"Error: {e}")
+            excerpt = json_text[:RESPONSE_EXCERPT_CHARS]
+            print(f"--- Response excerpt ({len(json_text)} chars) ---\n{excerpt}\n--------------------------")
+            return results
+        
+        if not complete:
+            metrics.error('parse')
+            print(f"  -> Packed response was cut off after {len(items)} of {count} receipt(s).")
+        items = [item for item in items if isinstance(item, dict)]
+        indexed = all('image_index' in item for item in items)
+        if not indexed and complete and len(items) == count:
+            # No labels, but exactly one object per image: fall back to order.
+            indexed = True
+            for position, item in enumerate(items, 1):
+                item['image_index'] = position
+        if not indexed:
+            return results
+        
+        for item in items:
+            try:
+                position = int(item.pop('image_index')) - 1
+            except (TypeError, ValueError):
+                continue
+            if 0 <= position < count and results[position] is None:
+                results[position] = Receipt.from_dict(item)
+        return results
+    
+    def process_single_receipt(self, image_path: str, event_name: str = None,
+                               image_bytes: bytes | None = None) -> Receipt | None:
+        """Process a single receipt image and return structured data.
 
-        if match:
-            json_str = match.group(1)
+        With ``image_bytes`` the image is taken from memory, and ``image_path``
+        only names the receipt.
+        """
+        print(f"  -> Analyzing image: {os.path.basename(image_path)}")
+        with metrics.stage('receipt'):
             try:
-                return json.loads(json_str)
-            except json.JSONDecodeError as e:
-                print(f"Error parsing JSON: {e}")
-                print(f"--- Received malformed JSON string ---\n{json_str}\n------------------------------------")
+                cache_key, receipt_data, image_bytes = self._lookup_cache(image_path, event_name, image_bytes)
+                if image_bytes is None:
+                    with open(image_path, 'rb') as f:
+                        image_bytes = f.read()
+            except OSError as e:
+                metrics.error('read_image')
+                print(f"Error opening image {image_path}: {e}")
                 return None
-        else:
-            print("Error: No valid JSON object found in the response.")
-            print(f"--- Full Response ---\n{json_text}\n--------------------------")
-            return None
+            
+            if receipt_data is None:
+                receipt_data = self._extract_single(image_path, event_name, cache_key, image_bytes)
+            if receipt_data is None:
+                metrics.error('receipt')
+            return self._finish_receipt(receipt_data, image_path, event_name, image_bytes)
     
-    def process_single_receipt(self, image_path: str, event_name: str = None) -> dict | None:
-        """Process a single receipt image and return structured data."""
-        print(f"  -> Analyzing image: {os.path.basename(image_path)}")
-        response = self.analyze_receipt_image(image_path, event_name)
+    def process_receipt_pack(self, image_paths: list[str], event_name: str = None) -> list[Receipt | None]:
+        """Process several receipts with one model request, in the order of ``image_paths``.
+
+        Cached receipts are not sent. Receipts missing from the packed
+        response (cut off, unlabelled or unparseable) are retried one per request.
+        """
+        results = [None] * len(image_paths)
+        to_send = []
+        for position, path in enumerate(image_paths):
+            print(f"  -> Analyzing image: {os.path.basename(path)}")
+            try:
+                cache_key, receipt_data, image_bytes = self._lookup_cache(path, event_name)
+                if receipt_data is None and image_bytes is None:
+                    with open(path, 'rb') as f:
+                        image_bytes = f.read()
+            except OSError as e:
+                print(f"Error opening image {path}: {e}")
+                continue
+            if receipt_data is not None:
+                results[position] = self._finish_receipt(receipt_data, path, event_name, image_bytes)
+            else:
+                to_send.append((position, path, cache_key, image_bytes))
+        
+        if len(to_send) == 1:
+            position, path, cache_key, image_bytes = to_send[0]
+            receipt_data = self._extract_single(path, event_name, cache_key, image_bytes)
+            results[position] = self._finish_receipt(receipt_data, path, event_name, image_bytes)
+            return results
+        
+        packed = []
+        image_parts = []
+        for entry in to_send:
+            position, path, cache_key, image_bytes = entry
+            try:
+                parts = self.preprocessor.process_tiles(image_bytes, os.path.basename(path))
+            except Exception as e:
+                print(f"Error opening image {path}: {e}")
+                continue
+            if len(parts) > 1:
+                # Tall receipts are split into tiles and sent on their own.
+                receipt_data = self._extract_single(path, event_name, cache_key, image_bytes, parts)
+                results[position] = self._finish_receipt(receipt_data, path, event_name, image_bytes)
+            else:
+                image_parts.extend(parts)
+                packed.append(entry)
+        if len(packed) == 1:
+            position, path, cache_key, image_bytes = packed[0]
+            receipt_data = self._extract_single(path, event_name, cache_key, image_bytes, image_parts)
+            results[position] = self._finish_receipt(receipt_data, path, event_name, image_bytes)
+        if len(packed) <= 1:
+            return results
         
-        if not response:
+        print(f"  -> Sending {len(packed)} receipts in one request.")
+        response = self.analyze_receipt_pack(image_parts, event_name)
+        parsed = self.parse_packed_json(response, len(packed))
+        for (position, path, cache_key, image_bytes), receipt_data in zip(packed, parsed):
+            if receipt_data is None:
+                print(f"  -> {os.path.basename(path)} missing from packed response; retrying on its own.")
+                with self._stats_lock:
+                    self.request_stats['packed']['retried'] += 1
+                receipt_data = self._extract_single(path, event_name, cache_key, image_bytes)
+            else:
+                receipt_data = self._route(receipt_data, path, event_name, cache_key, image_bytes)
+            results[position] = self._finish_receipt(receipt_data, path, event_name, image_bytes)
+        return results
+    
+    def _lookup_cache(self, image_path: str, event_name: str = None, image_bytes: bytes | None = None):
+        """Return ``(cache_key, cached receipt or None, image bytes or None)`` for an image.
+
+        Raises ``OSError`` if the cache is on and the image cannot be read.
+        """
+        if not (self.cache and self.cache.enabled):
+            return None, None, image_bytes
+        if image_bytes is None:
+            with open(image_path, 'rb') as f:
+                image_bytes = f.read()
+        cache_key = self.cache.make_key(image_bytes, self.backend.name, PROMPT_VERSION, self.preprocessor.signature(),
+                                        event_name or '')
+        cached = self.cache.get(cache_key)
+        if cached is None:
+            return cache_key, None, image_bytes
+        print("  -> Loaded from extraction cache.")
+        return cache_key, Receipt.from_dict(cached), image_bytes
+    
+    def _extract_single(self, image_path: str, event_name: str = None, cache_key: str = None,
+                        image_bytes: bytes | None = None, image_parts: list[dict] | None = None) -> Receipt | None:
+        """Send one image to the model, escalate the result if it fails the checks, and cache it.
+
+        A tall image is sent as overlapping tiles whose receipts are merged.
+        ``image_parts`` is the image already pre-processed for the fast tier.
+        """
+        receipt_data = self._extract_with(self.tiers[0], image_path, event_name, image_bytes, image_parts)
+        return self._route(receipt_data, image_path, event_name, cache_key, image_bytes)
+    
+    def _route(self, receipt_data: Receipt | None, image_path: str, event_name: str = None, cache_key: str = None,
+               image_bytes: bytes | None = None) -> Receipt | None:
+        """Check a fast-tier extraction and escalate it through the other tiers until one passes.
+
+        The extraction with the fewest problems is kept and cached.
+        """
+        problems = self._check(self.tiers[0], receipt_data)
+        for tier in self.tiers[1:]:
+            if not problems:
+                break
+            print(f"  -> Escalating to the {tier.name} tier: {'; '.join(problems)}.")
+            escalated = self._extract_with(tier, image_path, event_name, image_bytes)
+            escalated_problems = self._check(tier, escalated)
+            if escalated is not None and (receipt_data is None or len(escalated_problems) <= len(problems)):
+                receipt_data, problems = escalated, escalated_problems
+        if receipt_data and cache_key:
+            self.cache.put(cache_key, receipt_data.to_dict())
+        return receipt_data
+    
+    def _check(self, tier: ExtractionTier, receipt_data: Receipt | None) -> list[str]:
+        """Run the local checks on one tier's extraction and count the outcome for that tier."""
+        problems = check_receipt(receipt_data, self.min_grade)
+        metrics.inc(TIER_RESULTS, tier=tier.name, outcome='failed' if problems else 'accepted')
+        with self._stats_lock:
+            stats = self.tier_stats[tier.name]
+            stats['receipts'] += 1
+            stats['accepted'] += not problems
+        return problems
+    
+    def _extract_with(self, tier: ExtractionTier, image_path: str, event_name: str = None,
+                      image_bytes: bytes | None = None, image_parts: list[dict] | None = None) -> Receipt | None:
+        """Extract a receipt with one tier and record how long it took."""
+        start = time.perf_counter()
+        with metrics.stage(f'extract_{tier.name}'):
+            if image_parts is None:
+                image_parts = self._prepare_image(image_path, image_bytes, tile=True, preprocessor=tier.preprocessor)
+            if image_parts is None:
+                print("  -> Analysis failed.")
+                receipt_data = None
+            else:
+                receipt_data = self._extract_parts(image_parts, event_name, tier)
+        with self._stats_lock:
+            stats = self.tier_stats[tier.name]
+            stats['extractions'] += 1
+            stats['seconds'] += time.perf_counter() - start
+        return receipt_data
+    
+    def _extract_parts(self, image_parts: list[dict], event_name: str = None,
+                       tier: ExtractionTier | None = None) -> Receipt | None:
+        """Extract a receipt from its pre-processed image, or from the tiles of a tall one."""
+        tier = tier or self.tiers[0]
+        if len(image_parts) == 1:
+            kind = 'single' if tier is self.tiers[0] else 'escalated'
+            prompt = self._build_prompt(event_name, strict=tier.strict)
+            responses = [self._generate([prompt, image_parts[0]], kind, 1, tier.backend)]
+        else:
+            responses = self.analyze_receipt_tiles(image_parts, event_name, tier)
+        if not any(responses):
             print("  -> Analysis failed.")
             return None
-
-        receipt_data = self.parse_receipt_json(response)
         
+        if len(responses) == 1:
+            return self.parse_receipt_json(responses[0])
+        return merge_tile_receipts([self.parse_receipt_json(response) for response in responses])
+    
+    def _finish_receipt(self, receipt_data: Receipt | None, image_path: str, event_name: str = None,
+                        image_bytes: bytes | None = None) -> Receipt | None:
+        """Attach file, content hash and event details to an extracted receipt."""
         if receipt_data:
-            receipt_data['file_name'] = os.path.basename(image_path)
-            receipt_data['event_name'] = event_name or 'General'
-            receipt_data['processed_date'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            receipt_data.file_name = os.path.basename(image_path)
+            receipt_data.file_path = image_path
+            receipt_data.event_name = event_name or 'General'
+            receipt_data.processed_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            if image_bytes is not None:
+                receipt_data.content_hash = hashlib.sha256(image_bytes).hexdigest()
             print("  -> Successfully parsed response.")
         else:
             print("  -> Failed to parse response.")
-            
         return receipt_data
     
-    def process_event_receipts(self, image_paths: list[str], event_name: str) -> list[dict]:
+    def process_event_receipts(self, image_paths: list[str], event_name: str, concurrency: int = 1) -> list[Receipt]:
         """Process multiple receipts for an event and show progress."""
-        receipts_data = []
+        return list(self.iter_event_receipts(image_paths, event_name, concurrency))
+    
+    def iter_event_receipts(self, image_paths: list[str], event_name: str, concurrency: int = 1):
+        """Yield each successfully processed receipt as soon as it is ready.
+
+        With ``concurrency`` above 1, up to that many requests run at once on
+        a thread pool. Each request covers one receipt, or up to ``pack_size``
+        receipts in packing mode. Receipts are still yielded in the order of
+        ``image_paths``, and only a small window of them is held at a time.
+        """
         total_receipts = len(image_paths)
         print(f"\nProcessing {total_receipts} receipts for event: '{event_name}'")
         
-        for i, path in enumerate(image_paths, 1):
-            print(f"\n--- Processing receipt {i}/{total_receipts} ---")
-            try:
-                receipt_data = self.process_single_receipt(path, event_name)
-                receipts_data.append(receipt_data)
-            except Exception as e:
-                print(f"FATAL ERROR processing {path}: {e}")
-                receipts_data.append(None)
+        chunks = [(start + 1, image_paths[start:start + self.pack_size])
+                  for start in range(0, total_receipts, self.pack_size)]
+        if self.pack_size > 1:
+            print(f"Packing up to {self.pack_size} receipts per request.")
+        
+        workers = max(1, min(concurrency, len(chunks)))
+        if workers == 1:
+            for first_index, chunk in chunks:
+                for receipt_data in self._process_chunk_safely(chunk, event_name, first_index, total_receipts):
+                    if receipt_data is not None:
+                        yield receipt_data
+            return
+        
+        print(f"Running up to {workers} extractions concurrently.")
+        executor = ThreadPoolExecutor(max_workers=workers)
+        pending = deque()
+        try:
+            for first_index, chunk in chunks:
+                pending.append(executor.submit(self._process_chunk_safely, chunk, event_name,
+                                               first_index, total_receipts))
+                if len(pending) < workers * 2:
+                    continue
+                for receipt_data in pending.popleft().result():
+                    if receipt_data is not None:
+                        yield receipt_data
+            while pending:
+                for receipt_data in pending.popleft().result():
+                    if receipt_data is not None:
+                        yield receipt_data
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+    
+    def _process_chunk_safely(self, paths: list[str], event_name: str, first_index: int,
+                              total: int) -> list[Receipt | None]:
+        """Process one request's worth of a batch, isolating any failure to it."""
+        if len(paths) == 1:
+            print(f"\n--- Processing receipt {first_index}/{total} ---")
+        else:
+            print(f"\n--- Processing receipts {first_index}-{first_index + len(paths) - 1}/{total} ---")
+        try:
+            if len(paths) == 1:
+                return [self.process_single_receipt(paths[0], event_name)]
+            return self.process_receipt_pack(paths, event_name)
+        except MissingAPIKeyError:
+            # Every other request would fail the same way.
+            raise
+        except Exception as e:
+            print(f"FATAL ERROR processing {', '.join(paths)}: {e}")
+            return []
+    
+    def request_summary(self) -> dict:
+        """Return model requests and tokens per receipt, overall and per request kind.
+
+        The ``single`` figures are the one-receipt-per-call baseline that
+        packed requests are compared against.
+        """
+        with self._stats_lock:
+            stats = {kind: dict(values) for kind, values in self.request_stats.items()}
+        stats['total'] = {key: sum(stats[kind][key] for kind in REQUEST_KINDS)
+                          for key in ('requests', 'receipts', 'retried', 'prompt_tokens', 'output_tokens')}
+        # A retried or escalated receipt was sent twice but extracted once.
+        stats['total']['receipts'] -= stats['total']['retried'] + stats['escalated']['receipts']
+        for values in stats.values():
+            receipts = values['receipts']
+            values['requests_per_receipt'] = values['requests'] / receipts if receipts else 0.0
+            values['tokens_per_receipt'] = ((values['prompt_tokens'] + values['output_tokens']) / receipts
+                                            if receipts else 0.0)
+        return stats
+    
+    def tier_summary(self) -> dict:
+        """Return, per tier in escalation order, the share of receipts that passed the checks and mean latency.
+
+        Receipts extracted in packed requests are checked but not timed, so
+        ``mean_seconds`` covers one-receipt extractions only.
+        """
+        with self._stats_lock:
+            stats = {tier.name: dict(self.tier_stats[tier.name]) for tier in self.tiers}
+        for values in stats.values():
+            values['hit_rate'] = values['accepted'] / values['receipts'] if values['receipts'] else 0.0
+            values['mean_seconds'] = values['seconds'] / values['extractions'] if values['extractions'] else 0.0
+        return stats
+
+
+class SummaryAggregator:
+    """Running totals for the summary report, updated as receipts arrive.
+
+    All rollups (category, vendor, approvals, flags and counts) are computed
+    in a single pass over the line items, in exact integer cents.
+    """
+    
+    def __init__(self):
+        self.total_cents = 0
+        self.receipt_count = 0
+        self.line_item_count = 0
+        self.category_totals = {}
+        self.vendor_totals = {}
+        self.flagged_receipts = []
+        self.approval_items = []
+    
+    def add(self, receipt: Receipt):
+        """Fold one receipt into the running totals."""
+        self.add_many((receipt,))
+    
+    def add_many(self, receipts):
+        """Fold an iterable of receipts into the running totals in one pass."""
+        category_totals = self.category_totals
+        vendor_totals = self.vendor_totals
+        approval_items = self.approval_items
+        total_cents = self.total_cents
+        receipt_count = 0
+        line_item_count = 0
         
-        return [r for r in receipts_data if r is not None]
+        for receipt in receipts:
+            receipt_count += 1
+            line_items = receipt.line_items
+            line_item_count += len(line_items)
+            
+            if receipt.flags:
+                self.flagged_receipts.append({
+                    'file': receipt.file_name,
+                    'flags': receipt.flags,
+                    'score': receipt.completeness_score
+                })
+            
+            vendor = receipt.merchant
+            for item in line_items:
+                amount = item.amount_cents
+                total_cents += amount
+                category_totals[item.category] = category_totals.get(item.category, 0) + amount
+                vendor_totals[vendor] = vendor_totals.get(vendor, 0) + amount
+                
+                if item.needs_approval:
+                    approval_items.append({
+                        'item': item.item,
+                        'amount': amount,
+                        'reason': item.approval_reason,
+                        'file': receipt.file_name
+                    })
+        
+        self.total_cents = total_cents
+        self.receipt_count += receipt_count
+        self.line_item_count += line_item_count
 
 
 class ReportGenerator:
     """Handles report generation and data analysis."""
     
-    def generate_summary_report(self, receipts_data: list[dict]) -> str:
-        """Generate a comprehensive summary report for multiple receipts."""
-        total_spent = 0
-        category_totals = {}
-        vendor_totals = {}
-        flagged_receipts = []
-        approval_items = []
-        
-        for receipt in receipts_data:
-            if receipt.get('flags'):
-                flagged_receipts.append({
-                    'file': receipt.get('file_name', ''),
-                    'flags': receipt.get('flags', []),
-                    'score': receipt.get('completeness_score', 'N/A')
-                })
-                
-            for item in receipt.get('line_items', []):
-                try:
-                    amount = float(item.get('amount', '0').replace('$', ''))
-                    total_spent += amount
-                    
-                    category = item.get('category', 'Miscellaneous')
-                    category_totals[category] = category_totals.get(category, 0) + amount
-                    
-                    vendor = receipt.get('merchant', 'Unknown Vendor')
-                    vendor_totals[vendor] = vendor_totals.get(vendor, 0) + amount
-                    
-                    if item.get('needs_approval'):
-                        approval_items.append({
-                            'item': item.get('item', ''),
-                            'amount': amount,
-                            'reason': item.get('approval_reason', ''),
-                            'file': receipt.get('file_name', '')
-                        })
-                except (ValueError, AttributeError):
-                    continue
+    def generate_summary_report(self, receipts_data, duplicates: list[dict] | None = None,
+                                generated_at: datetime | None = None) -> str:
+        """Generate a comprehensive summary report for multiple receipts.
+
+        ``receipts_data`` may be any iterable of receipts; it is consumed once.
+        ``duplicates`` lists receipts skipped as near-duplicates of another one.
+        """
+        aggregator = SummaryAggregator()
+        aggregator.add_many(receipts_data)
+        return self.render_summary_report(aggregator, duplicates, generated_at)
+    
+    def render_summary_report(self, aggregator: SummaryAggregator, duplicates: list[dict] | None = None,
+                              generated_at: datetime | None = None) -> str:
+        """Render the summary report from running totals."""
+        total_cents = aggregator.total_cents
+        approval_items = aggregator.approval_items
+        flagged_receipts = aggregator.flagged_receipts
+        generated_at = generated_at or datetime.now()
         
-        report = f"""=== BUSINESS EXPENSE SUMMARY REPORT ===
-Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+        parts = [f"""=== BUSINESS EXPENSE SUMMARY REPORT ===
+Generated: {generated_at.strftime('%Y-%m-%d %H:%M:%S')}
 
 FINANCIAL OVERVIEW:
-Total Amount Submitted: ${total_spent:.2f}
-Number of Receipts Processed: {len(receipts_data)}
-Number of Line Items: {sum(len(r.get('line_items', [])) for r in receipts_data)}
+Total Amount Submitted: ${format_cents(total_cents)}
+Number of Receipts Processed: {aggregator.receipt_count}
+Number of Line Items: {aggregator.line_item_count}
 
 SPENDING BY CATEGORY:
-"""
+"""]
+        append = parts.append
         
-        for category, amount in sorted(category_totals.items(), key=lambda x: x[1], reverse=True):
-            percentage = (amount / total_spent * 100) if total_spent > 0 else 0
-            report += f"  - {category:<25} ${amount:>8.2f} ({percentage:.1f}%)\n"
+        for category, amount in sorted(aggregator.category_totals.items(), key=lambda x: x[1], reverse=True):
+            percentage = (amount / total_cents * 100) if total_cents > 0 else 0
+            append(f"  - {category:<25} ${format_cents(amount):>8} ({percentage:.1f}%)\n")
         
-        report += f"\nTOP VENDORS:\n"
-        for vendor, amount in sorted(vendor_totals.items(), key=lambda x: x[1], reverse=True)[:5]:
-            report += f"  - {vendor:<25} ${amount:>8.2f}\n"
+        append("\nTOP VENDORS:\n")
+        for vendor, amount in sorted(aggregator.vendor_totals.items(), key=lambda x: x[1], reverse=True)[:5]:
+            append(f"  - {vendor:<25} ${format_cents(amount):>8}\n")
         
         if approval_items:
-            report += f"\nITEMS REQUIRING APPROVAL ({len(approval_items)}):\n"
-            for item in approval_items:
-                report += f"  - {item['item']} - ${item['amount']:.2f} ({item['reason']}) | File: {item['file']}\n"
+            append(f"\nITEMS REQUIRING APPROVAL ({len(approval_items)}):\n")
+            parts.extend(
+                f"  - {item['item']} - ${format_cents(item['amount'])} ({item['reason']}) | File: {item['file']}\n"
+                for item in approval_items
+            )
         
         if flagged_receipts:
-            report += f"\nFLAGGED RECEIPTS ({len(flagged_receipts)}):\n"
+            append(f"\nFLAGGED RECEIPTS ({len(flagged_receipts)}):\n")
             for receipt in flagged_receipts:
-                report += f"  - {receipt['file']} (Score: {receipt['score']})\n"
-                for flag in receipt['flags']:
-                    report += f"    - {flag}\n"
+                append(f"  - {receipt['file']} (Score: {receipt['score']})\n")
+                parts.extend(f"    - {flag}\n" for flag in receipt['flags'])
+        
+        if duplicates:
+            append(f"\nDUPLICATE RECEIPTS SKIPPED ({len(duplicates)}):\n")
+            for duplicate in duplicates:
+                origin = f" (previously processed for '{duplicate['duplicate_of_event']}')" if duplicate.get('previous_run') else ""
+                append(f"  - {duplicate['file_name']}: duplicate of {duplicate['duplicate_of']}{origin}\n")
         
-        report += f"\nRECOMMENDATIONS:\n"
-        report += "  - Review the generated CSV file for accuracy before submitting.\n"
+        append("\nRECOMMENDATIONS:\n")
+        append("  - Review the generated CSV file for accuracy before submitting.\n")
         if approval_items:
-            report += f"  - Seek financial manager/supervisor sign-off for the {len(approval_items)} item(s) requiring approval.\n"
+            append(f"  - Seek financial manager/supervisor sign-off for the {len(approval_items)} item(s) requiring approval.\n")
         if flagged_receipts:
-            report += f"  - Check the original images for the {len(flagged_receipts)} flagged receipt(s) to clarify issues.\n"
+            append(f"  - Check the original images for the {len(flagged_receipts)} flagged receipt(s) to clarify issues.\n")
+        if duplicates:
+            append(f"  - Confirm the {len(duplicates)} receipt(s) skipped as duplicates were not separate purchases.\n")
         
-        return report
+        return ''.join(parts)
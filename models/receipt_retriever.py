@@ -0,0 +1,529 @@
+"""
+In-memory BM25 retrieval over historical line items, for questions that span receipts.
+"""
+
+import os
+import re
+import heapq
+import threading
+from array import array
+from math import log
+
+from models.receipt_store import ReceiptStore
+from models.receipt_types import format_cents
+from models.receipt_context import estimate_tokens
+
+DEFAULT_TOP_K = 20
+# Rough token allowance for retrieved history in one prompt.
+DEFAULT_HISTORY_TOKENS = int(os.getenv('RECEIPT_RAG_HISTORY_TOKENS', '1500'))
+# Aggregates that need a scan are skipped when it would touch more line items than this.
+AGGREGATE_SCAN_LIMIT = 20_000
+# A named entity with at most this many line items is ranked by scoring each of them directly.
+DIRECT_SCORE_LIMIT = 4096
+# Top-k retrieval may stop once no unseen line item can beat the k-th best score by more than this
+# fraction. Scores of near-identical line items are nearly flat, and exact ranking among them is not
+# worth walking every posting.
+SCORE_TOLERANCE = 0.05
+
+K1 = 1.2
+B = 0.75
+# BM25F field weights: a term in the merchant name counts more than one in a justification.
+FIELD_WEIGHTS = (('merchant', 3.0), ('item', 2.0), ('category', 1.0), ('justification', 0.5))
+ENTITY_TYPES = ('merchant', 'category', 'event')
+MAX_ENTITY_WORDS = 4
+# Names too generic to read as a filter when they appear in a question.
+GENERIC_NAMES = frozenset({'general'})
+
+# Words that carry no retrieval signal in questions about spending.
+STOPWORDS = frozenset("""
+a about across all along also am an and any are as at be been by can did do does done for from get got had has
+have how i in is it its me my of on or our per show so than that the their them there these this those to us
+was we were what when where which who why will with you your much many total spend spent spending paid pay buy
+bought purchase purchases purchased cost costs receipt receipts event events item items ever list since until
+before after between more less least most above below greater over under
+""".split())
+
+AMOUNT_MIN = re.compile(r'\b(?:over|above|more than|greater than|at least)\s*\$?(\d+(?:\.\d+)?)')
+AMOUNT_MAX = re.compile(r'\b(?:under|below|less than|at most)\s*\$?(\d+(?:\.\d+)?)')
+DATE_FROM = re.compile(r'\b(?:since|after|from)\s+(\d{4}-\d{2}-\d{2})')
+DATE_TO = re.compile(r'\b(?:before|until|through)\s+(\d{4}-\d{2}-\d{2})')
+YEAR = re.compile(r'\b(?:in|during)\s+(\d{4})\b')
+WORD = re.compile(r"[a-z0-9]+")
+
+
+def stem(word: str) -> str:
+    """Reduce simple English plurals to their singular form."""
+    if len(word) > 4 and word.endswith('ies'):
+        return word[:-3] + 'y'
+    if len(word) > 3 and word.endswith(('xes', 'ches', 'shes', 'sses')):
+        return word[:-2]
+    if len(word) > 3 and word.endswith('s') and not word.endswith(('ss', 'us', 'is')):
+        return word[:-1]
+    return word
+
+
+def tokenize(text: str) -> list[str]:
+    """Split text into stemmed content words."""
+    return [stem(word) for word in WORD.findall(text.lower())
+            if len(word) > 1 and word not in STOPWORDS and not word.isdigit()]
+
+
+def entity_key(text: str) -> str:
+    """Normalize a merchant, category or event name, or a span of a question, for exact matching."""
+    return ' '.join(stem(word) for word in WORD.findall(text.lower()) if word not in STOPWORDS)
+
+
+def parse_filters(question: str) -> tuple[str, dict]:
+    """Pull amount and date bounds out of a question.
+
+    Recognizes phrases like "over $75", "since 2025-01-01" and "in 2024".
+    Returns the question with those phrases removed and a dict of
+    ``min_amount``, ``max_amount``, ``date_from`` and ``date_to`` filters.
+    """
+    text = question.lower()
+    filters = {}
+    for pattern, key in ((AMOUNT_MIN, 'min_amount'), (AMOUNT_MAX, 'max_amount'),
+                         (DATE_FROM, 'date_from'), (DATE_TO, 'date_to')):
+        match = pattern.search(text)
+        if match:
+            filters[key] = float(match.group(1)) if key.endswith('amount') else match.group(1)
+            text = text[:match.start()] + ' ' + text[match.end():]
+    match = YEAR.search(text)
+    if match and 'date_from' not in filters and 'date_to' not in filters:
+        filters['date_from'] = f"{match.group(1)}-01-01"
+        filters['date_to'] = f"{match.group(1)}-12-31"
+        text = text[:match.start()] + ' ' + text[match.end():]
+    return text, filters
+
+
+def _date_key(date: str) -> int:
+    """Turn ``YYYY-MM-DD`` into a sortable integer, or 0 if the date is missing."""
+    try:
+        return int(date[:4]) * 10000 + int(date[5:7]) * 100 + int(date[8:10])
+    except (TypeError, ValueError):
+        return 0
+
+
+def _count(totals: list, receipt_id: int, amount_cents: int):
+    """Add a line item to ``[line items, receipts, cents, last receipt]`` running totals.
+
+    A receipt's line items are indexed one after another, so comparing with
+    the last receipt counted is enough to count each receipt once.
+    """
+    totals[0] += 1
+    totals[2] += amount_cents
+    if totals[3] != receipt_id:
+        totals[1] += 1
+        totals[3] = receipt_id
+
+
+def _matches(totals) -> dict:
+    """Turn running totals into the ``matches`` dict returned by retrieval."""
+    return {'line_items': totals[0], 'receipts': totals[1], 'total_cents': totals[2]}
+
+
+class _Postings:
+    """Documents containing one term, with each document's BM25 impact and their running totals."""
+
+    __slots__ = ('docs', 'impacts', 'ordered', 'totals')
+
+    def __init__(self):
+        self.docs = array('I')
+        self.impacts = array('f')
+        self.ordered = True
+        self.totals = [0, 0, 0, None]
+
+    def by_impact(self):
+        """Sort by descending impact, which top-k retrieval relies on."""
+        if not self.ordered:
+            order = sorted(range(len(self.docs)), key=self.impacts.__getitem__, reverse=True)
+            self.docs = array('I', [self.docs[i] for i in order])
+            self.impacts = array('f', [self.impacts[i] for i in order])
+            self.ordered = True
+        return self
+
+
+class _Entities:
+    """Known names of one kind (merchants, categories or events) and their line items."""
+
+    __slots__ = ('ids', 'names', 'docs')
+
+    def __init__(self):
+        self.ids = {}    # normalized name -> id
+        self.names = []  # id -> display name
+        self.docs = []   # id -> array of doc numbers, ascending
+
+    def add(self, name: str, doc: int) -> int:
+        key = entity_key(name or '') or (name or '').lower()
+        entity_id = self.ids.get(key)
+        if entity_id is None:
+            entity_id = self.ids[key] = len(self.names)
+            self.names.append(name)
+            self.docs.append(array('I'))
+        self.docs[entity_id].append(doc)
+        return entity_id
+
+
+class ReceiptRetriever:
+    """BM25 index over every stored line item, with fielded filters and exact aggregates.
+
+    The index is held in memory as impact-ordered postings plus a forward
+    index per line item. Top-k retrieval uses an approximate threshold
+    algorithm, so it usually stops after a few hundred postings however
+    common a term is.
+    Merchant, category and event names found in a question become exact
+    filters, and their spending totals are kept up to date as line items are
+    indexed for every combination of them. The index catches up with the store on every query, so newly
+    processed receipts are searchable straight away.
+    """
+
+    def __init__(self, store: ReceiptStore, top_k: int = DEFAULT_TOP_K,
+                 token_budget: int = DEFAULT_HISTORY_TOKENS):
+        self.store = store
+        self.top_k = top_k
+        self.token_budget = token_budget
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        """Empty the index, so the next refresh rebuilds it from the whole store."""
+        self._generation = self.store.generation()
+        self._last_line_item_id = 0
+        self._term_ids = {}
+        self._postings = []
+        self._total_length = 0.0
+        # Per-document columns, indexed by document number.
+        self._line_item_ids = array('q')
+        self._receipt_ids = array('q')
+        self._amounts = array('q')
+        self._dates = array('l')
+        self._entity_columns = {kind: array('I') for kind in ENTITY_TYPES}
+        # Forward index: terms of document d are at _doc_offsets[d]:_doc_offsets[d + 1].
+        self._doc_offsets = array('I', [0])
+        self._doc_terms = array('I')
+        self._doc_impacts = array('f')
+        self._entities = {kind: _Entities() for kind in ENTITY_TYPES}
+        # (merchant ID, category ID, event ID), with None for "any" -> [line items, receipts, cents, last receipt]
+        self._totals = {}
+
+    def __len__(self):
+        return len(self._line_item_ids)
+
+    def version(self) -> str:
+        """Return a value that changes whenever indexed history changes."""
+        return f"{self._generation}.{self._last_line_item_id}"
+
+    def refresh(self) -> int:
+        """Index line items stored since the last refresh and return how many were added.
+
+        The index only appends, so it is rebuilt when the store reports that
+        line items were replaced or removed.
+        """
+        with self._lock:
+            if self.store.generation() != self._generation:
+                self._reset()
+            if self.store.last_line_item_id() <= self._last_line_item_id:
+                return 0
+            added = 0
+            for row in self.store.iter_line_item_rows(self._last_line_item_id):
+                self._add_row(row)
+                added += 1
+            return added
+
+    def retrieve(self, question: str, exclude_receipt: str = None) -> dict:
+        """Find the line items most relevant to a question, and totals for what it names.
+
+        ``exclude_receipt`` is the content hash of a receipt whose
+        line items are left out of the hits, such as the receipt already in
+        the prompt. Returns ``hits`` as ``(score, receipt fields, LineItem)``
+        tuples, the parsed ``terms``, ``filters`` and ``entities``, and
+        ``matches`` (line items, receipts and cents in the matched scope) or
+        None when the scope is too broad to total.
+        """
+        text, filters = parse_filters(question)
+        with self._lock:
+            self.refresh()
+            entities, rest = self._find_entities(entity_key(text).split())
+            # Words that named an entity are already exact filters, so only the rest are ranked on.
+            terms = list(dict.fromkeys(word for word in rest if len(word) > 1 and not word.isdigit()))
+            excluded = None
+            if exclude_receipt is not None:
+                excluded = self.store.find_receipt_id(exclude_receipt)
+
+            candidates = self._entity_candidates(entities)
+            matches = self._aggregate(terms, entities, filters, candidates, self._make_filter(entities, filters))
+            ranked = self._rank(terms, candidates, self._make_filter(entities, filters, excluded))
+            line_item_ids = [self._line_item_ids[doc] for _, doc in ranked]
+
+        details = self.store.get_line_items(line_item_ids)
+        hits = [(score, *details[self._line_item_ids[doc]]) for score, doc in ranked
+                if self._line_item_ids[doc] in details]
+        return {
+            'hits': hits,
+            'matches': matches,
+            'terms': terms,
+            'filters': filters,
+            'entities': {kind: [self._entities[kind].names[i] for i in ids] for kind, ids in entities.items()},
+        }
+
+    def format_context(self, retrieval: dict, token_budget: int = None) -> str:
+        """Render retrieved history as prompt context within a token budget.
+
+        Totals for the matched scope come first, then line items in rank
+        order until the budget is used up. Returns an empty string if nothing matched.
+        """
+        if not retrieval['hits'] and not retrieval['matches']:
+            return ""
+        budget = self.token_budget if token_budget is None else token_budget
+
+        scope = [f"{kind}: {', '.join(names)}" for kind, names in retrieval['entities'].items()]
+        scope += [f"{key}: {value}" for key, value in retrieval['filters'].items()]
+        if retrieval['terms']:
+            scope.append(f"search: {' '.join(retrieval['terms'])}")
+        lines = [f"HISTORICAL RECEIPTS ({'; '.join(scope)}):"]
+        matches = retrieval['matches']
+        if matches:
+            lines.append(f"All matching line items: {matches['line_items']} on {matches['receipts']} receipts, "
+                         f"totaling ${format_cents(matches['total_cents'])}")
+        lines.append("Most relevant line items (date | merchant | event | item | amount | category):")
+
+        used = estimate_tokens('\n'.join(lines))
+        for _, receipt, item in retrieval['hits']:
+            line = (f"- {receipt['date']} | {receipt['merchant']} | {receipt['event_name']} | "
+                    f"{item.item} | ${item.amount} | {item.category}")
+            cost = estimate_tokens(line)
+            if used + cost > budget:
+                break
+            lines.append(line)
+            used += cost
+        return '\n'.join(lines)
+
+    def _add_row(self, row):
+        line_item_id, receipt_id, merchant, date, event_name, item, category, justification, amount_cents = row
+        doc = len(self._line_item_ids)
+        amount_cents = amount_cents or 0
+        self._line_item_ids.append(line_item_id)
+        self._receipt_ids.append(receipt_id)
+        self._amounts.append(amount_cents)
+        self._dates.append(_date_key(date))
+        entity_ids = []
+        for kind, name in (('merchant', merchant), ('category', category), ('event', event_name)):
+            entity_id = self._entities[kind].add(name, doc)
+            self._entity_columns[kind].append(entity_id)
+            entity_ids.append(entity_id)
+        self._add_totals(entity_ids, receipt_id, amount_cents)
+
+        weighted = {}
+        length = 0.0
+        for (_, weight), text in zip(FIELD_WEIGHTS, (merchant, item, category, justification)):
+            for token in tokenize(text or ''):
+                weighted[token] = weighted.get(token, 0.0) + weight
+                length += weight
+        self._total_length += length
+        # Impacts use the average length seen so far, which settles quickly on real data.
+        average = self._total_length / (doc + 1) or 1.0
+        norm = K1 * (1 - B + B * length / average)
+        for token, frequency in weighted.items():
+            impact = frequency * (K1 + 1) / (frequency + norm)
+            term_id = self._term_ids.get(token)
+            if term_id is None:
+                term_id = self._term_ids[token] = len(self._postings)
+                self._postings.append(_Postings())
+            postings = self._postings[term_id]
+            postings.docs.append(doc)
+            postings.impacts.append(impact)
+            postings.ordered = False
+            _count(postings.totals, receipt_id, amount_cents)
+            self._doc_terms.append(term_id)
+            self._doc_impacts.append(impact)
+        self._doc_offsets.append(len(self._doc_terms))
+        self._last_line_item_id = line_item_id
+
+    def _add_totals(self, entity_ids: list[int], receipt_id: int, amount_cents: int):
+        """Add a line item to the running totals of every combination of its entities."""
+        merchant, category, event = entity_ids
+        for key in ((merchant, None, None), (None, category, None), (None, None, event),
+                    (merchant, category, None), (merchant, None, event), (None, category, event),
+                    (merchant, category, event)):
+            totals = self._totals.get(key)
+            if totals is None:
+                totals = self._totals[key] = [0, 0, 0, None]
+            _count(totals, receipt_id, amount_cents)
+
+    def named_entities(self, question: str) -> dict[str, list[str]]:
+        """Return the stored merchant, category and event names a question mentions, by kind."""
+        text, _ = parse_filters(question)
+        with self._lock:
+            self.refresh()
+            entities, _ = self._find_entities(entity_key(text).split())
+            return {kind: [self._entities[kind].names[i] for i in ids] for kind, ids in entities.items()}
+
+    def _find_entities(self, words: list[str]) -> tuple[dict[str, list[int]], list[str]]:
+        """Find known merchants, categories and events named in the question, longest names first.
+
+        Returns their IDs by kind, and the words that were not part of a name.
+        """
+        tokens = words
+        found = {}
+        used = set()
+        for size in range(min(MAX_ENTITY_WORDS, len(tokens)), 0, -1):
+            for start in range(len(tokens) - size + 1):
+                span = range(start, start + size)
+                if any(i in used for i in span):
+                    continue
+                key = ' '.join(tokens[start:start + size])
+                if key in GENERIC_NAMES:
+                    continue
+                for kind in ENTITY_TYPES:
+                    entity_id = self._entities[kind].ids.get(key)
+                    if entity_id is not None:
+                        found.setdefault(kind, []).append(entity_id)
+                        used.update(span)
+                        break
+        return found, [word for i, word in enumerate(tokens) if i not in used]
+
+    def _entity_candidates(self, entities: dict) -> list[int] | None:
+        """Return the sorted docs of the most selective named entity kind, or None if none was named."""
+        best = None
+        for kind, ids in entities.items():
+            size = sum(len(self._entities[kind].docs[i]) for i in ids)
+            if best is None or size < best[0]:
+                best = (size, kind, ids)
+        if best is None:
+            return None
+        _, kind, ids = best
+        if len(ids) == 1:
+            return self._entities[kind].docs[ids[0]]
+        return sorted(doc for i in ids for doc in self._entities[kind].docs[i])
+
+    def _make_filter(self, entities: dict, filters: dict, excluded: int = None):
+        """Build a document predicate for the entity and field filters, or None if there are none.
+
+        ``excluded`` is a receipt ID whose line items are rejected.
+        """
+        checks = [(self._entity_columns[kind], frozenset(ids)) for kind, ids in entities.items()]
+        low = round(filters['min_amount'] * 100) if 'min_amount' in filters else None
+        high = round(filters['max_amount'] * 100) if 'max_amount' in filters else None
+        start = _date_key(filters['date_from']) if 'date_from' in filters else None
+        end = _date_key(filters['date_to']) if 'date_to' in filters else None
+        if not checks and low is None and high is None and start is None and end is None and excluded is None:
+            return None
+        amounts, dates, receipt_ids = self._amounts, self._dates, self._receipt_ids
+
+        def accept(doc):
+            for column, wanted in checks:
+                if column[doc] not in wanted:
+                    return False
+            if low is not None and amounts[doc] < low:
+                return False
+            if high is not None and amounts[doc] > high:
+                return False
+            if start is not None and dates[doc] < start:
+                return False
+            if end is not None and not 0 < dates[doc] <= end:
+                return False
+            return excluded is None or receipt_ids[doc] != excluded
+        return accept
+
+    def _idf(self, term_id: int) -> float:
+        n = len(self._line_item_ids)
+        df = len(self._postings[term_id].docs)
+        return log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def _score(self, doc: int, weights: dict) -> float:
+        score = 0.0
+        terms, impacts = self._doc_terms, self._doc_impacts
+        for j in range(self._doc_offsets[doc], self._doc_offsets[doc + 1]):
+            weight = weights.get(terms[j])
+            if weight is not None:
+                score += weight * impacts[j]
+        return score
+
+    def _rank(self, terms: list[str], candidates, accept) -> list[tuple[float, int]]:
+        """Return the top-k ``(score, doc)`` pairs accepted by ``accept``, best first."""
+        k = self.top_k
+        weights = {}
+        for term in terms:
+            term_id = self._term_ids.get(term)
+            if term_id is not None:
+                weights[term_id] = self._idf(term_id)
+        allowed = accept or (lambda doc: True)
+
+        if not weights:
+            if candidates is None:
+                return []
+            # Nothing to rank on: list the most recently stored matching line items.
+            ranked = []
+            for doc in reversed(candidates):
+                if allowed(doc):
+                    ranked.append((0.0, doc))
+                    if len(ranked) == k:
+                        break
+            return ranked
+
+        postings = [self._postings[term_id].by_impact() for term_id in weights]
+        if candidates is not None and (len(candidates) <= DIRECT_SCORE_LIMIT
+                                       or len(candidates) * 8 <= sum(len(p.docs) for p in postings)):
+            # A small named entity narrows things down more than the terms do: score its line items directly.
+            return heapq.nlargest(k, ((self._score(doc, weights), doc) for doc in candidates if allowed(doc)))
+
+        # Threshold algorithm: walk each term's postings in impact order, and stop once no
+        # unseen document can beat the current k-th best score by more than SCORE_TOLERANCE.
+        term_weights = list(weights.values())
+        cursors = [0] * len(postings)
+        heap = []
+        seen = set()
+        while True:
+            threshold = 0.0
+            exhausted = True
+            for i, plist in enumerate(postings):
+                if cursors[i] < len(plist.docs):
+                    threshold += term_weights[i] * plist.impacts[cursors[i]]
+                    exhausted = False
+            if exhausted or (len(heap) >= k and heap[0][0] >= threshold * (1 - SCORE_TOLERANCE)):
+                break
+            for i, plist in enumerate(postings):
+                if cursors[i] >= len(plist.docs):
+                    continue
+                doc = plist.docs[cursors[i]]
+                cursors[i] += 1
+                if doc in seen:
+                    continue
+                seen.add(doc)
+                if not allowed(doc):
+                    continue
+                entry = (self._score(doc, weights), doc)
+                if len(heap) < k:
+                    heapq.heappush(heap, entry)
+                elif entry > heap[0]:
+                    heapq.heapreplace(heap, entry)
+        return sorted(heap, reverse=True)
+
+    def _aggregate(self, terms: list[str], entities: dict, filters: dict, candidates, accept) -> dict | None:
+        """Total the line items in the question's scope.
+
+        The scope is the named entities plus field filters, or, if no entity
+        was named, every line item containing a search term. Returns None if
+        the scope is empty or would take too long to scan.
+        """
+        if candidates is not None and not filters and all(len(ids) == 1 for ids in entities.values()):
+            # Running totals answer one name per entity kind without scanning.
+            key = tuple(entities[kind][0] if kind in entities else None for kind in ENTITY_TYPES)
+            return _matches(self._totals.get(key, (0, 0, 0)))
+        if candidates is None:
+            term_ids = [self._term_ids[term] for term in terms if term in self._term_ids]
+            if len(term_ids) == 1 and not filters:
+                return _matches(self._postings[term_ids[0]].totals)
+            if not term_ids or sum(len(self._postings[t].docs) for t in term_ids) > AGGREGATE_SCAN_LIMIT:
+                return None
+            candidates = {doc for t in term_ids for doc in self._postings[t].docs}
+        elif len(candidates) > AGGREGATE_SCAN_LIMIT:
+            return None
+
+        docs = [doc for doc in candidates if accept(doc)] if accept is not None else candidates
+        amounts, receipt_ids = self._amounts, self._receipt_ids
+        return {
+            'line_items': len(docs),
+            'receipts': len({receipt_ids[doc] for doc in docs}),
+            'total_cents': sum(amounts[doc] for doc in docs),
+        }
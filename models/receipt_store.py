@@ -0,0 +1,311 @@
+"""
+Embedded SQLite store of every processed receipt, for queries across runs and events.
+"""
+
+import os
+import json
+import sqlite3
+import threading
+
+from models.receipt_types import Receipt, LineItem
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_DB_PATH = os.getenv('RECEIPT_DB_PATH', os.path.join(PROJECT_ROOT, 'results', 'receipts.db'))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS receipts (
+    id INTEGER PRIMARY KEY,
+    event_name TEXT,
+    file_name TEXT,
+    file_path TEXT,
+    merchant TEXT,
+    date TEXT,
+    location TEXT,
+    subtotal_cents INTEGER,
+    tax_cents INTEGER,
+    receipt_total_cents INTEGER,
+    completeness_score TEXT,
+    flags TEXT,
+    processed_date TEXT,
+    content_hash TEXT
+);
+CREATE TABLE IF NOT EXISTS line_items (
+    id INTEGER PRIMARY KEY,
+    receipt_id INTEGER NOT NULL REFERENCES receipts(id) ON DELETE CASCADE,
+    position INTEGER,
+    item TEXT,
+    amount_cents INTEGER,
+    category TEXT,
+    justification TEXT,
+    needs_approval INTEGER,
+    approval_reason TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_receipts_event ON receipts(event_name);
+CREATE INDEX IF NOT EXISTS idx_receipts_merchant ON receipts(merchant);
+CREATE INDEX IF NOT EXISTS idx_receipts_date ON receipts(date);
+CREATE INDEX IF NOT EXISTS idx_line_items_receipt ON line_items(receipt_id);
+CREATE INDEX IF NOT EXISTS idx_line_items_category ON line_items(category, amount_cents);
+CREATE TABLE IF NOT EXISTS store_meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER
+);
+"""
+# A receipt is one image, wherever and however its path was given; processing it again updates its row.
+IDENTITY_INDEX = "CREATE UNIQUE INDEX idx_receipts_content ON receipts(content_hash) WHERE content_hash <> ''"
+# Dates are compared as text, so date filters only apply to ISO dates.
+ISO_DATE = "[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]*"
+
+RECEIPT_COLUMNS = [
+    'event_name', 'file_name', 'file_path', 'merchant', 'date', 'location',
+    'subtotal_cents', 'tax_cents', 'receipt_total_cents', 'completeness_score', 'flags', 'processed_date',
+    'content_hash',
+]
+LINE_ITEM_COLUMNS = ['item', 'amount_cents', 'category', 'justification', 'needs_approval', 'approval_reason']
+
+
+class ReceiptStore:
+    """SQLite-backed receipt and line-item tables with indexed lookups.
+
+    Receipts can be bulk-inserted as a batch streams in and read back as the
+    same ``Receipt`` objects the pipeline produces, so reports and CSV exports can be built
+    from indexed queries over historical data.
+    """
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.executescript(SCHEMA)
+        self._migrate()
+
+    def _migrate(self):
+        """Key receipts on image content in databases created before they were.
+
+        Older databases keyed rows on the processing time, so every re-run
+        added a copy of each receipt; only the newest row per file path is
+        kept. Later ones keyed rows on the path as typed, so the same image
+        given by another path was stored again; only the newest row per
+        image is kept.
+        """
+        with self._lock, self._conn:
+            columns = [row[1] for row in self._conn.execute("PRAGMA table_info(receipts)")]
+            removed = 0
+            if 'content_hash' not in columns:
+                self._conn.execute("ALTER TABLE receipts ADD COLUMN content_hash TEXT")
+                removed += self._conn.execute(
+                    "DELETE FROM receipts WHERE id NOT IN (SELECT MAX(id) FROM receipts GROUP BY file_path)").rowcount
+            if not self._conn.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_receipts_content'").fetchone():
+                self._conn.execute("DROP INDEX IF EXISTS idx_receipts_identity")
+                removed += self._conn.execute(
+                    "DELETE FROM receipts WHERE content_hash <> '' AND id NOT IN "
+                    "(SELECT MAX(id) FROM receipts WHERE content_hash <> '' GROUP BY content_hash)").rowcount
+                self._conn.execute(IDENTITY_INDEX)
+            if removed:
+                self._bump_generation()
+
+    def generation(self) -> int:
+        """Return a counter that grows whenever stored line items are replaced or removed."""
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM store_meta WHERE key = 'generation'").fetchone()
+        return row[0] if row else 0
+
+    def _bump_generation(self):
+        self._conn.execute("INSERT INTO store_meta (key, value) VALUES ('generation', 1) "
+                           "ON CONFLICT(key) DO UPDATE SET value = value + 1")
+
+    def add_receipts(self, receipts: list[Receipt]) -> int:
+        """Store receipts and their line items in one transaction.
+
+        A receipt already stored (same image content, under any path) is
+        updated in place, so re-running a batch does not count it twice. Its
+        line items are only rewritten if they changed. Returns the number of
+        receipts that were not stored before.
+        """
+        inserted = 0
+        line_item_rows = []
+        updates = ', '.join(f"{column} = excluded.{column}" for column in RECEIPT_COLUMNS)
+        with self._lock, self._conn:
+            for receipt in receipts:
+                values = [getattr(receipt, column) for column in RECEIPT_COLUMNS]
+                values[RECEIPT_COLUMNS.index('flags')] = json.dumps(receipt.flags)
+                # Rows stored before receipts had a content hash are replaced by this one.
+                if self._conn.execute("DELETE FROM receipts WHERE file_path = ? AND content_hash IS NULL",
+                                      (receipt.file_path,)).rowcount:
+                    self._bump_generation()
+                existing = None
+                if receipt.content_hash:
+                    existing = self._conn.execute("SELECT id FROM receipts WHERE content_hash = ?",
+                                                  (receipt.content_hash,)).fetchone()
+                receipt_id = self._conn.execute(
+                    f"INSERT INTO receipts ({', '.join(RECEIPT_COLUMNS)}) "
+                    f"VALUES ({', '.join('?' for _ in RECEIPT_COLUMNS)}) "
+                    f"ON CONFLICT(content_hash) WHERE content_hash <> '' DO UPDATE SET {updates} RETURNING id",
+                    values,
+                ).fetchone()[0]
+                rows = [(item.item, item.amount_cents, item.category, item.justification,
+                         1 if item.needs_approval else 0, item.approval_reason) for item in receipt.line_items]
+                if existing is None:
+                    inserted += 1
+                else:
+                    stored = self._conn.execute(
+                        f"SELECT {', '.join(LINE_ITEM_COLUMNS)} FROM line_items WHERE receipt_id = ? ORDER BY position",
+                        (receipt_id,)).fetchall()
+                    if stored == rows:
+                        continue
+                    self._conn.execute("DELETE FROM line_items WHERE receipt_id = ?", (receipt_id,))
+                    self._bump_generation()
+                line_item_rows.extend((receipt_id, position, *row) for position, row in enumerate(rows))
+            self._conn.executemany(
+                "INSERT INTO line_items (receipt_id, position, item, amount_cents, category, "
+                "justification, needs_approval, approval_reason) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                line_item_rows,
+            )
+        return inserted
+
+    def iter_receipts(self, event: str = None, merchant: str = None, category: str = None,
+                      min_amount: float = None, max_amount: float = None,
+                      date_from: str = None, date_to: str = None):
+        """Yield stored receipts matching the filters, oldest first.
+
+        Receipt-level filters (event, merchant, dates) select whole receipts.
+        Line-item filters (category, amount range) keep only matching items,
+        and receipts with no matching item are left out.
+        """
+        receipt_clauses, receipt_params = [], []
+        for column, value in (('event_name', event), ('merchant', merchant)):
+            if value is not None:
+                receipt_clauses.append(f"r.{column} = ? COLLATE NOCASE")
+                receipt_params.append(value)
+        if date_from or date_to:
+            receipt_clauses.append(f"r.date GLOB '{ISO_DATE}'")
+        if date_from:
+            receipt_clauses.append("r.date >= ?")
+            receipt_params.append(date_from)
+        if date_to:
+            receipt_clauses.append("r.date <= ?")
+            receipt_params.append(date_to)
+
+        item_clauses, item_params = [], []
+        if category is not None:
+            item_clauses.append("li.category = ? COLLATE NOCASE")
+            item_params.append(category)
+        if min_amount is not None:
+            item_clauses.append("li.amount_cents >= ?")
+            item_params.append(round(min_amount * 100))
+        if max_amount is not None:
+            item_clauses.append("li.amount_cents <= ?")
+            item_params.append(round(max_amount * 100))
+
+        join = "JOIN" if item_clauses else "LEFT JOIN"
+        where = receipt_clauses + item_clauses
+        query = (
+            f"SELECT r.id, {', '.join('r.' + c for c in RECEIPT_COLUMNS)}, "
+            "li.item, li.amount_cents, li.category, li.justification, li.needs_approval, li.approval_reason "
+            f"FROM receipts r {join} line_items li ON li.receipt_id = r.id "
+            f"{'WHERE ' + ' AND '.join(where) if where else ''} "
+            "ORDER BY r.processed_date, r.id, li.position"
+        )
+
+        # A dedicated connection lets results stream without holding the write lock.
+        reader = sqlite3.connect(self.db_path)
+        try:
+            yield from self._group_rows(reader.execute(query, receipt_params + item_params))
+        finally:
+            reader.close()
+
+    def _group_rows(self, rows):
+        """Rebuild receipts from joined receipt/line-item rows."""
+        current_id = None
+        receipt = None
+        for row in rows:
+            if row[0] != current_id:
+                if receipt is not None:
+                    yield receipt
+                current_id = row[0]
+                fields = dict(zip(RECEIPT_COLUMNS, row[1:1 + len(RECEIPT_COLUMNS)]))
+                fields['flags'] = json.loads(fields['flags'] or '[]')
+                fields['content_hash'] = fields['content_hash'] or ''
+                receipt = Receipt(**fields)
+            item, amount_cents, category, justification, needs_approval, approval_reason = row[1 + len(RECEIPT_COLUMNS):]
+            if amount_cents is not None:
+                receipt.line_items.append(LineItem(
+                    item=item,
+                    amount_cents=amount_cents,
+                    category=category,
+                    justification=justification,
+                    needs_approval=bool(needs_approval),
+                    approval_reason=approval_reason,
+                ))
+        if receipt is not None:
+            yield receipt
+
+    def iter_line_item_rows(self, after_id: int = 0, batch_size: int = 10000):
+        """Yield line items with their receipt's fields, in ID order, for IDs above ``after_id``.
+
+        Rows are ``(line_item_id, receipt_id, merchant, date, event_name, item,
+        category, justification, amount_cents)``. Used to build and refresh
+        search indexes incrementally.
+        """
+        reader = sqlite3.connect(self.db_path)
+        try:
+            cursor = reader.execute(
+                "SELECT li.id, li.receipt_id, r.merchant, r.date, r.event_name, li.item, li.category, "
+                "li.justification, li.amount_cents FROM line_items li JOIN receipts r ON r.id = li.receipt_id "
+                "WHERE li.id > ? ORDER BY li.id",
+                (after_id,),
+            )
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            reader.close()
+
+    def get_line_items(self, line_item_ids: list[int]) -> dict[int, tuple[dict, LineItem]]:
+        """Return ``{line_item_id: (receipt fields, LineItem)}`` for the given IDs."""
+        if not line_item_ids:
+            return {}
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT li.id, r.merchant, r.date, r.event_name, r.file_name, li.item, li.amount_cents, li.category, "
+                "li.justification, li.needs_approval, li.approval_reason FROM line_items li "
+                "JOIN receipts r ON r.id = li.receipt_id "
+                f"WHERE li.id IN ({', '.join('?' for _ in line_item_ids)})",
+                list(line_item_ids),
+            ).fetchall()
+        found = {}
+        for line_item_id, merchant, date, event_name, file_name, *item_fields in rows:
+            item, amount_cents, category, justification, needs_approval, approval_reason = item_fields
+            receipt_fields = {'merchant': merchant, 'date': date, 'event_name': event_name, 'file_name': file_name}
+            found[line_item_id] = (receipt_fields, LineItem(
+                item=item, amount_cents=amount_cents, category=category, justification=justification,
+                needs_approval=bool(needs_approval), approval_reason=approval_reason,
+            ))
+        return found
+
+    def find_receipt_id(self, content_hash: str) -> int | None:
+        """Return the stored ID of the receipt with this image content hash, or None if it was never stored."""
+        if not content_hash:
+            return None
+        with self._lock:
+            row = self._conn.execute("SELECT id FROM receipts WHERE content_hash = ?", (content_hash,)).fetchone()
+        return row[0] if row else None
+
+    def last_line_item_id(self) -> int:
+        """Return the newest line item's ID, which grows whenever receipts are added."""
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(MAX(id), 0) FROM line_items").fetchone()[0]
+
+    def count_receipts(self) -> int:
+        """Return the total number of stored receipts."""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM receipts").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
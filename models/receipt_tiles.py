@@ -0,0 +1,89 @@
+"""
+Merging of receipts extracted from overlapping tiles of one tall receipt image.
+"""
+
+import re
+from difflib import SequenceMatcher
+
+from models.receipt_types import Receipt, LineItem, COMPLETENESS_GRADES
+
+# Line items at the edge of a tile that are compared with the neighbouring tile.
+MAX_OVERLAP_ITEMS = 12
+# Item names at least this similar (0-1) are read as the same printed line.
+NAME_SIMILARITY = 0.6
+TOTALS_FLAG = "Receipt total does not match sum of line items"
+
+
+def _normalize(name: str) -> str:
+    return re.sub(r'[^a-z0-9]+', ' ', name.lower()).strip()
+
+
+def _same_line(a: LineItem, b: LineItem) -> bool:
+    """Whether two extracted items are the same printed line read from two tiles."""
+    if a.amount_cents != b.amount_cents:
+        return False
+    name_a, name_b = _normalize(a.item), _normalize(b.item)
+    if name_a == name_b or name_a.startswith(name_b) or name_b.startswith(name_a):
+        return True
+    return SequenceMatcher(None, name_a, name_b).ratio() >= NAME_SIMILARITY
+
+
+def overlap_length(previous: list[LineItem], following: list[LineItem]) -> int:
+    """Return how many leading items of ``following`` repeat the trailing items of ``previous``.
+
+    Tiles overlap, so the last lines read from one tile are usually the first
+    lines read from the next. The longest run of trailing items that matches
+    a run of leading items, line for line, is taken as the overlap.
+    """
+    longest = min(len(previous), len(following), MAX_OVERLAP_ITEMS)
+    for length in range(longest, 0, -1):
+        tail = previous[-length:]
+        if all(_same_line(a, b) for a, b in zip(tail, following[:length])):
+            return length
+    return 0
+
+
+def merge_tile_receipts(tiles: list[Receipt | None]) -> Receipt | None:
+    """Combine the receipts read from a tall image's tiles, listed top to bottom, into one.
+
+    Line items are concatenated, dropping those repeated in the overlap
+    between neighbouring tiles. Merchant, date and location come from the
+    first tile that shows them and the totals from the last, since receipts
+    print them at the top and bottom. Tiles that could not be read are
+    skipped and flagged. Returns None if no tile could be read.
+    """
+    readable = [tile for tile in tiles if tile is not None]
+    if not readable:
+        return None
+
+    merged = Receipt(merchant='Unknown Vendor', date='Not Available', location='Not Available',
+                     receipt_total_cents=0, subtotal_cents=0, tax_cents=0)
+    for tile in readable:
+        if merged.merchant == 'Unknown Vendor':
+            merged.merchant = tile.merchant
+        if merged.date == 'Not Available':
+            merged.date = tile.date
+        if merged.location == 'Not Available':
+            merged.location = tile.location
+        merged.line_items.extend(tile.line_items[overlap_length(merged.line_items, tile.line_items):])
+    for tile in reversed(readable):
+        if tile.receipt_total_cents:
+            merged.receipt_total_cents, merged.subtotal_cents, merged.tax_cents = (
+                tile.receipt_total_cents, tile.subtotal_cents, tile.tax_cents)
+            break
+
+    flags = []
+    for tile in readable:
+        flags.extend(flag for flag in tile.flags if flag not in flags and flag != TOTALS_FLAG)
+    for position, tile in enumerate(tiles, 1):
+        if tile is None:
+            flags.append(f"Part {position} of {len(tiles)} of the receipt could not be read")
+    items_cents = sum(item.amount_cents for item in merged.line_items)
+    expected = merged.subtotal_cents or merged.receipt_total_cents - merged.tax_cents
+    if merged.receipt_total_cents and items_cents != expected:
+        flags.append(TOTALS_FLAG)
+    merged.flags = flags
+
+    grades = [tile.completeness_score for tile in readable if tile.completeness_score in COMPLETENESS_GRADES]
+    merged.completeness_score = max(grades, key=COMPLETENESS_GRADES.index) if grades else 'N/A'
+    return merged
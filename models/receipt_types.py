@@ -0,0 +1,158 @@
+"""
+Typed receipt representation shared by the model, view, controller and RAG layers.
+"""
+
+import sys
+from dataclasses import dataclass, field
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+CENT = Decimal('0.01')
+# Completeness grades the model gives, best first.
+COMPLETENESS_GRADES = 'ABCDF'
+
+
+def parse_cents(value) -> int:
+    """Convert an amount such as ``"$1,234.50"``, ``12.5`` or ``""`` to integer cents.
+
+    Missing or unreadable amounts count as zero.
+    """
+    if value is None or isinstance(value, bool):
+        return 0
+    if isinstance(value, int):
+        return value * 100
+    text = str(value).strip().replace('$', '').replace(',', '')
+    if not text:
+        return 0
+    try:
+        return int(Decimal(text).quantize(CENT, rounding=ROUND_HALF_UP) * 100)
+    except (InvalidOperation, ValueError):
+        return 0
+
+
+def format_cents(cents: int) -> str:
+    """Format integer cents as a plain decimal string, e.g. ``1234`` -> ``"12.34"``."""
+    sign = '-' if cents < 0 else ''
+    cents = abs(cents)
+    return f"{sign}{cents // 100}.{cents % 100:02d}"
+
+
+def _text(value, default: str = '') -> str:
+    if value is None:
+        return default
+    return value if isinstance(value, str) else str(value)
+
+
+@dataclass(slots=True)
+class LineItem:
+    """One purchased item on a receipt."""
+
+    item: str
+    amount_cents: int
+    category: str
+    justification: str = ''
+    needs_approval: bool = False
+    approval_reason: str = ''
+
+    @property
+    def amount(self) -> str:
+        return format_cents(self.amount_cents)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'LineItem':
+        needs_approval = data.get('needs_approval', False)
+        if isinstance(needs_approval, str):
+            needs_approval = needs_approval.strip().lower() in ('true', 'yes', '1')
+        return cls(
+            item=_text(data.get('item'), 'Unknown Item'),
+            amount_cents=parse_cents(data.get('amount')),
+            category=sys.intern(_text(data.get('category'), 'Miscellaneous') or 'Miscellaneous'),
+            justification=_text(data.get('justification')),
+            needs_approval=bool(needs_approval),
+            approval_reason=_text(data.get('approval_reason')),
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            'item': self.item,
+            'amount': self.amount,
+            'category': self.category,
+            'justification': self.justification,
+            'needs_approval': self.needs_approval,
+            'approval_reason': self.approval_reason,
+        }
+
+
+@dataclass(slots=True)
+class Receipt:
+    """A parsed and validated receipt, with amounts held as integer cents."""
+
+    merchant: str
+    date: str
+    location: str
+    receipt_total_cents: int
+    subtotal_cents: int
+    tax_cents: int
+    line_items: list[LineItem] = field(default_factory=list)
+    flags: list[str] = field(default_factory=list)
+    completeness_score: str = 'N/A'
+    file_name: str = ''
+    file_path: str = ''
+    event_name: str = 'General'
+    processed_date: str = ''
+    # SHA-256 of the image file; with file_path it identifies the receipt in the store.
+    content_hash: str = ''
+
+    @property
+    def receipt_total(self) -> str:
+        return format_cents(self.receipt_total_cents)
+
+    @property
+    def subtotal(self) -> str:
+        return format_cents(self.subtotal_cents)
+
+    @property
+    def tax(self) -> str:
+        return format_cents(self.tax_cents)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'Receipt':
+        """Build a receipt from model JSON (or ``to_dict`` output), filling in defaults."""
+        raw_items = data.get('line_items') or []
+        flags = data.get('flags') or []
+        if isinstance(flags, str):
+            flags = [flags]
+        return cls(
+            merchant=_text(data.get('merchant'), 'Unknown Vendor') or 'Unknown Vendor',
+            date=_text(data.get('date'), 'Not Available'),
+            location=_text(data.get('location'), 'Not Available'),
+            receipt_total_cents=parse_cents(data.get('receipt_total')),
+            subtotal_cents=parse_cents(data.get('subtotal')),
+            tax_cents=parse_cents(data.get('tax')),
+            line_items=[LineItem.from_dict(item) for item in raw_items if isinstance(item, dict)],
+            flags=[_text(flag) for flag in flags],
+            completeness_score=sys.intern(_text(data.get('completeness_score'), 'N/A')),
+            file_name=_text(data.get('file_name')),
+            file_path=_text(data.get('file_path')),
+            event_name=sys.intern(_text(data.get('event_name'), 'General')),
+            processed_date=_text(data.get('processed_date')),
+            content_hash=_text(data.get('content_hash')),
+        )
+
+    def to_dict(self) -> dict:
+        """Serialize to the JSON shape the model produces, plus processing metadata."""
+        return {
+            'merchant': self.merchant,
+            'date': self.date,
+            'location': self.location,
+            'receipt_total': self.receipt_total,
+            'subtotal': self.subtotal,
+            'tax': self.tax,
+            'line_items': [item.to_dict() for item in self.line_items],
+            'flags': list(self.flags),
+            'completeness_score': self.completeness_score,
+            'file_name': self.file_name,
+            'file_path': self.file_path,
+            'event_name': self.event_name,
+            'processed_date': self.processed_date,
+            'content_hash': self.content_hash,
+        }
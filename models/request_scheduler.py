@@ -0,0 +1,222 @@
+"""
+Request pacing for the model: a token bucket shared by every process on the
+host, adaptive concurrency and jittered retries.
+"""
+
+import os
+import time
+import random
+import sqlite3
+import threading
+
+from models.metrics import metrics, MODEL_RETRIES
+from models.model_backend import ModelError, RateLimitError, TransientModelError
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_RATE_DB = os.getenv('RECEIPT_RATE_LIMIT_DB', os.path.join(PROJECT_ROOT, 'results', 'ratelimit.db'))
+# Model requests per minute for all processes together; 0 leaves requests unpaced.
+DEFAULT_RPM = float(os.getenv('RECEIPT_MODEL_RPM', '0'))
+# Requests that may be sent back to back after an idle spell (default: one second's worth).
+DEFAULT_BURST = float(os.getenv('RECEIPT_MODEL_BURST', '0'))
+DEFAULT_MAX_CONCURRENCY = int(os.getenv('RECEIPT_MODEL_MAX_CONCURRENCY', '16'))
+# Seconds a request may spend waiting and retrying before it is given up.
+DEFAULT_DEADLINE = float(os.getenv('RECEIPT_RETRY_DEADLINE', '120'))
+BASE_RETRY_DELAY = 1.0
+MAX_RETRY_DELAY = 30.0
+
+
+class SharedTokenBucket:
+    """Token bucket whose state lives in a SQLite file, so every process using it shares one budget.
+
+    Taking a token is a single conditional ``UPDATE`` that refills the bucket
+    for the time elapsed and takes one token only if one is available, so
+    concurrent processes never overdraw it. A throttled request starts a
+    cooldown that pauses every process, since they all share the quota that
+    was exceeded. With ``requests_per_minute`` at 0 only cooldowns apply.
+    Point ``RECEIPT_RATE_LIMIT_DB`` at the same file in every process.
+    """
+
+    def __init__(self, name: str, requests_per_minute: float = DEFAULT_RPM, burst: float = DEFAULT_BURST,
+                 db_path: str = DEFAULT_RATE_DB):
+        self.name = name
+        self.rate = requests_per_minute / 60
+        self.capacity = burst or max(1.0, self.rate)
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS token_bucket ("
+            "name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL, cooldown_until REAL NOT NULL)"
+        )
+        self._conn.execute("INSERT OR IGNORE INTO token_bucket VALUES (?, ?, ?, 0)",
+                           (name, self.capacity, time.time()))
+        self._conn.commit()
+
+    def acquire(self, timeout: float) -> bool:
+        """Wait for a token; return False if none becomes available within ``timeout`` seconds."""
+        give_up = time.monotonic() + timeout
+        while True:
+            wait = self._try_take()
+            if wait <= 0:
+                return True
+            if time.monotonic() + wait > give_up:
+                return False
+            time.sleep(wait)
+
+    def _try_take(self) -> float:
+        """Take a token if possible and return 0, or return the seconds until one may be available."""
+        now = time.time()
+        with self._lock, self._conn:
+            if self.rate <= 0:
+                cooldown_until = self._conn.execute(
+                    "SELECT cooldown_until FROM token_bucket WHERE name = ?", (self.name,)).fetchone()[0]
+                return max(0.0, cooldown_until - now)
+            taken = self._conn.execute(
+                "UPDATE token_bucket SET tokens = MIN(?, tokens + (? - updated) * ?) - 1, updated = ? "
+                "WHERE name = ? AND cooldown_until <= ? AND MIN(?, tokens + (? - updated) * ?) >= 1",
+                (self.capacity, now, self.rate, now, self.name, now, self.capacity, now, self.rate),
+            ).rowcount
+            if taken:
+                return 0.0
+            tokens, updated, cooldown_until = self._conn.execute(
+                "SELECT tokens, updated, cooldown_until FROM token_bucket WHERE name = ?", (self.name,)).fetchone()
+        refilled = min(self.capacity, tokens + (now - updated) * self.rate)
+        # Jitter spreads out processes that wake up for the same token.
+        refill_wait = (1 - refilled) / self.rate * random.uniform(1.0, 1.2)
+        return max(cooldown_until - now, refill_wait, 0.001)
+
+    def penalize(self, seconds: float):
+        """Empty the bucket and pause every process sharing it for ``seconds``."""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE token_bucket SET tokens = MIN(tokens, 0), cooldown_until = MAX(cooldown_until, ?) "
+                "WHERE name = ?", (now + seconds, self.name))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class AdaptiveConcurrency:
+    """Limit on in-flight requests with additive increase and multiplicative decrease (AIMD).
+
+    Each successful request raises the limit by ``1 / limit``, about one
+    more slot per round of requests; a throttled request halves it. Only
+    requests sent after the last decrease can decrease it again, so one
+    burst of 429s from requests already in flight counts once.
+    """
+
+    def __init__(self, max_limit: int = DEFAULT_MAX_CONCURRENCY, min_limit: int = 1):
+        self.max_limit = max(1, max_limit)
+        self.min_limit = max(1, min(min_limit, self.max_limit))
+        self.limit = float(self.max_limit)
+        self.in_flight = 0
+        self._decreased = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self, timeout: float) -> float | None:
+        """Wait for a free slot and return the time it was taken, or None on timeout."""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self.in_flight < int(self.limit), timeout):
+                return None
+            self.in_flight += 1
+            return time.monotonic()
+
+    def release(self, started: float, throttled: bool = False):
+        with self._cond:
+            self.in_flight -= 1
+            if throttled:
+                if started >= self._decreased:
+                    self.limit = max(self.min_limit, self.limit / 2)
+                    self._decreased = time.monotonic()
+            else:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+
+class RequestScheduler:
+    """Paces, limits and retries requests to a model backend, and is itself a backend.
+
+    Every request takes a token from the shared bucket and a slot from the
+    adaptive concurrency limit. Rate-limit and transient errors are retried
+    with full-jitter exponential backoff until the request's ``deadline``;
+    a rate-limit error also halves the concurrency limit and pauses every
+    process sharing the bucket. Other errors are raised at once.
+    """
+
+    def __init__(self, backend, bucket: SharedTokenBucket | None = None,
+                 concurrency: AdaptiveConcurrency | None = None, deadline: float = DEFAULT_DEADLINE,
+                 base_delay: float = BASE_RETRY_DELAY, max_delay: float = MAX_RETRY_DELAY):
+        self.backend = backend
+        self.bucket = bucket or SharedTokenBucket(backend.name)
+        self.concurrency = concurrency or AdaptiveConcurrency()
+        self.deadline = deadline
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    @property
+    def name(self) -> str:
+        return self.backend.name
+
+    def generate(self, contents, system_instruction: str = None):
+        return self._run(lambda: self.backend.generate(contents, system_instruction=system_instruction))
+
+    def generate_stream(self, contents, system_instruction: str = None):
+        """Yield the response in pieces; a request is only retried until its first piece arrives.
+
+        The request keeps its concurrency slot until the stream is exhausted or closed.
+        """
+        def first_piece():
+            stream = self.backend.generate_stream(contents, system_instruction=system_instruction)
+            return stream, next(stream, None)
+
+        (stream, first), started = self._run(first_piece, hold_slot=True)
+        try:
+            if first is not None:
+                yield first
+                yield from stream
+        finally:
+            self.concurrency.release(started)
+
+    def _run(self, call, hold_slot: bool = False):
+        """Call ``call`` within the rate and concurrency limits, retrying retryable errors.
+
+        With ``hold_slot``, the concurrency slot is not released on success and
+        ``(result, slot start time)`` is returned for the caller to release.
+        """
+        give_up = time.monotonic() + self.deadline
+        attempt = 0
+        while True:
+            with metrics.stage('rate_limit_wait'):
+                if not self.bucket.acquire(give_up - time.monotonic()):
+                    raise ModelError("Gave up waiting for the model rate limit")
+                started = self.concurrency.acquire(max(0.0, give_up - time.monotonic()))
+            if started is None:
+                raise ModelError("Gave up waiting for a free model request slot")
+            try:
+                result = call()
+            except RateLimitError as e:
+                self.concurrency.release(started, throttled=True)
+                self.bucket.penalize(self.base_delay)
+                error, reason = e, 'rate_limit'
+            except TransientModelError as e:
+                self.concurrency.release(started)
+                error, reason = e, 'transient'
+            except BaseException:
+                self.concurrency.release(started)
+                raise
+            else:
+                if hold_slot:
+                    return result, started
+                self.concurrency.release(started)
+                return result
+
+            attempt += 1
+            delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+            if time.monotonic() + delay >= give_up:
+                raise error
+            metrics.inc(MODEL_RETRIES, reason=reason)
+            time.sleep(delay)
@@ -0,0 +1,103 @@
+"""
+Content-addressed archive of uploaded receipt images, with a retention sweeper.
+"""
+
+import os
+import re
+import time
+import threading
+
+# Days to keep uploaded images; 0 processes uploads in memory without keeping them.
+DEFAULT_RETENTION_DAYS = float(os.getenv('RECEIPT_UPLOAD_RETENTION_DAYS', '0'))
+DEFAULT_MAX_BYTES = int(os.getenv('RECEIPT_UPLOAD_ARCHIVE_MAX_MB', '512')) * 1024 * 1024
+SWEEP_INTERVAL_SECONDS = float(os.getenv('RECEIPT_UPLOAD_SWEEP_INTERVAL', '3600'))
+# Only files named like archive entries are ever deleted by the sweeper.
+ARCHIVE_NAME = re.compile(r'^[0-9a-f]{64}\.[a-z0-9]+$')
+
+
+class UploadArchive:
+    """Keeps uploaded images under their SHA-256 for ``retention_days``.
+
+    The same image uploaded twice is stored once; uploading it again
+    refreshes its mtime and with it its retention. A background sweeper
+    deletes images older than the retention period, and the oldest ones
+    while the archive is over ``max_bytes``. With ``retention_days`` at 0
+    nothing is written and the sweeper does not run.
+    """
+
+    def __init__(self, folder: str, retention_days: float = DEFAULT_RETENTION_DAYS,
+                 max_bytes: int = DEFAULT_MAX_BYTES):
+        self.folder = folder
+        self.retention_days = retention_days
+        self.max_bytes = max_bytes
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.retention_days > 0
+
+    def store(self, image_bytes: bytes, content_hash: str, extension: str) -> str | None:
+        """Archive an image under its content hash and return its path, or None when retention is off."""
+        if not self.enabled:
+            return None
+        path = os.path.join(self.folder, f"{content_hash}.{extension.lower()}")
+        try:
+            if os.path.exists(path):
+                os.utime(path)
+                return path
+            os.makedirs(self.folder, exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(image_bytes)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Warning: could not archive upload: {e}")
+            return None
+        return path
+
+    def sweep(self) -> int:
+        """Delete expired archive entries, then the oldest while over the size limit; return the count."""
+        if not os.path.isdir(self.folder):
+            return 0
+        entries = []
+        for entry in os.scandir(self.folder):
+            if entry.is_file() and ARCHIVE_NAME.match(entry.name):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort()
+
+        cutoff = time.time() - self.retention_days * 86400
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for mtime, size, path in entries:
+            if mtime >= cutoff and total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        return removed
+
+    def start_sweeper(self, interval: float = SWEEP_INTERVAL_SECONDS):
+        """Sweep now and then every ``interval`` seconds on a daemon thread."""
+        if not self.enabled or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._sweep_loop, args=(interval,),
+                                        name='upload-sweeper', daemon=True)
+        self._thread.start()
+
+    def stop_sweeper(self):
+        self._stop.set()
+
+    def _sweep_loop(self, interval: float):
+        while not self._stop.is_set():
+            try:
+                removed = self.sweep()
+                if removed:
+                    print(f"Upload archive: removed {removed} expired image(s)")
+            except OSError as e:
+                print(f"Warning: upload archive sweep failed: {e}")
+            self._stop.wait(interval)
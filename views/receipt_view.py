@@ -4,70 +4,121 @@ View components for formatting and displaying receipt data.
 
 import csv
 
+from models.receipt_types import Receipt
+from models.metrics import metrics
+
 
 class ReceiptFormatter:
     """Handles formatting of receipt data for different output formats."""
     
-    def format_single_receipt_summary(self, receipt_data: dict) -> str:
+    def format_single_receipt_summary(self, receipt_data: Receipt) -> str:
         """Format a single receipt's data into a readable summary."""
         summary = f"""=== BUSINESS EXPENSE SUMMARY ===
 
-MERCHANT: {receipt_data.get('merchant', 'N/A')} | DATE: {receipt_data.get('date', 'N/A')} | LOCATION: {receipt_data.get('location', 'N/A')}
+MERCHANT: {receipt_data.merchant} | DATE: {receipt_data.date} | LOCATION: {receipt_data.location}
 
 LINE ITEMS:
 """
-        for item in receipt_data.get('line_items', []):
-            approval_note = f" [NEEDS APPROVAL: {item.get('approval_reason', 'Reason not specified')}]" if item.get('needs_approval') else ""
-            summary += f"• {item.get('item', 'N/A'):<40} | ${item.get('amount', '0.00'):>7} | {item.get('category', 'Uncategorized')} | Justification: {item.get('justification', 'N/A')}{approval_note}\n"
+        for item in receipt_data.line_items:
+            approval_note = f" [NEEDS APPROVAL: {item.approval_reason or 'Reason not specified'}]" if item.needs_approval else ""
+            summary += f"• {item.item:<40} | ${item.amount:>7} | {item.category} | Justification: {item.justification or 'N/A'}{approval_note}\n"
         
         summary += f"""
 TOTALS:
-Subtotal: ${receipt_data.get('subtotal', '0.00')}
-Tax:      ${receipt_data.get('tax', '0.00')}
-TOTAL:    ${receipt_data.get('receipt_total', '0.00')}
+Subtotal: ${receipt_data.subtotal}
+Tax:      ${receipt_data.tax}
+TOTAL:    ${receipt_data.receipt_total}
 
-RECEIPT QUALITY: {receipt_data.get('completeness_score', 'N/A')}
+RECEIPT QUALITY: {receipt_data.completeness_score}
 """
         
-        if receipt_data.get('flags'):
+        if receipt_data.flags:
             summary += "\nFLAGS:\n"
-            for flag in receipt_data['flags']:
+            for flag in receipt_data.flags:
                 summary += f"- {flag}\n"
         
         return summary
 
 
+class CSVSink:
+    """Appends receipt rows to a CSV file as each receipt finishes.
+
+    The file is created on the first write and flushed after every receipt,
+    so a partially completed run still leaves a usable CSV behind.
+    """
+    
+    def __init__(self, output_file: str, fieldnames: list[str]):
+        self.output_file = output_file
+        self.fieldnames = fieldnames
+        self.rows_written = 0
+        self._file = None
+        self._writer = None
+    
+    def open(self):
+        """Create the file and write the header, if not done already."""
+        if self._writer is None:
+            self._file = open(self.output_file, 'w', newline='', encoding='utf-8')
+            self._writer = csv.DictWriter(self._file, fieldnames=self.fieldnames)
+            self._writer.writeheader()
+    
+    def write_receipt(self, receipt: Receipt):
+        """Write one row per line item of ``receipt`` and flush it to disk."""
+        with metrics.stage('csv_write'):
+            self._write_rows(receipt)
+    
+    def _write_rows(self, receipt: Receipt):
+        self.open()
+        for item in receipt.line_items:
+            self._writer.writerow({
+                'Event': receipt.event_name,
+                'File Name': receipt.file_name,
+                'Merchant': receipt.merchant,
+                'Date': receipt.date,
+                'Location': receipt.location,
+                'Item': item.item,
+                'Amount': item.amount,
+                'Category': item.category,
+                'Justification': item.justification,
+                'Needs Approval': item.needs_approval,
+                'Approval Reason': item.approval_reason,
+                'Receipt Total': receipt.receipt_total
+            })
+            self.rows_written += 1
+        self._file.flush()
+    
+    def close(self):
+        """Close the underlying file, if it was opened."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            self._writer = None
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
 class CSVExporter:
     """Handles CSV export functionality."""
     
-    def export_to_csv(self, receipts_data: list[dict], output_file: str):
+    FIELDNAMES = [
+        'Event', 'File Name', 'Merchant', 'Date', 'Location', 
+        'Item', 'Amount', 'Category', 'Justification', 
+        'Needs Approval', 'Approval Reason', 'Receipt Total'
+    ]
+    
+    def open_sink(self, output_file: str) -> CSVSink:
+        """Open an incremental CSV writer for receipts as they are processed."""
+        return CSVSink(output_file, self.FIELDNAMES)
+    
+    def export_to_csv(self, receipts_data, output_file: str):
         """Export receipt data to CSV format."""
-        fieldnames = [
-            'Event', 'File Name', 'Merchant', 'Date', 'Location', 
-            'Item', 'Amount', 'Category', 'Justification', 
-            'Needs Approval', 'Approval Reason', 'Receipt Total'
-        ]
-        
-        with open(output_file, 'w', newline='', encoding='utf-8') as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            writer.writeheader()
-            
+        with self.open_sink(output_file) as sink:
+            sink.open()
             for receipt in receipts_data:
-                for item in receipt.get('line_items', []):
-                    writer.writerow({
-                        'Event': receipt.get('event_name', ''),
-                        'File Name': receipt.get('file_name', ''),
-                        'Merchant': receipt.get('merchant', ''),
-                        'Date': receipt.get('date', ''),
-                        'Location': receipt.get('location', ''),
-                        'Item': item.get('item', ''),
-                        'Amount': item.get('amount', ''),
-                        'Category': item.get('category', ''),
-                        'Justification': item.get('justification', ''),
-                        'Needs Approval': item.get('needs_approval', False),
-                        'Approval Reason': item.get('approval_reason', ''),
-                        'Receipt Total': receipt.get('receipt_total', '')
-                    })
+                sink.write_receipt(receipt)
 
 
 class FileHandler:
@@ -75,6 +126,6 @@ class FileHandler:
     
     def save_text_file(self, filename: str, content: str):
         """Save text content to a file."""
-        with open(filename, 'w', encoding='utf-8') as f:
+        with metrics.stage('report_write'), open(filename, 'w', encoding='utf-8') as f:
             f.write(content)
         print(f"Saved: {filename}")
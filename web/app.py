@@ -1,6 +1,10 @@
+import io
 import os
 import sys
-from flask import Flask, request, render_template, send_from_directory, redirect, url_for, jsonify, session
+import json
+import uuid
+import hashlib
+from flask import Flask, Request, Response, stream_with_context, request, render_template, send_from_directory, redirect, url_for, jsonify, session
 from werkzeug.utils import secure_filename
 from dotenv import load_dotenv
 
@@ -10,84 +14,133 @@ load_dotenv()
 # Add parent directory to sys.path for imports
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from controllers.receipt_controller import ReceiptController
+from controllers.job_queue import JobQueue
+from models.metrics import metrics
+from models.upload_archive import UploadArchive
 
 UPLOAD_FOLDER = os.path.join(os.path.dirname(__file__), 'uploads')
 RESULTS_FOLDER = os.path.join(os.path.dirname(__file__), 'results')
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'tiff', 'bmp'}
+# How many recent upload jobs a browser session can poll.
+MAX_SESSION_JOBS = 20
+# Upper bound on a whole upload request; larger bodies are rejected while they stream in.
+MAX_UPLOAD_SIZE = int(os.getenv('MAX_UPLOAD_SIZE', str(16 * 1024 * 1024)))
 
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(RESULTS_FOLDER, exist_ok=True)
 
+
+class InMemoryRequest(Request):
+    """Buffers uploaded files in memory instead of spilling them to temporary files.
+
+    Safe because ``MAX_CONTENT_LENGTH`` caps the request body: the form
+    parser stops reading and answers 413 as soon as it is exceeded.
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return io.BytesIO()
+
+
 app = Flask(__name__)
+app.request_class = InMemoryRequest
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['RESULTS_FOLDER'] = RESULTS_FOLDER
-app.secret_key = 'receipt_processor_secret_key_2025'  # For session management
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_SIZE
+# For session management; every worker process behind a load balancer must share the same key
+app.secret_key = os.getenv('FLASK_SECRET_KEY', 'receipt_processor_secret_key_2025')
 
-# Initialize controller
+# Initialize controller and the background worker pool for uploads
 controller = ReceiptController()
+job_queue = JobQueue(controller, RESULTS_FOLDER)
+# Uploads are kept, under their content hash, only while RECEIPT_UPLOAD_RETENTION_DAYS allows.
+upload_archive = UploadArchive(UPLOAD_FOLDER)
+upload_archive.start_sweeper()
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def session_id():
+    """Return the caller's session ID, which keys their receipt in the context store."""
+    if 'session_id' not in session:
+        session['session_id'] = uuid.uuid4().hex
+    return session['session_id']
+
 @app.route('/', methods=['GET', 'POST'])
 def upload_file():
     if request.method == 'POST':
-        print("POST request received")
-        print("Files in request:", request.files)
+        files = [f for f in request.files.getlist('file') if f and f.filename]
+        if not files:
+            return upload_error('No file selected')
         
-        if 'file' not in request.files:
-            print("No file part in request")
-            return render_template('index.html', error='No file part')
+        invalid = [f.filename for f in files if not allowed_file(f.filename)]
+        if invalid:
+            return upload_error('Invalid file type. Supported formats: PNG, JPG, JPEG, TIFF, BMP')
         
-        file = request.files['file']
-        print(f"File object: {file}")
-        print(f"Filename: '{file.filename}'")
+        # Images go to the extractor straight from memory. Each is named by its
+        # content hash, so uploads with the same file name never collide.
+        uploads = []
+        for file in files:
+            image_bytes = file.read()
+            content_hash = hashlib.sha256(image_bytes).hexdigest()
+            name = secure_filename(file.filename) or 'receipt'
+            upload_archive.store(image_bytes, content_hash, name.rsplit('.', 1)[-1])
+            uploads.append((os.path.join('uploads', content_hash[:12], name), image_bytes))
         
-        if file.filename == '':
-            print("Empty filename")
-            return render_template('index.html', error='No file selected')
+        job_id = job_queue.submit(uploads, session_id())
+        session['jobs'] = (session.get('jobs', []) + [job_id])[-MAX_SESSION_JOBS:]
+        print(f"Queued job {job_id} with {len(uploads)} file(s)")
         
-        if file and allowed_file(file.filename):
-            filename = secure_filename(file.filename)
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            print(f"Saving file to: {filepath}")
-            file.save(filepath)
-            
-            try:
-                # Process receipt
-                print("Processing receipt...")
-                receipt_data = controller.process_single_receipt(filepath)
-                print(f"Receipt data: {receipt_data}")
-                
-                if not receipt_data:
-                    return render_template('index.html', error='Could not process receipt - check API key')
-                
-                # Load receipt data for RAG questions
-                controller.load_receipt_for_questions(receipt_data)
-                session['has_receipt'] = True
-                
-                summary = controller.format_single_receipt_summary(receipt_data)
-                result_filename = filename.rsplit('.', 1)[0] + '_summary.txt'
-                result_path = os.path.join(app.config['RESULTS_FOLDER'], result_filename)
-                controller.save_text_file(result_path, summary)
-                
-                # Get suggested questions
-                suggested_questions = controller.get_suggested_questions()
-                
-                return render_template('index.html', 
-                                     summary=summary, 
-                                     download_link=url_for('download_file', filename=result_filename),
-                                     suggested_questions=suggested_questions,
-                                     show_chat=True)
-            except Exception as e:
-                print(f"Error processing receipt: {e}")
-                return render_template('index.html', error=f'Error processing receipt: {str(e)}')
-        else:
-            print("Invalid file type")
-            return render_template('index.html', error='Invalid file type. Supported formats: PNG, JPG, JPEG, TIFF, BMP')
+        if wants_json():
+            return jsonify({'job_id': job_id, 'status_url': url_for('job_status', job_id=job_id)}), 202
+        return render_template('index.html', job_id=job_id)
     
     return render_template('index.html')
 
+def wants_json():
+    return request.accept_mimetypes.best == 'application/json'
+
+def upload_error(message, status=400):
+    if wants_json():
+        return jsonify({'error': message}), status
+    return render_template('index.html', error=message)
+
+@app.errorhandler(413)
+def upload_too_large(error):
+    return upload_error(f'Upload too large. The limit is {MAX_UPLOAD_SIZE / (1024 * 1024):.3g} MB per upload.', 413)
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Report the status of an upload job and the summaries of its finished files."""
+    if job_id not in session.get('jobs', []):
+        return jsonify({'error': 'Unknown job.'}), 404
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job.'}), 404
+    
+    response = {
+        'job_id': job_id,
+        'status': job['status'],
+        'files': [
+            {
+                'file_name': entry['file_name'],
+                'status': entry['status'],
+                'summary': entry['summary'],
+                'error': entry['error'],
+                'download_link': (url_for('download_file', filename=entry['result_filename'])
+                                  if entry['result_filename'] else None),
+            }
+            for entry in job['files']
+        ],
+    }
+    
+    if job['status'] == 'done' and job['chat_file']:
+        # The worker that ran the job loaded its first receipt for RAG questions when it finished.
+        if session.get('chat_job') != job_id:
+            session['chat_job'] = job_id
+            session['has_receipt'] = True
+        response['chat_file'] = job['chat_file']
+        response['suggested_questions'] = controller.get_suggested_questions(session_id())
+    return jsonify(response)
+
 @app.route('/results/<filename>')
 def download_file(filename):
     return send_from_directory(app.config['RESULTS_FOLDER'], filename, as_attachment=True)
@@ -104,12 +157,27 @@ def ask_question():
     if not question:
         return jsonify({'error': 'Please enter a question.'})
     
+    if data.get('stream'):
+        pieces = controller.ask_receipt_question_stream(session_id(), question)
+        return Response(stream_with_context(answer_events(pieces)), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    
     try:
-        answer = controller.ask_receipt_question(question)
+        answer = controller.ask_receipt_question(session_id(), question)
         return jsonify({'answer': answer})
     except Exception as e:
         return jsonify({'error': f'Error processing question: {str(e)}'})
 
+def answer_events(pieces):
+    """Send answer pieces as Server-Sent Events, ending with a ``done`` or ``error`` event."""
+    try:
+        for piece in pieces:
+            yield f"data: {json.dumps({'chunk': piece})}\n\n"
+    except Exception as e:
+        yield f"event: error\ndata: {json.dumps({'error': f'Error processing question: {str(e)}'})}\n\n"
+        return
+    yield "event: done\ndata: {}\n\n"
+
 @app.route('/suggested_questions')
 def get_suggested_questions():
     """Get suggested questions for the current receipt."""
@@ -117,10 +185,15 @@ def get_suggested_questions():
         return jsonify({'questions': []})
     
     try:
-        questions = controller.get_suggested_questions()
+        questions = controller.get_suggested_questions(session_id())
         return jsonify({'questions': questions})
     except Exception as e:
         return jsonify({'questions': [], 'error': str(e)})
 
+@app.route('/metrics')
+def metrics_endpoint():
+    """Expose pipeline latencies, byte and token counts and error counters for Prometheus."""
+    return Response(metrics.prometheus_text(), mimetype='text/plain; version=0.0.4')
+
 if __name__ == '__main__':
     app.run(debug=True, port=5002)